@@ -0,0 +1,138 @@
+"""
+Latency and CPU use of BiLSTM forecasting under concurrent load, for the
+current runtime profile against the previous eager model.predict path.
+
+Each configuration runs in its own process, because TensorFlow's thread
+pools can only be sized before the first op:
+
+    python benchmark_bilstm_runtime.py --clients 8 --requests 400 --xgboost-load
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+# Same files as services/ml_service.py (not imported: it loads every model at import)
+BILSTM_MODEL_PATH = os.path.join(MODELS_DIR, "bilstm_bulb_forecasting.h5")
+BILSTM_SCALER_PATH = os.path.join(MODELS_DIR, "bilstm_scaler.pkl")
+XGBOOST_MODEL_PATH = os.path.join(MODELS_DIR, "nilm_xgboost_model.pkl")
+
+CONFIGS = {
+    # Previous behavior: TF default thread pools, eager model.predict per call
+    "baseline": {"TF_INTRA_OP_THREADS": "0", "TF_INTER_OP_THREADS": "0", "RUNTIME": "eager"},
+    "compiled": {"TF_INTRA_OP_THREADS": "1", "TF_INTER_OP_THREADS": "1", "BILSTM_XLA": "0",
+                 "BILSTM_PRECISION": "float32", "RUNTIME": "compiled"},
+    "xla_float32": {"TF_INTRA_OP_THREADS": "1", "TF_INTER_OP_THREADS": "1", "BILSTM_XLA": "1",
+                    "BILSTM_PRECISION": "float32", "RUNTIME": "compiled"},
+    "xla_bfloat16": {"TF_INTRA_OP_THREADS": "1", "TF_INTER_OP_THREADS": "1", "BILSTM_XLA": "1",
+                     "BILSTM_PRECISION": "bfloat16", "RUNTIME": "compiled"},
+    "xla_float16": {"TF_INTRA_OP_THREADS": "1", "TF_INTER_OP_THREADS": "1", "BILSTM_XLA": "1",
+                    "BILSTM_PRECISION": "float16", "RUNTIME": "compiled"},
+}
+
+
+def _worker(clients: int, requests: int, xgboost_load: bool) -> dict:
+    import numpy as np
+    import joblib
+    from services.tf_runtime import BiLSTMRuntime, configure_threads, thread_settings
+
+    configure_threads()
+    import tensorflow as tf
+    model = tf.keras.models.load_model(BILSTM_MODEL_PATH,
+                                       custom_objects={'mse': tf.keras.losses.MeanSquaredError()})
+    scaler = joblib.load(BILSTM_SCALER_PATH)
+
+    runtime = None
+    if os.environ["RUNTIME"] == "compiled":
+        runtime = BiLSTMRuntime(model)
+        runtime.warmup()
+        predict = runtime.predict
+    else:
+        model.predict(np.zeros((1, 20, 6)), verbose=0)
+        predict = lambda x: model.predict(x, verbose=0)
+
+    # Same preprocessing as MLService.predict_energy
+    rng = np.random.default_rng(0)
+    samples = []
+    for _ in range(64):
+        features = np.array([[rng.uniform(0.0, 0.2), rng.uniform(0, 34), rng.uniform(220, 240),
+                              rng.uniform(0.8, 1.0), rng.integers(0, 24), rng.integers(0, 2)]])
+        samples.append(np.repeat(scaler.transform(features)[:, np.newaxis, :], 20, axis=1))
+
+    # Competing identification traffic on the same cores
+    stop = threading.Event()
+    xgb_calls = [0]
+    xgb = joblib.load(XGBOOST_MODEL_PATH) if xgboost_load else None
+    def _xgboost_traffic():
+        sample = np.array([[0.055, 12.0, 230.0, 1.0, 0.0, 3.0, 0.95]])
+        while not stop.is_set():
+            xgb.predict(sample)
+            xgb_calls[0] += 1
+    if xgboost_load:
+        threading.Thread(target=_xgboost_traffic, daemon=True).start()
+        while xgb_calls[0] == 0:
+            time.sleep(0.01)
+
+    latencies = []
+    def _call(i):
+        t0 = time.perf_counter()
+        predict(samples[i % len(samples)])
+        latencies.append(time.perf_counter() - t0)
+
+    xgb_calls[0] = 0
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(_call, range(requests)))
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    stop.set()
+
+    lat_ms = np.array(latencies) * 1000.0
+    return {
+        "threads": thread_settings(),
+        "warmup_seconds": runtime.warmup_seconds if runtime else None,
+        "requests_per_second": requests / wall,
+        "latency_ms_p50": float(np.percentile(lat_ms, 50)),
+        "latency_ms_p95": float(np.percentile(lat_ms, 95)),
+        "latency_ms_p99": float(np.percentile(lat_ms, 99)),
+        "cpu_seconds_per_request": cpu / requests,
+        "cpu_cores_used": cpu / wall,
+        "xgboost_calls_per_second": xgb_calls[0] / wall if xgboost_load else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BiLSTM inference runtime profiles.")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent callers")
+    parser.add_argument("--requests", type=int, default=200, help="Forecasts per configuration")
+    parser.add_argument("--xgboost-load", action="store_true", help="Run XGBoost predictions alongside")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help="Comma-separated configurations")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(_worker(args.clients, args.requests, args.xgboost_load)))
+        return
+
+    report = {}
+    for name in args.configs.split(","):
+        env = {**os.environ, **CONFIGS[name], "TF_CPP_MIN_LOG_LEVEL": "3"}
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", name,
+               "--clients", str(args.clients), "--requests", str(args.requests)]
+        if args.xgboost_load:
+            cmd.append("--xgboost-load")
+        result = subprocess.run(cmd, env=env, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        lines = [l for l in result.stdout.splitlines() if l.startswith("{")]
+        report[name] = json.loads(lines[-1]) if lines else {"error": result.stderr.strip()[-500:]}
+        print(f"{name}: {json.dumps(report[name])}", file=sys.stderr)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Agreement and latency of the signature identification engine against the
+XGBoost model, per reading (as identify_device runs it) and batched (as
+identify_batch runs it), over recorded readings:
+
+    python benchmark_signature_engine.py recording.json --learn
+
+Without a recording, readings are drawn from the per-state statistics in
+models/kmeans_behavior_results.csv. With --learn the signatures are first
+learned from the XGBoost decisions on the first half of the readings and the
+second half is replayed.
+"""
+import json
+import time
+import argparse
+import contextlib
+import io
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from services.data_sources import load_recorded_streams
+from services.timestamps import timestamp_key
+from services.ml_service import ml_service_instance, identification_feature_matrix, KMEANS_BEHAVIOR_RESULTS_PATH
+
+
+def state_stream(n: int, interval: float = 2.0, hold: int = 30, seed: int = 0):
+    """
+    Recorded-like readings: a bulb state of the behavior clustering results held
+    for `hold` readings, with that state's Power/Vrms/Irms spread.
+    """
+    states = pd.read_csv(KMEANS_BEHAVIOR_RESULTS_PATH)
+    rng = np.random.default_rng(seed)
+    t = datetime(2026, 1, 1, 18, 0, 0)
+    kwh = 1.0
+    readings = []
+    for i in range(n):
+        if i % hold == 0:
+            state = states.iloc[rng.integers(len(states))]
+        power = max(rng.normal(state.avg_power, state.std_power), 0.1)
+        kwh += power * interval / 3600.0 / 1000.0
+        readings.append({
+            'Irms': abs(rng.normal(state.avg_current, state.std_current)),
+            'Power': power,
+            'Vrms': rng.normal(state.avg_voltage, state.std_voltage),
+            'kWh': kwh,
+            'timestamp': timestamp_key(t),
+        })
+        t += timedelta(seconds=interval)
+    return readings
+
+
+def _features(readings) -> np.ndarray:
+    power = np.array([r['Power'] for r in readings])
+    return identification_feature_matrix(
+        np.array([r['Irms'] for r in readings]), power, np.array([r['Vrms'] for r in readings]),
+        np.array([r['kWh'] for r in readings]), np.concatenate([power[:1], power[:-1]]))
+
+
+def _batched(readings) -> dict:
+    features = _features(readings)
+    engines = ml_service_instance.engine_selector.engines
+    t0 = time.perf_counter()
+    reference = engines["xgboost"].predict_matrix(features)
+    xgb_ms = (time.perf_counter() - t0) * 1000.0
+    t0 = time.perf_counter()
+    bits = engines["signature"].predict_matrix(features)
+    sig_ms = (time.perf_counter() - t0) * 1000.0
+    return {"readings": len(readings), "xgboost_ms": xgb_ms, "signature_ms": sig_ms,
+            "agreement": float(np.mean(np.all(bits == reference, axis=1)))}
+
+
+def run_benchmark(readings, learn: bool = False) -> dict:
+    """
+    Replay readings through the XGBoost and signature engines and report agreement,
+    latency and how often the signature engine fell back to XGBoost.
+    """
+    engine = ml_service_instance.signature_engine
+    report = {}
+    if learn:
+        half = len(readings) // 2
+        report["learned"] = ml_service_instance.learn_signatures(readings[:half])["learned"]
+        readings = readings[half:]
+
+    # XGBoost's decisions stand in for labels, so "accuracy" is agreement with XGBoost
+    selector = ml_service_instance.engine_selector
+    reference = [selector.engines["xgboost"].predict_offline(readings[max(0, i - 6):i + 1]).reshape(-1).tolist()
+                 for i in range(len(readings))]
+    previous = (selector.accurate, selector.cheap, selector.results)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = ml_service_instance.benchmark_engines(readings, labels=reference)
+    finally:
+        selector.accurate, selector.cheap, selector.results = previous
+    per_reading = {name: result["engines"][name] for name in ("xgboost", "signature")}
+    per_reading["signature"]["fallback_rate"] = float(engine.lookup(_features(readings))[1].mean())
+    report["signature_source"] = engine.source
+    report["per_reading"] = per_reading
+    report["batched"] = _batched(readings)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the signature NILM engine against XGBoost.")
+    parser.add_argument("recording", nargs="?", help="JSON/CSV recording (omit for readings drawn from the clustering results)")
+    parser.add_argument("--synthetic", type=int, default=2000, help="Number of drawn readings without a recording")
+    parser.add_argument("--learn", action="store_true", help="Learn signatures from the first half of the readings")
+    args = parser.parse_args()
+
+    if args.recording:
+        readings = [r for stream in load_recorded_streams(args.recording).values() for r in stream]
+    else:
+        readings = state_stream(args.synthetic)
+    print(json.dumps(run_benchmark(readings, learn=args.learn), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Minimal local stand-in for the Firebase RTDB REST API, for offline runs and tests.
+
+Supports GET (orderBy="$key" with limitToFirst / limitToLast / startAt / endAt, and shallow),
+PUT, PATCH, POST and DELETE on /<path>.json, and ETags via X-Firebase-ETag with
+if-match conditional writes (412 on mismatch). Data lives in memory.
+
+Usage:
+    python local_rtdb_server.py --port 9000 --seed recording.json
+    RTDB_REST_URL=http://127.0.0.1:9000 uvicorn main:app
+"""
+import sys
+import json
+import uuid
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class _Tree:
+    def __init__(self, data=None):
+        self.root = data if isinstance(data, dict) else {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _parts(path: str):
+        return [p for p in path.strip("/").split("/") if p]
+
+    def get(self, path: str):
+        node = self.root
+        for part in self._parts(path):
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def set(self, path: str, value):
+        parts = self._parts(path)
+        if not parts:
+            self.root = value if isinstance(value, dict) else {}
+            return
+        node = self.root
+        for part in parts[:-1]:
+            if not isinstance(node.get(part), dict):
+                node[part] = {}
+            node = node[part]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+
+def _etag(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def _query(value, params: dict):
+    if params.get("shallow") is True and isinstance(value, dict):
+        return {k: v if not isinstance(v, dict) else True for k, v in value.items()}
+    if not isinstance(value, dict) or "orderBy" not in params:
+        return value
+    keys = sorted(value)
+    if "startAt" in params:
+        keys = [k for k in keys if k >= params["startAt"]]
+    if "endAt" in params:
+        keys = [k for k in keys if k <= params["endAt"]]
+    if "limitToFirst" in params:
+        keys = keys[:int(params["limitToFirst"])]
+    if "limitToLast" in params:
+        keys = keys[-int(params["limitToLast"]):] if int(params["limitToLast"]) else []
+    return {k: value[k] for k in keys}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients going away mid-request (e.g. a killed node) are not server errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _make_handler(tree: _Tree):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections
+
+        def log_message(self, *args):
+            pass
+
+        def _path(self):
+            url = urlparse(self.path)
+            path = url.path[:-5] if url.path.endswith(".json") else url.path
+            params = {}
+            for k, v in parse_qs(url.query).items():
+                try:
+                    params[k] = json.loads(v[0])
+                except ValueError:
+                    params[k] = v[0]
+            return path, params
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length)) if length else None
+
+        def _send(self, status: int, value, etag: str = None):
+            payload = json.dumps(value).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            path, params = self._path()
+            with tree.lock:
+                value = _query(tree.get(path), params)
+            etag = _etag(value) if self.headers.get("X-Firebase-ETag") else None
+            if etag is not None and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send(200, value, etag)
+
+        def do_PUT(self):
+            path, _ = self._path()
+            value = self._body()
+            with tree.lock:
+                if_match = self.headers.get("if-match")
+                if if_match is not None:
+                    current = tree.get(path)
+                    if _etag(current) != if_match:
+                        self._send(412, current, _etag(current))
+                        return
+                tree.set(path, value)
+            self._send(200, value, _etag(value) if self.headers.get("X-Firebase-ETag") else None)
+
+        def do_PATCH(self):
+            path, _ = self._path()
+            updates = self._body() or {}
+            with tree.lock:
+                for key, value in updates.items():
+                    tree.set(f"{path}/{key}", value)
+            self._send(200, updates)
+
+        def do_POST(self):
+            path, _ = self._path()
+            value = self._body()
+            name = "-" + uuid.uuid4().hex[:19]
+            with tree.lock:
+                tree.set(f"{path}/{name}", value)
+            self._send(200, {"name": name})
+
+        def do_DELETE(self):
+            path, _ = self._path()
+            with tree.lock:
+                tree.set(path, None)
+            self._send(200, None)
+
+    return Handler
+
+
+def start_local_rtdb(port: int = 0, data=None, host: str = "127.0.0.1"):
+    """
+    Start the stand-in on a background thread. Returns (server, base_url);
+    call server.shutdown() to stop it. port=0 picks a free port.
+    """
+    server = _Server((host, port), _make_handler(_Tree(data)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local RTDB REST stand-in")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--seed", help="JSON file loaded as the database root")
+    args = parser.parse_args()
+
+    seed = None
+    if args.seed:
+        with open(args.seed) as f:
+            seed = json.load(f)
+    server = _Server(("127.0.0.1", args.port), _make_handler(_Tree(seed)))
+    print(f"Local RTDB listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -1,15 +1,36 @@
-from fastapi import FastAPI, HTTPException, Body, Query
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
 import os
 import sys
+from typing import Optional
 
 # Ensure backend directory is in path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from models_schemas import DeviceIdentificationRequest, PredictionRequest, Alert
-from services.firebase_service import get_realtime_data, add_alert, update_device_status, get_firestore_devices, acknowledge_alert, get_recent_readings
+from models_schemas import DeviceIdentificationRequest, PredictionRequest, EngineBenchmarkRequest, Alert
+from services.firebase_service import add_alert, update_device_status, get_firestore_devices, acknowledge_alert, get_recent_readings, devices_cache
+from services.read_cache import etag_matches
 from services.ml_service import ml_service_instance
+from services.behavior_service import behavior_service_instance
+from services.energy_service import energy_service_instance
+from services.alert_service import alert_service_instance
+from services.rtdb_client import rtdb_rest_client
+from services.rate_controller import rate_controller_instance
+from services.ingest_service import ingest_service_instance
+from services.ingest_codec import CONTENT_TYPE as READINGS_CONTENT_TYPE
+from services.profiler import sampling_profiler_instance, pipeline_tracer_instance
+from services.data_quality import data_quality_instance
+from services.baseline_service import baseline_service_instance
+from services.shard_service import ShardCoordinator, SHARD_NODE_ID
+from services.outbox import outbox_instance
+from services.snapshot_service import snapshot_service_instance
+from services.forecast_service import forecast_service_instance
+from services.sweep_service import anomaly_sweep_instance
+from realtime_processor import RealtimeProcessor, ProcessorStates
 
 app = FastAPI(title="Smart Energy Meter Backend")
 
@@ -20,21 +41,145 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],  # read by the frontend for If-None-Match polling
 )
 
+# Comma-separated Firebase UIDs to process in this API process, so that
+# stream-derived state (behavior profiles, ...) is served by the endpoints below.
+REALTIME_USER_IDS = [u.strip() for u in os.getenv("REALTIME_USER_IDS", "").split(",") if u.strip()]
+realtime_processors = {}
+# With SHARD_NODE_ID set, REALTIME_USER_IDS is the whole fleet and each node
+# only processes the users it holds a lease for.
+shard_coordinator = None
+
+# Per-user pipeline state is snapshotted periodically and restored at startup
+processor_states = ProcessorStates(realtime_processors)
+for name, component in (("ml", ml_service_instance), ("change_detector", ml_service_instance.change_detector),
+                        ("rate_control", rate_controller_instance), ("data_quality", data_quality_instance),
+                        ("baselines", baseline_service_instance), ("alerts", alert_service_instance),
+                        ("signatures", ml_service_instance.signature_engine),
+                        ("energy", energy_service_instance), ("behavior", behavior_service_instance),
+                        ("processors", processor_states)):
+    snapshot_service_instance.register(name, component)
+
+# Forecasts are materialized for the users processed here (plus recent requesters)
+forecast_service_instance.active_users = lambda: list(realtime_processors)
+# The anomaly sweep covers the whole fleet, not just this node's share
+anomaly_sweep_instance.known_users = lambda: REALTIME_USER_IDS + list(realtime_processors)
+
+# Admin endpoints require it in the X-Admin-Token header; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def _check_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.on_event("startup")
+async def start_realtime_processors():
+    global shard_coordinator
+    # kill -USR1 <pid> writes a sampling profile of the API process
+    sampling_profiler_instance.install_signal_handler()
+    # Queue the writes a previous run left unacknowledged before new ones arrive
+    outbox_instance.open()
+    snapshot_service_instance.restore()
+    snapshot_service_instance.start()
+    forecast_service_instance.load()
+    forecast_service_instance.start()
+    anomaly_sweep_instance.start()
+    # Behavior buckets close on their own clock, also for /ingest-only deployments
+    behavior_service_instance.start()
+    if SHARD_NODE_ID:
+        shard_coordinator = ShardCoordinator(SHARD_NODE_ID, REALTIME_USER_IDS,
+                                             on_acquire=_start_processor, on_release=_stop_processor)
+        shard_coordinator.start()
+        return
+    for user_id in REALTIME_USER_IDS:
+        _start_processor(user_id)
+
+def _start_processor(user_id: str):
+    processor = RealtimeProcessor(user_id)
+    try:
+        processor.start()
+        processor_states.apply(processor)
+        realtime_processors[user_id] = processor
+    except Exception as e:
+        print(f"Failed to start RealtimeProcessor for {user_id}: {e}")
+
+def _stop_processor(user_id: str):
+    processor = realtime_processors.pop(user_id, None)
+    if processor:
+        processor.stop()
+
+@app.on_event("shutdown")
+async def stop_realtime_processors():
+    if shard_coordinator:
+        shard_coordinator.stop()
+    for processor in realtime_processors.values():
+        processor.stop()
+    forecast_service_instance.stop()
+    anomaly_sweep_instance.stop()
+    behavior_service_instance.stop()
+    snapshot_service_instance.stop()
+    outbox_instance.close()
+    rtdb_rest_client.close()
+
 @app.get("/")
 async def root():
     return {"message": "Smart Energy Meter API is running"}
 
+def _forecast_response(entry: dict) -> dict:
+    return {
+        "predicted_energy": entry["next_hour"],
+        "next_day": entry["next_day"],
+        "hourly": entry["hourly"],
+        "computed_at": entry["computed_at"],
+        "age_seconds": entry["age_seconds"],
+        "reading_timestamp": entry["reading_timestamp"],
+        "materialized": entry.get("materialized", True),
+    }
+
 @app.post("/predict/energy")
 async def predict_energy_usage(request: PredictionRequest):
+    """
+    With a user_id, the user's materialized forecast is returned while it is
+    fresh. Otherwise the BiLSTM runs live on the given features (or, without
+    features, on the user's latest reading).
+    """
     try:
-        # We might want to fetch recent data from Firebase if not provided, 
-        # but here we use request body.
-        result = ml_service_instance.predict_energy(request.features)
-        return {"predicted_energy": result}
+        if request.user_id:
+            forecast_service_instance.touch(request.user_id)
+            entry = forecast_service_instance.get(request.user_id)
+            if entry is not None:
+                return _forecast_response(entry)
+        if request.features:
+            result = await run_in_threadpool(ml_service_instance.predict_energy, request.features)
+            return {"predicted_energy": result, "materialized": False}
+        if not request.user_id:
+            raise HTTPException(status_code=422, detail="Either features or user_id is required")
+        entry = await run_in_threadpool(forecast_service_instance.forecast, request.user_id)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No valid readings to forecast from")
+    return _forecast_response(entry)
+
+@app.get("/forecast/{user_id}")
+async def get_forecast(user_id: str):
+    """
+    Next-hour and next-day forecast of a user: the materialized one while fresh,
+    else computed live from the latest reading.
+    """
+    try:
+        entry = await run_in_threadpool(forecast_service_instance.forecast, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Forecast failed: {str(e)}")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No valid readings to forecast from")
+    return _forecast_response(entry)
 
 @app.post("/identify/device")
 async def identify_device(request: DeviceIdentificationRequest):
@@ -42,31 +187,92 @@ async def identify_device(request: DeviceIdentificationRequest):
         result = ml_service_instance.identify_device(request.power_readings)
         # Result logic might need mapping to "Bulb 1", "Bulb 2", etc.
         # Assuming model returns label encoding or specific ID.
-        return {"identified_device": result}
+        return {"identified_device": result, **ml_service_instance.decision_source()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Identification failed: {str(e)}")
 
+def _cached_response(request: Request, peek_etag, get, error_detail: str):
+    """
+    Serve a cached Firebase read with an ETag. peek_etag() returns the ETag of a
+    fresh cache entry (or None) and get() returns (body, etag), reading on a miss.
+    A matching If-None-Match on a fresh entry returns 304 without reading Firebase.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    etag = peek_etag()
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    body, etag = get()
+    if body is None:
+        raise HTTPException(status_code=502, detail=error_detail)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(content=jsonable_encoder(body), headers={"ETag": etag})
+
 @app.get("/alerts")
-async def get_alerts():
-    data = get_realtime_data("/alerts")
-    return {"alerts": data}
+async def get_alerts(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500, description="Alerts per page"),
+    before: str = Query(None, description="Cursor: next_cursor of the previous page"),
+    unread: bool = Query(None, description="Only unread (true) or only read (false) alerts"),
+    severity: str = Query(None, pattern="^(low|medium|high)$")
+):
+    """
+    One page of alerts keyed by push key, newest first, plus next_cursor for the
+    following page. Pages are read with order_by_key()/end_at/limit_to_last and
+    cached briefly; supports If-None-Match.
+    """
+    return _cached_response(
+        request,
+        lambda: alert_service_instance.peek_page_etag(limit, before, unread, severity),
+        lambda: alert_service_instance.get_page(limit, before, unread, severity),
+        "Failed to fetch alerts"
+    )
+
+@app.get("/alerts/unread-count")
+async def get_unread_alert_count(request: Request):
+    """
+    Number of unread alerts from the maintained counter (no scan of /alerts).
+    """
+    return _cached_response(request, alert_service_instance.peek_unread_etag,
+                            alert_service_instance.unread_count, "Failed to read unread alert count")
 
 @app.post("/alerts")
 async def create_alert(alert: Alert):
     add_alert(alert.dict())
+    alert_service_instance.invalidate_cache()
     return {"message": "Alert added successfully"}
 
 @app.put("/alerts/{alert_id}/acknowledge")
 async def acknowledge_alert_endpoint(alert_id: str):
     success = acknowledge_alert(alert_id)
+    if success is None:
+        raise HTTPException(status_code=404, detail=f"Alert {alert_id} not found")
     if not success:
         raise HTTPException(status_code=500, detail="Failed to acknowledge alert")
+    alert_service_instance.invalidate_cache()
     return {"message": "Alert acknowledged"}
 
 @app.get("/devices")
-async def get_devices():
-    data = get_firestore_devices()
-    return {"devices": data}
+async def get_devices(
+    request: Request,
+    limit: int = Query(None, ge=1, le=500, description="Devices per page (all devices if omitted)"),
+    after: str = Query(None, description="Cursor: next_cursor of the previous page")
+):
+    """
+    Devices keyed by Firestore document id, optionally paged by document id.
+    Cached briefly; supports If-None-Match.
+    """
+    def _load():
+        devices = get_firestore_devices(limit=limit, after=after)
+        if devices is None:
+            return None
+        next_cursor = next(reversed(devices)) if limit is not None and len(devices) == limit else None
+        return {"devices": devices, "next_cursor": next_cursor}
+
+    key = ("devices", limit, after)
+    return _cached_response(request, lambda: devices_cache.peek_etag(key),
+                            lambda: devices_cache.get(key, _load), "Failed to fetch devices")
 
 @app.post("/trigger-identification")
 async def trigger_ident(user_id: str = Query(..., description="Firebase UID of the logged-in user")):
@@ -75,20 +281,23 @@ async def trigger_ident(user_id: str = Query(..., description="Firebase UID of t
     user_id must be passed by the frontend (the logged-in Firebase UID).
     """
     try:
-        # 1. Fetch recent readings from Firebase (objects with timestamps)
-        readings = get_recent_readings(user_id, limit=7)
-        
-        if len(readings) < 1:
-            return {"message": "No data found to run identification."}
-            
-        # 2. Run inference (this handles freshness and updates Firebase status)
-        result = ml_service_instance.identify_device(readings)
+        with pipeline_tracer_instance.event("trigger_identification", user_id):
+            # 1. Fetch recent readings from Firebase (objects with timestamps)
+            with pipeline_tracer_instance.stage("fetch"):
+                readings = get_recent_readings(user_id, limit=7)
+
+            if len(readings) < 1:
+                return {"message": "No data found to run identification."}
+
+            # 2. Run inference (this handles freshness and updates Firebase status)
+            result = ml_service_instance.identify_device(readings, user_id=user_id)
         
         # 3. Return result
         return {
             "user_id": user_id,
             "readings_used": readings,
-            "identified_device_states": result
+            "identified_device_states": result,
+            **ml_service_instance.decision_source(user_id)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Identification trigger failed: {str(e)}")
@@ -101,24 +310,238 @@ async def detect_anomaly(user_id: str = Query(..., description="Firebase UID of
     user_id must be passed by the frontend (the logged-in Firebase UID).
     """
     try:
-        # 1. Fetch recent readings (at least 10-20 for rolling stats)
-        readings = get_recent_readings(user_id, limit=20)
-        
-        if len(readings) < 1:
-            return {"message": "No data found to run anomaly detection."}
-            
-        # 2. Run anomaly detection
-        result = ml_service_instance.detect_anomaly(readings)
+        with pipeline_tracer_instance.event("detect_anomaly", user_id):
+            # 1. Fetch recent readings (at least 10-20 for rolling stats)
+            with pipeline_tracer_instance.stage("fetch"):
+                readings = get_recent_readings(user_id, limit=20)
+
+            if len(readings) < 1:
+                return {"message": "No data found to run anomaly detection."}
+
+            # 2. Run anomaly detection
+            result = ml_service_instance.detect_anomaly(readings, user_id=user_id)
         
         # 3. Return result
         return {
             "user_id": user_id,
             "readings_count": len(readings),
-            "anomaly_result": result
+            "anomaly_result": result,
+            "model_version": ml_service_instance.model_version("anomaly")
         }
     except Exception as e:
         print(f"Anomaly detection trigger failed: {e}")
         raise HTTPException(status_code=500, detail=f"Anomaly detection failed: {str(e)}")
 
+@app.post("/ingest/readings")
+async def ingest_readings(request: Request):
+    """
+    Bulk upload of readings from many meters in the columnar binary format of
+    services/ingest_codec.py (Content-Type: application/x-sem-readings).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in (READINGS_CONTENT_TYPE, "application/octet-stream"):
+        raise HTTPException(status_code=415, detail=f"Expected {READINGS_CONTENT_TYPE}")
+    payload = await request.body()
+    try:
+        return await run_in_threadpool(ingest_service_instance.ingest, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid readings payload: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ingest failed: {str(e)}")
+
+@app.post("/identify/engines/benchmark")
+async def benchmark_identification_engines(
+    request: Request,
+    user_id: str = Query(..., description="Firebase UID whose recent readings are replayed"),
+    limit: int = Query(200, ge=10, le=5000, description="Number of held-out readings to replay"),
+    body: Optional[EngineBenchmarkRequest] = None
+):
+    """
+    Replay a user's recent readings through every identification engine and report
+    each engine's latency. With labels (true bits per reading, oldest first) also
+    report accuracy and let the selector pick the accurate and cheap engines.
+    """
+    _check_admin(request)
+    readings = await run_in_threadpool(get_recent_readings, user_id, limit=limit)
+    if len(readings) < 2:
+        raise HTTPException(status_code=404, detail="Not enough readings to benchmark")
+    labels = body.labels if body else None
+    try:
+        return await run_in_threadpool(ml_service_instance.benchmark_engines, readings, labels=labels)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/identify/engines/signatures/learn")
+async def learn_identification_signatures(
+    request: Request,
+    user_id: str = Query(..., description="Firebase UID whose recent readings are learned from"),
+    limit: int = Query(1000, ge=10, le=5000, description="Number of recent readings to learn from")
+):
+    """
+    Learn the signature engine's per-combination centroids from a user's recent
+    readings, labeled by the XGBoost model.
+    """
+    _check_admin(request)
+    readings = await run_in_threadpool(get_recent_readings, user_id, limit=limit)
+    try:
+        return await run_in_threadpool(ml_service_instance.learn_signatures, readings)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Runtime metrics of the inference pipeline.
+    """
+    return {
+        "identification": ml_service_instance.engine_selector.stats(),
+        "change_detector": ml_service_instance.change_detector.stats(),
+        "rate_control": rate_controller_instance.stats(),
+        "ingest": ingest_service_instance.stats(),
+        "data_quality": data_quality_instance.stats(),
+        "anomaly_prescreen": baseline_service_instance.stats(),
+        "bilstm_runtime": ml_service_instance.bilstm_runtime.stats() if ml_service_instance.bilstm_runtime else None,
+        "energy": energy_service_instance.stats(),
+        "alerts": alert_service_instance.stats(),
+        "outbox": outbox_instance.stats(),
+        "snapshots": snapshot_service_instance.stats(),
+        "forecasts": forecast_service_instance.stats(),
+        "anomaly_sweep": anomaly_sweep_instance.stats(),
+        "rtdb_rest": rtdb_rest_client.stats(),
+        "sharding": shard_coordinator.stats() if shard_coordinator else None,
+    }
+
+@app.post("/admin/profile")
+async def admin_profile(request: Request, seconds: float = Query(10.0, gt=0), interval_ms: float = Query(5.0, ge=1)):
+    """
+    Sample all threads of this process for `seconds` and return the stacks in
+    collapsed format (flamegraph.pl / speedscope input).
+    """
+    _check_admin(request)
+    try:
+        folded = await run_in_threadpool(sampling_profiler_instance.profile, seconds, interval_ms / 1000.0)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(content=folded, media_type="text/plain")
+
+@app.get("/admin/pipeline-timings")
+async def admin_pipeline_timings(request: Request, limit: int = Query(50, ge=1, le=1000)):
+    """
+    Per-stage wall/CPU timings (fetch, features, xgboost, anomaly, firebase_writes, ...)
+    of the most recent pipeline events, plus per-stage percentiles.
+    """
+    _check_admin(request)
+    return {
+        "summary": pipeline_tracer_instance.summary(),
+        "events": pipeline_tracer_instance.recent(limit),
+        "profiler": {"running": sampling_profiler_instance.running, "last_run": sampling_profiler_instance.last_run},
+    }
+
+@app.post("/admin/anomaly-sweep")
+async def admin_anomaly_sweep(
+    request: Request,
+    source: str = Query("auto", description="'auto' (local state, RTDB for the rest), 'local' or 'rtdb'"),
+    discover: bool = Query(False, description="Also sweep every user found under /SmartMeter/users"),
+    top: Optional[int] = Query(None, ge=1, le=10000, description="Number of anomalous meters to return (default ANOMALY_SWEEP_TOP)")
+):
+    """
+    Score the latest reading of every known meter in one vectorized anomaly-model
+    pass and return the anomalous meters ranked by score (most anomalous first).
+    """
+    _check_admin(request)
+    try:
+        return await run_in_threadpool(anomaly_sweep_instance.sweep, None, source, discover, top)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Anomaly sweep failed: {str(e)}")
+
+@app.get("/admin/anomaly-sweep")
+async def admin_last_anomaly_sweep(request: Request):
+    """
+    Result of the last (scheduled or on-demand) anomaly sweep.
+    """
+    _check_admin(request)
+    if anomaly_sweep_instance.last_result is None:
+        raise HTTPException(status_code=404, detail="No anomaly sweep has run yet")
+    return anomaly_sweep_instance.last_result
+
+@app.get("/behavior")
+async def behavior_overview():
+    """
+    Fleet-wide count of users per behavior cluster from the last closed buckets.
+    """
+    return behavior_service_instance.fleet_summary()
+
+@app.get("/behavior/{user_id}")
+async def behavior_profile(user_id: str, limit: int = Query(10, ge=1, le=60)):
+    """
+    Latest behavior cluster and recent bucket history for a user.
+    Requires the user's live stream to be processed in this process (REALTIME_USER_IDS).
+    """
+    profile = behavior_service_instance.get_profile(user_id, limit)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No behavior data for user {user_id}")
+    return profile
+
+@app.get("/energy/{user_id}")
+async def energy_usage(
+    user_id: str,
+    period: str = Query("day", pattern="^(hour|day|month)$"),
+    start: str = Query(None, description="First bucket, e.g. 2026-02-01 or 2026-02-01T10"),
+    end: str = Query(None, description="Last bucket, inclusive"),
+    device: str = Query(None, description="Restrict to one device, e.g. '12W Bulb' or 'Other'")
+):
+    """
+    Energy consumed per device in hour/day/month buckets, from the server-side rollups.
+    Requires the user's live stream to be processed in this process (REALTIME_USER_IDS).
+    """
+    rows = energy_service_instance.get_range(user_id, period, start, end, device)
+    return {
+        "user_id": user_id,
+        "period": period,
+        "buckets": rows,
+        "total_kwh": sum(r["kwh"] if device else r["total_kwh"] for r in rows),
+    }
+
+@app.get("/models")
+async def list_models():
+    """
+    Cached versions of each registered model, keyed by artifact content hash.
+    """
+    return {"models": ml_service_instance.registry.describe()}
+
+@app.post("/models/{name}/reload")
+async def reload_model(name: str, request: Request):
+    """
+    Load the current artifact for a model in the background, warm it and swap it in.
+    The active version keeps serving until the swap. Clears a rollback pin.
+    """
+    _check_admin(request)
+    if name not in ml_service_instance.registry.describe():
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+    started = ml_service_instance.reload_model(name)
+    return {
+        "model": name,
+        "reload_started": started,
+        "active_version": ml_service_instance.model_version(name)
+    }
+
+@app.post("/models/{name}/rollback")
+async def rollback_model(name: str, request: Request,
+                         version: str = Query(None, description="Cached version to restore; defaults to the previous one")):
+    """
+    Swap back to a cached version. The background watcher leaves it in place until
+    the artifact on disk changes again.
+    """
+    _check_admin(request)
+    if name not in ml_service_instance.registry.describe():
+        raise HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+    entry = ml_service_instance.registry.rollback(name, version)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="No cached version to roll back to")
+    return {"model": name, "active_version": entry.version,
+            "pinned_artifact": ml_service_instance.registry.pinned(name)}
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -13,7 +13,13 @@ class DeviceIdentificationRequest(BaseModel):
 class PredictionRequest(BaseModel):
     # Adjust based on what the BiLSTM expects (e.g., last N hours of data)
     # For now, generic list of floats
-    features: List[float]
+    features: Optional[List[float]] = None
+    # Serve the user's materialized forecast when fresh (features are then ignored)
+    user_id: Optional[str] = None
+
+class EngineBenchmarkRequest(BaseModel):
+    # True on/off bits of DEVICE_LABELS for each replayed reading, oldest first
+    labels: Optional[List[List[int]]] = None
 
 class Alert(BaseModel):
     id: str
@@ -1,18 +1,31 @@
-import firebase_admin
-from firebase_admin import db
 import os
 import time
 import threading
+import numpy as np
+from typing import Dict
 from dotenv import load_dotenv
-from services.firebase_service import get_recent_readings
+from services.data_sources import DataSource, FirebaseDataSource, reading_from_event
 from services.ml_service import ml_service_instance
+from services.behavior_service import behavior_service_instance
+from services.energy_service import energy_service_instance
+from services.rate_controller import RateController, rate_controller_instance
+from services.profiler import pipeline_tracer_instance, sampling_profiler_instance
+from services.data_quality import data_quality_instance
+from services.baseline_service import baseline_service_instance
+from services.snapshot_service import str_array, bits_array, bits_value
 
 load_dotenv()
 
 class RealtimeProcessor:
-    def __init__(self, user_id: str, threshold: int = 20):
+    def __init__(self, user_id: str, threshold: int = 20, data_source: DataSource = None,
+                 rate_controller: RateController = None):
         self.user_id = user_id
         self.data_path = f'/SmartMeter/users/{user_id}/data'
+        # Live RTDB by default; the replay harness plugs in a ReplayDataSource
+        self.data_source = data_source or FirebaseDataSource()
+        # Shared across processors so tier budgets and CPU throttling are global
+        self.rate_controller = rate_controller or rate_controller_instance
+        self.last_states = None
         self.is_running = False
         self._listener = None
         self.threshold = threshold
@@ -29,20 +42,54 @@ class RealtimeProcessor:
 
         self.last_reading_time = time.time()
         self.all_offline_triggered = False # Reset flag since we have data
+
+        # Stable and idle meters are evaluated less often; skipped readings only
+        # update the cheap aggregates with the last identified states. The change
+        # detector looks at each reading once; identify_device reuses its verdict.
+        # Implausible readings are dropped first so they never reach detector state.
+        reading = reading_from_event(event)
+        change = None
+        if reading is not None:
+            if not data_quality_instance.check_reading(reading):
+                print(f"[RealtimeProcessor] Reading rejected by data-quality checks for user {self.user_id}")
+                return
+            change = ml_service_instance.change_detector.check(self.user_id, reading)
+            evaluate, _, _ = self.rate_controller.admit(self.user_id, reading, change)
+            if not evaluate:
+                behavior_service_instance.observe(self.user_id, reading, self.last_states)
+                energy_service_instance.observe(self.user_id, reading, self.last_states)
+                baseline_service_instance.observe(self.user_id, reading)
+                return
+
         print(f"\n[RealtimeProcessor] New data detected for user {self.user_id}")
         
-        try:
-            # Fetch up to 7 recent readings for DeltaP and feature calculation
-            readings = get_recent_readings(self.user_id, limit=7)
-            
-            if len(readings) >= 1:
-                print(f"[RealtimeProcessor] Triggering identification with {len(readings)} readings.")
-                ml_service_instance.identify_device(readings)
-            else:
-                print(f"[RealtimeProcessor] No readings found in RTDB.")
-                
-        except Exception as e:
-            print(f"[RealtimeProcessor] Error processing change: {e}")
+        with pipeline_tracer_instance.event("realtime", self.user_id):
+            try:
+                # Fetch up to 7 recent readings for DeltaP and feature calculation
+                with pipeline_tracer_instance.stage("fetch"):
+                    readings = self.data_source.get_recent_readings(self.user_id, limit=7)
+
+                # Garbage in the latest reading stops here, before any model or Firebase work
+                with pipeline_tracer_instance.stage("validate"):
+                    readings, quality = data_quality_instance.validate(readings, self.user_id)
+                if quality.latest_rejected:
+                    print(f"[RealtimeProcessor] Latest reading rejected by data-quality checks: {quality.counts}")
+                    return
+
+                if len(readings) >= 1:
+                    print(f"[RealtimeProcessor] Triggering identification with {len(readings)} readings.")
+                    states = ml_service_instance.identify_device(readings, user_id=self.user_id, validated=True,
+                                                                 change=change)
+                    self.last_states = states
+                    with pipeline_tracer_instance.stage("aggregates"):
+                        behavior_service_instance.observe(self.user_id, readings[-1], states)
+                        energy_service_instance.observe(self.user_id, readings[-1], states)
+                        baseline_service_instance.observe(self.user_id, readings[-1])
+                else:
+                    print(f"[RealtimeProcessor] No readings found in RTDB.")
+
+            except Exception as e:
+                print(f"[RealtimeProcessor] Error processing change: {e}")
 
     def _heartbeat_loop(self):
         """
@@ -53,14 +100,14 @@ class RealtimeProcessor:
                 elapsed = time.time() - self.last_reading_time
                 if elapsed > self.threshold and not self.all_offline_triggered:
                     print(f"[RealtimeProcessor] HEARTBEAT ALERT: No data for {int(elapsed)}s!")
-                    ml_service_instance.set_all_offline()
+                    ml_service_instance.set_all_offline(self.user_id)
                     self.all_offline_triggered = True
             
             time.sleep(10) # Check every 10 seconds
 
-    def start(self):
+    def start(self, heartbeat: bool = True):
         """
-        Start listening to the RTDB path and start the heartbeat monitor.
+        Start listening to the user's readings and start the heartbeat monitor.
         """
         if self.is_running:
             return
@@ -72,11 +119,15 @@ class RealtimeProcessor:
         self.last_reading_time = time.time() # Start the clock
         
         # Start the listener
-        self._listener = db.reference(self.data_path).listen(self._on_data_change)
+        self._listener = self.data_source.listen(self.user_id, self._on_data_change)
         
         # Start the heartbeat thread
-        self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
-        self.heartbeat_thread.start()
+        if heartbeat:
+            self.heartbeat_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self.heartbeat_thread.start()
+
+        # Behavior buckets close on wall-clock boundaries for all users at once
+        behavior_service_instance.start()
 
     def stop(self):
         """
@@ -87,10 +138,42 @@ class RealtimeProcessor:
             self._listener.close()
         print("RealtimeProcessor stopped.")
 
+class ProcessorStates:
+    """
+    Snapshot component for the running processors: heartbeat clock, offline flag
+    and last identified states. Restored values are applied when the user's
+    processor starts.
+    """
+    def __init__(self, processors: Dict[str, RealtimeProcessor]):
+        self.processors = processors
+        self.restored = {}
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        processors = list(self.processors.values())
+        return {
+            "users": str_array(p.user_id for p in processors),
+            "last_reading_time": np.array([p.last_reading_time for p in processors], dtype=float),
+            "offline": np.array([p.all_offline_triggered for p in processors], dtype=bool),
+            "last_states": bits_array([p.last_states for p in processors], 3),
+        }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        self.restored = {str(u): (float(t), bool(off), bits_value(bits)) for u, t, off, bits in
+                         zip(state["users"], state["last_reading_time"], state["offline"], state["last_states"])}
+
+    def apply(self, processor: RealtimeProcessor):
+        restored = self.restored.pop(processor.user_id, None)
+        if restored is None:
+            return
+        processor.last_reading_time, processor.all_offline_triggered, states = restored
+        processor.last_states = [states] if states is not None else None
+
 if __name__ == "__main__":
     # Test with the known user ID from our research
     USER_ID = "v7LHzYJqMEdn3opIub1cWFZTBcf2"
     processor = RealtimeProcessor(USER_ID)
+    # kill -USR1 <pid> writes a sampling profile of this process
+    sampling_profiler_instance.install_signal_handler()
     try:
         processor.start()
         # Keep the main thread alive
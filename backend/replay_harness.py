@@ -0,0 +1,100 @@
+import argparse
+import contextlib
+import io
+import json
+import random
+from datetime import datetime, timedelta
+import numpy as np
+from services.data_sources import ReplayDataSource, fan_out
+from services.timestamps import timestamp_key
+from services.sinks import MemorySink
+from services.ml_service import ml_service_instance, DEVICE_WATTS
+from services.rate_controller import rate_controller_instance
+from realtime_processor import RealtimeProcessor
+
+def synthetic_stream(n: int, interval: float = 2.0, seed: int = 0):
+    """
+    Recorded-like readings: a random bulb combination held for a while, with noise.
+    """
+    rng = random.Random(seed)
+    t = datetime(2026, 1, 1, 18, 0, 0)
+    kwh = 1.0
+    bits = [0, 0, 0]
+    readings = []
+    for i in range(n):
+        if i % 30 == 0:
+            bits = [rng.randint(0, 1) for _ in DEVICE_WATTS]
+        power = sum(w for w, b in zip(DEVICE_WATTS, bits) if b) + rng.gauss(0, 0.2)
+        power = max(power, 0.1)
+        vrms = 228.0 + rng.gauss(0, 1.5)
+        kwh += power * interval / 3600.0 / 1000.0
+        readings.append({
+            'Irms': power / vrms / 0.95,
+            'Power': power,
+            'Vrms': vrms,
+            'kWh': kwh,
+            'timestamp': timestamp_key(t),
+        })
+        t += timedelta(seconds=interval)
+    return readings
+
+def run_replay(source: ReplayDataSource, quiet: bool = True) -> dict:
+    """
+    Drive one RealtimeProcessor per stream from `source` with Firebase replaced
+    by an in-memory sink, and report latency and throughput.
+    """
+    sink = MemorySink()
+    previous_sink = ml_service_instance.sink
+    previous_alert_sink = ml_service_instance.alerts.sink
+    ml_service_instance.sink = sink
+    ml_service_instance.alerts.sink = sink
+
+    processors = [RealtimeProcessor(user_id, data_source=source) for user_id in source.streams]
+    out = io.StringIO() if quiet else None
+    try:
+        with contextlib.redirect_stdout(out) if quiet else contextlib.nullcontext():
+            for processor in processors:
+                processor.start(heartbeat=False)
+            summary = source.run()
+            for processor in processors:
+                processor.stop()
+            ml_service_instance.alerts.flush()
+    finally:
+        ml_service_instance.sink = previous_sink
+        ml_service_instance.alerts.sink = previous_alert_sink
+
+    lat_ms = np.array(source.latencies) * 1000.0
+    wall = summary["wall_seconds"]
+    return {
+        **summary,
+        "events_per_second": summary["events"] / wall if wall > 0 else None,
+        "latency_ms_p50": float(np.percentile(lat_ms, 50)) if len(lat_ms) else None,
+        "latency_ms_p95": float(np.percentile(lat_ms, 95)) if len(lat_ms) else None,
+        "latency_ms_max": float(lat_ms.max()) if len(lat_ms) else None,
+        "sink_writes": sink.writes,
+        "alerts": len(sink.alerts),
+        "change_detector": ml_service_instance.change_detector.stats(),
+        "rate_control": rate_controller_instance.stats(),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded meter readings through the realtime pipeline.")
+    parser.add_argument("recording", nargs="?", help="JSON/CSV recording (omit to use a synthetic stream)")
+    parser.add_argument("--users", type=int, default=1, help="Number of simulated users to fan the stream out to")
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed factor (1 = real time, 0 = as fast as possible)")
+    parser.add_argument("--synthetic", type=int, default=500, help="Readings per user in the synthetic stream")
+    parser.add_argument("--verbose", action="store_true", help="Show pipeline logs")
+    args = parser.parse_args()
+
+    if args.recording:
+        source = ReplayDataSource.from_file(args.recording, users=args.users, speed=args.speed)
+    else:
+        source = ReplayDataSource(fan_out(synthetic_stream(args.synthetic), args.users), speed=args.speed)
+
+    report = run_replay(source, quiet=not args.verbose)
+    if args.speed == 0:
+        report["max_sustainable_events_per_second"] = report["events_per_second"]
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional
+from services.sinks import StatusSink
+from services.outbox import outbox_instance
+from services.read_cache import ReadCache
+from services.snapshot_service import str_array
+
+# Same (user, device, type) alert is sent at most once per window
+ALERT_SUPPRESSION_SECONDS = float(os.getenv("ALERT_SUPPRESSION_SECONDS", "900"))
+# Token bucket per user: sustained alerts per minute and burst size
+ALERT_RATE_PER_MINUTE = float(os.getenv("ALERT_RATE_PER_MINUTE", "6"))
+ALERT_BURST = float(os.getenv("ALERT_BURST", "5"))
+# Pending alerts are written together at most this often
+ALERT_FLUSH_SECONDS = float(os.getenv("ALERT_FLUSH_SECONDS", "1.0"))
+# How long a GET /alerts page is served from memory
+ALERTS_CACHE_SECONDS = float(os.getenv("ALERTS_CACHE_SECONDS", "5"))
+# Filtered pages read at most this many key-ordered pages from RTDB
+ALERTS_MAX_SCAN_PAGES = 5
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+
+class AlertPipeline:
+    """
+    Deduplicates, rate limits and batches alerts before they reach Firebase.
+
+    submit() drops an alert if the same (user, device, type) is still queued or
+    was sent within the suppression window, or if the user's token bucket is
+    empty; accepted alerts are queued and a background flusher hands each batch
+    to the sink (the write-behind outbox by default), which writes it under
+    /alerts with one multi-path update. A failed batch is queued again and the
+    suppression window starts only once the write succeeded. Paged reads and the
+    unread count go through a short-lived cache that is invalidated by this
+    process's own writes.
+    """
+    def __init__(self, sink: Optional[StatusSink] = None,
+                 suppression_seconds: float = ALERT_SUPPRESSION_SECONDS,
+                 rate_per_minute: float = ALERT_RATE_PER_MINUTE, burst: float = ALERT_BURST,
+                 flush_seconds: float = ALERT_FLUSH_SECONDS, max_batch: int = 100):
+        self.sink = sink or outbox_instance
+        self.suppression_seconds = suppression_seconds
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = burst
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self._last_sent: Dict[tuple, float] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._queued = set()  # suppression keys of the pending alerts
+        self._pending = []  # (suppression key, push key, alert)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.cache = ReadCache(ALERTS_CACHE_SECONDS)
+        self.counters = {"submitted": 0, "sent": 0, "suppressed": 0, "rate_limited": 0,
+                         "batches": 0, "failed": 0}
+
+    def _take_token(self, user_key: str, now: float) -> bool:
+        bucket = self._buckets.get(user_key)
+        if bucket is None:
+            bucket = self._buckets[user_key] = _TokenBucket(self.burst, now)
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate_per_second)
+        bucket.updated = now
+        if bucket.tokens < 1.0:
+            return False
+        bucket.tokens -= 1.0
+        return True
+
+    def submit(self, alert: dict, user_id: Optional[str] = None, device: Optional[str] = None,
+               alert_type: str = "generic") -> bool:
+        """
+        Queue an alert unless it is suppressed or rate limited. Returns True if queued.
+        """
+        from services.firebase_service import generate_push_key
+
+        now = time.time()
+        key = (user_id, device, alert_type)
+        with self._lock:
+            self.counters["submitted"] += 1
+            if self._is_suppressed(key, now):
+                self.counters["suppressed"] += 1
+                return False
+            if not self._take_token(user_id or "global", now):
+                self.counters["rate_limited"] += 1
+                return False
+            self._queued.add(key)
+            self._pending.append((key, generate_push_key(),
+                                  {**alert, "user_id": user_id, "device": device, "type": alert_type}))
+            batch_full = len(self._pending) >= self.max_batch
+
+        self._ensure_flusher()
+        if batch_full:
+            self._wakeup.set()
+        return True
+
+    def _is_suppressed(self, key: tuple, now: float) -> bool:
+        if key in self._queued:
+            return True
+        last = self._last_sent.get(key)
+        return last is not None and now - last < self.suppression_seconds
+
+    def is_suppressed(self, user_id: Optional[str], device: Optional[str], alert_type: str) -> bool:
+        with self._lock:
+            return self._is_suppressed((user_id, device, alert_type), time.time())
+
+    def flush(self) -> int:
+        """
+        Write all pending alerts in one multi-path update. Returns the number
+        written; a failed batch is queued again for the next flush.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        alerts = {push_key: alert for _, push_key, alert in batch}
+        try:
+            # Sinks raise on failure; a plain False from a sink counts as one too
+            if self.sink.add_alerts(alerts) is False:
+                raise RuntimeError("sink reported a failed write")
+        except Exception as e:
+            print(f"[AlertPipeline] Failed to write {len(alerts)} alerts, will retry: {e}")
+            with self._lock:
+                self._pending = batch + self._pending
+                self.counters["failed"] += len(alerts)
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for key, _, _ in batch:
+                self._queued.discard(key)
+                self._last_sent[key] = now
+            self.counters["sent"] += len(alerts)
+            self.counters["batches"] += 1
+        self.invalidate_cache()
+        return len(alerts)
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, t in self._last_sent.items() if now - t >= self.suppression_seconds]
+            for k in expired:
+                del self._last_sent[k]
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+                self._prune()
+            except Exception as e:
+                print(f"[AlertPipeline] Flush error: {e}")
+
+    def _ensure_flusher(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+                    self._thread.start()
+
+    @staticmethod
+    def _page_key(limit: int, before: Optional[str], unread: Optional[bool], severity: Optional[str]):
+        return ("page", limit, before, unread, severity)
+
+    def peek_page_etag(self, limit: int = 50, before: Optional[str] = None,
+                       unread: Optional[bool] = None, severity: Optional[str] = None) -> Optional[str]:
+        """
+        ETag of a still-fresh cached page, without reading Firebase.
+        """
+        return self.cache.peek_etag(self._page_key(limit, before, unread, severity))
+
+    def _load_page(self, limit: int, before: Optional[str], unread: Optional[bool], severity: Optional[str]):
+        from services.firebase_service import get_alerts_page
+
+        if unread is None and severity is None:
+            page = get_alerts_page(limit, before)
+            if page is None:
+                return None
+            next_cursor = next(reversed(page)) if len(page) == limit else None
+            return {"alerts": page, "next_cursor": next_cursor}
+
+        # Filters cannot be combined with key ordering in RTDB, so walk key-ordered
+        # pages and filter in memory, bounded by ALERTS_MAX_SCAN_PAGES.
+        matched = {}
+        cursor = before
+        scan_size = max(limit, 50)
+        for _ in range(ALERTS_MAX_SCAN_PAGES):
+            page = get_alerts_page(scan_size, cursor)
+            if page is None:
+                return None
+            for key, alert in page.items():
+                cursor = key
+                if unread is not None and bool(alert.get('is_read')) == unread:
+                    continue
+                if severity is not None and alert.get('severity') != severity:
+                    continue
+                matched[key] = alert
+                if len(matched) == limit:
+                    return {"alerts": matched, "next_cursor": key}
+            if len(page) < scan_size:
+                return {"alerts": matched, "next_cursor": None}
+        return {"alerts": matched, "next_cursor": cursor}
+
+    def get_page(self, limit: int = 50, before: Optional[str] = None,
+                 unread: Optional[bool] = None, severity: Optional[str] = None):
+        """
+        One page of alerts, newest first: ({"alerts": {push_key: alert}, "next_cursor": key}, etag).
+        Pass next_cursor as `before` to get the following page.
+        """
+        return self.cache.get(self._page_key(limit, before, unread, severity),
+                              lambda: self._load_page(limit, before, unread, severity))
+
+    def peek_unread_etag(self) -> Optional[str]:
+        return self.cache.peek_etag(("unread",))
+
+    def unread_count(self):
+        """
+        Maintained unread-alert counter: ({"unread": count}, etag).
+        """
+        from services.firebase_service import get_unread_alert_count
+
+        def _load():
+            count = get_unread_alert_count()
+            return None if count is None else {"unread": count}
+
+        return self.cache.get(("unread",), _load)
+
+    def invalidate_cache(self):
+        self.cache.invalidate()
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """
+        Suppression windows, so a restart does not resend recent alerts.
+        """
+        with self._lock:
+            sent = list(self._last_sent.items())
+        return {
+            "keys": str_array(part for key, _ in sent for part in key).reshape(-1, 3),
+            "sent_at": np.array([t for _, t in sent], dtype=float),
+        }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        with self._lock:
+            for (user_id, device, alert_type), sent_at in zip(state["keys"].tolist(), state["sent_at"].tolist()):
+                self._last_sent[(user_id or None, device or None, alert_type)] = sent_at
+
+    def stats(self) -> dict:
+        return {**self.counters, "pending": len(self._pending), "suppression_keys": len(self._last_sent),
+                "cache": self.cache.stats()}
+
+alert_service_instance = AlertPipeline()
@@ -0,0 +1,171 @@
+import os
+import random
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+from services.snapshot_service import str_array
+from services.timestamps import reading_time
+
+# Readings a (weekday, hour) slot needs before it can pre-screen
+BASELINE_MIN_SAMPLES = int(os.getenv("BASELINE_MIN_SAMPLES", "30"))
+# Half-width of the normal band in standard deviations
+BASELINE_BAND_SIGMA = float(os.getenv("BASELINE_BAND_SIGMA", "3.0"))
+# Fraction of pre-screened readings also scored by the full model, to measure agreement
+BASELINE_SHADOW_RATE = float(os.getenv("BASELINE_SHADOW_RATE", "0.05"))
+
+# Minimum band width, so a slot that only ever saw one steady load is not infinitely narrow
+_STD_FLOOR = np.array([2.0, 0.01])  # Power (W), Irms (A)
+
+
+def _reading_slot(reading: dict) -> Tuple[int, int]:
+    # (weekday, hour) the reading was taken in
+    dt = reading_time(reading)
+    return dt.weekday(), dt.hour
+
+
+class BaselineProfiler:
+    """
+    Per-user weekday x hour-of-day baselines of Power and Irms, used to pre-screen
+    anomaly detection. Each user owns a (7, 24) slot grid of running count / mean /
+    sum of squared deviations (Welford), updated in O(1) per reading. A reading
+    inside mean +/- BAND_SIGMA * std of its slot on both signals is normal by
+    table lookup; only out-of-band readings (or slots with too little history)
+    go to the IsolationForest. The model is global while the bands are per user,
+    so a slot only pre-screens after the model agreed on an in-band reading of it,
+    and stops again when a shadow check (a sampled pre-screened reading that is
+    also scored by the model) disagrees.
+    """
+    def __init__(self, min_samples: int = BASELINE_MIN_SAMPLES, band_sigma: float = BASELINE_BAND_SIGMA,
+                 shadow_rate: float = BASELINE_SHADOW_RATE):
+        self.min_samples = min_samples
+        self.band_sigma = band_sigma
+        self.shadow_rate = shadow_rate
+        self._index: Dict[str, int] = {}
+        self._count = np.zeros((16, 7, 24))
+        self._mean = np.zeros((16, 7, 24, 2))
+        self._m2 = np.zeros((16, 7, 24, 2))
+        self._verdict = np.zeros((16, 7, 24), dtype=np.int8)  # model on in-band readings: 1 normal, -1 anomaly, 0 unknown
+        self._lock = threading.Lock()
+        self.counters = {"screened": 0, "in_band": 0, "out_of_band": 0, "cold": 0, "unverified": 0,
+                         "shadow_checked": 0, "shadow_agreed": 0,
+                         "out_of_band_scored": 0, "out_of_band_anomalies": 0}
+
+    def _row(self, user_id: str) -> int:
+        idx = self._index.get(user_id)
+        if idx is None:
+            idx = len(self._index)
+            if idx >= len(self._count):
+                grow = len(self._count)
+                self._count = np.concatenate([self._count, np.zeros((grow, 7, 24))])
+                self._mean = np.concatenate([self._mean, np.zeros((grow, 7, 24, 2))])
+                self._m2 = np.concatenate([self._m2, np.zeros((grow, 7, 24, 2))])
+                self._verdict = np.concatenate([self._verdict, np.zeros((grow, 7, 24), dtype=np.int8)])
+            self._index[user_id] = idx
+        return idx
+
+    def observe(self, user_id: str, reading: dict):
+        """
+        Add one (validated) reading to the user's slot for its weekday and hour.
+        """
+        x = np.array([reading.get('Power', np.nan), reading.get('Irms', np.nan)], dtype=float)
+        if not np.isfinite(x).all():
+            return
+        day, hour = _reading_slot(reading)
+        with self._lock:
+            idx = self._row(user_id)
+            self._count[idx, day, hour] += 1
+            n = self._count[idx, day, hour]
+            delta = x - self._mean[idx, day, hour]
+            self._mean[idx, day, hour] += delta / n
+            self._m2[idx, day, hour] += delta * (x - self._mean[idx, day, hour])
+
+    def band(self, user_id: str, day: int, hour: int) -> Optional[dict]:
+        idx = self._index.get(user_id)
+        if idx is None:
+            return None
+        n = self._count[idx, day, hour]
+        mean = self._mean[idx, day, hour]
+        std = np.sqrt(self._m2[idx, day, hour] / n) if n > 1 else np.zeros(2)
+        return {"count": int(n), "mean": mean, "std": np.maximum(std, _STD_FLOOR)}
+
+    def _in_band(self, user_id: str, reading: dict) -> Optional[bool]:
+        day, hour = _reading_slot(reading)
+        band = self.band(user_id, day, hour)
+        if band is None or band["count"] < self.min_samples:
+            return None
+        x = np.array([reading.get('Power', 0.0), reading.get('Irms', 0.0)])
+        return bool((np.abs(x - band["mean"]) <= self.band_sigma * band["std"]).all())
+
+    def prescreen(self, user_id: str, reading: dict) -> Optional[bool]:
+        """
+        True if the reading is inside the user's learned band of a slot the model
+        agrees with (normal without the model), False if outside, None if the
+        model has to decide (too little history, or an unverified slot).
+        """
+        inside = self._in_band(user_id, reading)
+        self.counters["screened"] += 1
+        if inside is None:
+            self.counters["cold"] += 1
+            return None
+        if inside:
+            day, hour = _reading_slot(reading)
+            if self._verdict[self._index[user_id], day, hour] != 1:
+                self.counters["unverified"] += 1
+                return None
+        self.counters["in_band" if inside else "out_of_band"] += 1
+        return inside
+
+    def sample_shadow(self) -> bool:
+        return random.random() < self.shadow_rate
+
+    def record_model_result(self, user_id: str, reading: dict, screened: Optional[bool], is_anomaly: bool):
+        """
+        Record the full model's verdict on a screened reading: for in-band readings
+        whether it agreed they are normal (which also (un)verifies the slot), for
+        out-of-band ones whether it confirmed an anomaly.
+        """
+        if screened is False:
+            self.counters["out_of_band_scored"] += 1
+            self.counters["out_of_band_anomalies"] += int(is_anomaly)
+            return
+        if screened is True:
+            self.counters["shadow_checked"] += 1
+            self.counters["shadow_agreed"] += int(not is_anomaly)
+        elif not self._in_band(user_id, reading):
+            return
+        day, hour = _reading_slot(reading)
+        with self._lock:
+            self._verdict[self._index[user_id], day, hour] = -1 if is_anomaly else 1
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            n = len(self._index)
+            return {
+                "users": str_array(self._index),
+                "count": self._count[:n].astype(np.uint32),
+                "mean": self._mean[:n].astype(np.float32),
+                "m2": self._m2[:n].astype(np.float32),
+                "verdict": self._verdict[:n].copy(),
+            }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        with self._lock:
+            for i, user_id in enumerate(state["users"]):
+                idx = self._row(str(user_id))
+                self._count[idx] = state["count"][i]
+                self._mean[idx] = state["mean"][i]
+                self._m2[idx] = state["m2"][i]
+                self._verdict[idx] = state["verdict"][i]
+
+    def stats(self) -> dict:
+        c = self.counters
+        return {
+            **c,
+            "users": len(self._index),
+            "hit_rate": c["in_band"] / c["screened"] if c["screened"] else 0.0,
+            "agreement": c["shadow_agreed"] / c["shadow_checked"] if c["shadow_checked"] else None,
+            "out_of_band_anomaly_rate": (c["out_of_band_anomalies"] / c["out_of_band_scored"]
+                                         if c["out_of_band_scored"] else None),
+        }
+
+baseline_service_instance = BaselineProfiler()
@@ -0,0 +1,301 @@
+import os
+import csv
+import time
+import threading
+import joblib
+import numpy as np
+from collections import deque
+from typing import Dict, List, Optional
+from services.snapshot_service import str_array
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+
+KMEANS_BEHAVIOR_PATH = os.path.join(MODELS_DIR, "kmeans_behavior.pkl")
+KMEANS_SCALER_PATH = os.path.join(MODELS_DIR, "kmeans_scaler.pkl")
+KMEANS_RESULTS_PATH = os.path.join(MODELS_DIR, "kmeans_behavior_results.csv")
+
+# Length of one behavior bucket in seconds
+BEHAVIOR_BUCKET_SECONDS = float(os.getenv("BEHAVIOR_BUCKET_SECONDS", "60"))
+
+# Feature order the KMeans scaler was fitted with
+BEHAVIOR_FEATURES = ['avg_power', 'std_power', 'max_power', 'min_power', 'avg_voltage',
+                     'std_voltage', 'avg_current', 'std_current', 'total_kwh', 'num_bulbs_on']
+
+# Columns of the per-user accumulator matrix; _FIRST_KWH is the meter counter
+# at the start of the bucket (the previous bucket's last value, once there is one)
+_COUNT, _SUM_P, _SQ_P, _MAX_P, _MIN_P, _SUM_V, _SQ_V, _SUM_I, _SQ_I, _FIRST_KWH, _LAST_KWH, _SUM_BULBS = range(12)
+_N_ACC = 12
+
+
+class BehaviorProfiler:
+    """
+    Incremental per-user behavior profiling over fixed time buckets.
+    Each reading updates a row of running sums in O(1); when a bucket closes,
+    every user's row is turned into the 10 KMeans features and assigned to the
+    nearest behavior centroid in one vectorized pass over the whole fleet.
+    """
+    def __init__(self, bucket_seconds: float = BEHAVIOR_BUCKET_SECONDS, history_size: int = 60):
+        self.bucket_seconds = bucket_seconds
+        self.history_size = history_size
+        self.centroids = None       # (k, 10) cluster centres in raw feature units
+        self.inv_scale = None       # (10,) 1 / scaler.scale_, weights the raw distance
+        self.cluster_names = {}
+        self.cluster_states = {}
+        self._index: Dict[str, int] = {}
+        self._acc = self._empty_rows(64)
+        self._profiles: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self.last_close_seconds = 0.0
+        self.load_models()
+
+    @staticmethod
+    def _empty_rows(n: int):
+        rows = np.zeros((n, _N_ACC))
+        rows[:, _MAX_P] = -np.inf
+        rows[:, _MIN_P] = np.inf
+        rows[:, _FIRST_KWH] = np.nan
+        rows[:, _LAST_KWH] = np.nan
+        return rows
+
+    def load_models(self):
+        try:
+            print(f"Loading behavior KMeans from {KMEANS_BEHAVIOR_PATH}...")
+            kmeans = joblib.load(KMEANS_BEHAVIOR_PATH)
+            scaler = joblib.load(KMEANS_SCALER_PATH)
+            # Undo the scaling on the centroids once, so a bucket only needs a
+            # weighted distance instead of a scaler.transform per user.
+            self.centroids = kmeans.cluster_centers_ * scaler.scale_ + scaler.mean_
+            self.inv_scale = 1.0 / scaler.scale_
+            print("Behavior KMeans loaded.")
+        except Exception as e:
+            print(f"Error loading behavior KMeans: {e}")
+            return
+
+        try:
+            self._load_cluster_names()
+        except Exception as e:
+            print(f"Error reading behavior cluster results: {e}")
+
+    def _load_cluster_names(self):
+        """
+        Name clusters by the average power of the training states assigned to them.
+        """
+        members: Dict[int, List[dict]] = {}
+        with open(KMEANS_RESULTS_PATH, newline="") as f:
+            for row in csv.DictReader(f):
+                members.setdefault(int(row['cluster']), []).append(row)
+
+        by_power = sorted(members, key=lambda c: np.mean([float(r['avg_power']) for r in members[c]]))
+        names = ["Low usage", "Moderate usage", "High usage"]
+        for rank, cluster in enumerate(by_power):
+            self.cluster_names[cluster] = names[rank] if len(by_power) == len(names) else f"Cluster {cluster}"
+            self.cluster_states[cluster] = sorted({r['state_label'] for r in members[cluster]})
+
+    def _row(self, user_id: str) -> int:
+        idx = self._index.get(user_id)
+        if idx is None:
+            idx = len(self._index)
+            if idx >= len(self._acc):
+                self._acc = np.vstack([self._acc, self._empty_rows(len(self._acc))])
+            self._index[user_id] = idx
+            self._profiles[user_id] = deque(maxlen=self.history_size)
+        return idx
+
+    def observe(self, user_id: str, reading: dict, states=None):
+        """
+        Add one live reading (and the identified bulb states, if any) to the user's open bucket.
+        """
+        power = reading.get('Power', 0.0)
+        vrms = reading.get('Vrms', 0.0)
+        irms = reading.get('Irms', 0.0)
+        bulbs_on = 0
+        if states:
+            bits = states[0] if isinstance(states[0], (list, tuple)) else states
+            bulbs_on = int(sum(int(b) for b in bits))
+
+        with self._lock:
+            idx = self._row(user_id)
+            row = self._acc[idx]
+            row[_COUNT] += 1
+            row[_SUM_P] += power
+            row[_SQ_P] += power * power
+            row[_MAX_P] = max(row[_MAX_P], power)
+            row[_MIN_P] = min(row[_MIN_P], power)
+            row[_SUM_V] += vrms
+            row[_SQ_V] += vrms * vrms
+            row[_SUM_I] += irms
+            row[_SQ_I] += irms * irms
+            kwh = reading.get('kWh', np.nan)
+            if not np.isnan(kwh):
+                if np.isnan(row[_FIRST_KWH]):
+                    row[_FIRST_KWH] = kwh
+                row[_LAST_KWH] = kwh
+            row[_SUM_BULBS] += bulbs_on
+
+    @staticmethod
+    def _features(acc: np.ndarray) -> np.ndarray:
+        n = acc[:, _COUNT]
+
+        def _std(sum_col, sq_col):
+            mean = acc[:, sum_col] / n
+            return np.sqrt(np.maximum(acc[:, sq_col] / n - mean * mean, 0.0))
+
+        return np.column_stack([
+            acc[:, _SUM_P] / n,
+            _std(_SUM_P, _SQ_P),
+            acc[:, _MAX_P],
+            acc[:, _MIN_P],
+            acc[:, _SUM_V] / n,
+            _std(_SUM_V, _SQ_V),
+            acc[:, _SUM_I] / n,
+            _std(_SUM_I, _SQ_I),
+            # Energy used in the bucket; a counter reset or missing kWh counts as 0
+            np.nan_to_num(np.maximum(acc[:, _LAST_KWH] - acc[:, _FIRST_KWH], 0.0)),
+            acc[:, _SUM_BULBS] / n,
+        ])
+
+    def assign(self, features: np.ndarray):
+        """
+        Nearest-centroid lookup for an (N, 10) feature matrix.
+        Returns (cluster ids, distances in scaled units).
+        """
+        diff = (features[:, np.newaxis, :] - self.centroids[np.newaxis, :, :]) * self.inv_scale
+        dist = np.einsum('nkf,nkf->nk', diff, diff)
+        clusters = np.argmin(dist, axis=1)
+        return clusters, np.sqrt(dist[np.arange(len(clusters)), clusters])
+
+    def close_buckets(self, closed_at: Optional[float] = None) -> int:
+        """
+        Close the open bucket of every user that received readings and assign
+        its behavior cluster. Returns the number of users assigned.
+        """
+        if self.centroids is None:
+            return 0
+        closed_at = closed_at or time.time()
+        t0 = time.perf_counter()
+
+        with self._lock:
+            used = len(self._index)
+            acc = self._acc[:used].copy()
+            self._acc[:used] = self._empty_rows(used)
+            # The next bucket's energy is measured from this bucket's last counter value
+            self._acc[:used, _FIRST_KWH] = acc[:, _LAST_KWH]
+            self._acc[:used, _LAST_KWH] = acc[:, _LAST_KWH]
+            users = list(self._index)
+
+        active = acc[:, _COUNT] > 0
+        if not active.any():
+            return 0
+
+        features = self._features(acc[active])
+        counts = acc[active, _COUNT]
+        clusters, distances = self.assign(features)
+
+        active_users = [u for u, a in zip(users, active) if a]
+        for i, user_id in enumerate(active_users):
+            cluster = int(clusters[i])
+            self._profiles[user_id].append({
+                "bucket_end": closed_at,
+                "cluster": cluster,
+                "cluster_name": self.cluster_names.get(cluster, f"Cluster {cluster}"),
+                "distance": float(distances[i]),
+                "readings": int(counts[i]),
+                "features": dict(zip(BEHAVIOR_FEATURES, (float(v) for v in features[i]))),
+            })
+
+        self.last_close_seconds = time.perf_counter() - t0
+        return len(active_users)
+
+    def get_profile(self, user_id: str, limit: int = 10) -> Optional[dict]:
+        history = self._profiles.get(user_id)
+        if history is None:
+            return None
+        recent = list(history)[-limit:]
+        return {
+            "user_id": user_id,
+            "bucket_seconds": self.bucket_seconds,
+            "current": recent[-1] if recent else None,
+            "history": recent,
+        }
+
+    def fleet_summary(self) -> dict:
+        counts: Dict[str, int] = {}
+        for history in self._profiles.values():
+            if history:
+                name = history[-1]["cluster_name"]
+                counts[name] = counts.get(name, 0) + 1
+        return {
+            "users_tracked": len(self._profiles),
+            "clusters": counts,
+            "cluster_states": {self.cluster_names.get(c, str(c)): s for c, s in self.cluster_states.items()},
+            "last_close_seconds": self.last_close_seconds,
+        }
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            users = list(self._index)
+            acc = self._acc[:len(users)].copy()
+            history = [(i, p) for i, u in enumerate(users) for p in self._profiles[u]]
+        return {
+            "users": str_array(users),
+            "acc": acc,
+            "history_user": np.array([i for i, _ in history], dtype=np.int32),
+            "history_values": np.array([[p["bucket_end"], p["cluster"], p["distance"], p["readings"]]
+                                        for _, p in history], dtype=float).reshape(-1, 4),
+            "history_features": np.array([[p["features"][f] for f in BEHAVIOR_FEATURES] for _, p in history],
+                                         dtype=float).reshape(-1, len(BEHAVIOR_FEATURES)),
+        }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        users = [str(u) for u in state["users"]]
+        # Accumulators from an older layout are dropped; only the open bucket is lost
+        acc = state["acc"] if state["acc"].shape[1:] == (_N_ACC,) else None
+        with self._lock:
+            for i, user_id in enumerate(users):
+                idx = self._row(user_id)
+                if acc is not None:
+                    self._acc[idx] = acc[i]
+            for u, (bucket_end, cluster, distance, readings), features in zip(
+                    state["history_user"].tolist(), state["history_values"].tolist(),
+                    state["history_features"].tolist()):
+                cluster = int(cluster)
+                self._profiles[users[u]].append({
+                    "bucket_end": bucket_end,
+                    "cluster": cluster,
+                    "cluster_name": self.cluster_names.get(cluster, f"Cluster {cluster}"),
+                    "distance": distance,
+                    "readings": int(readings),
+                    "features": dict(zip(BEHAVIOR_FEATURES, features)),
+                })
+
+    def _loop(self):
+        next_close = (time.time() // self.bucket_seconds + 1) * self.bucket_seconds
+        while self._running:
+            time.sleep(max(0.0, min(1.0, next_close - time.time())))
+            if time.time() >= next_close:
+                try:
+                    self.close_buckets(next_close)
+                except Exception as e:
+                    print(f"[BehaviorProfiler] Bucket close failed: {e}")
+                next_close += self.bucket_seconds
+
+    def start(self):
+        """
+        Start the background thread that closes buckets on wall-clock boundaries.
+        """
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+behavior_service_instance = BehaviorProfiler()
@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+from services.snapshot_service import str_array, bits_array, bits_value
+
+# Minimum |DeltaP| (W) and |DeltaIrms| (A) treated as a load change, whatever the noise
+CHANGE_MIN_POWER_STEP = float(os.getenv("CHANGE_MIN_POWER_STEP", "2.0"))
+CHANGE_MIN_CURRENT_STEP = float(os.getenv("CHANGE_MIN_CURRENT_STEP", "0.008"))
+# Seconds after which the model runs again even without a detected change
+CHANGE_MAX_STALENESS = float(os.getenv("CHANGE_MAX_STALENESS", "30"))
+
+
+class _MeterState:
+    __slots__ = ("ref_power", "ref_irms", "prev_power", "prev_irms",
+                 "noise_power", "noise_irms", "decision", "decided_at")
+
+    def __init__(self):
+        self.ref_power = None
+        self.ref_irms = None
+        self.prev_power = None
+        self.prev_irms = None
+        self.noise_power = 0.0
+        self.noise_irms = 0.0
+        self.decision = None
+        self.decided_at = 0.0
+
+
+class ChangeDetector:
+    """
+    Cheap per-meter step-change detector that sits in front of NILM inference.
+    A reading only needs the model when Power or Irms moved away from the values
+    seen at the last inference by more than k times the meter's rolling noise
+    (an EWMA of |delta| between consecutive readings), or when the last decision
+    is older than max_staleness. Otherwise the last decision is reused.
+    """
+    def __init__(self, k_sigma: float = 4.0, min_power_step: float = CHANGE_MIN_POWER_STEP,
+                 min_current_step: float = CHANGE_MIN_CURRENT_STEP,
+                 max_staleness: float = CHANGE_MAX_STALENESS, noise_alpha: float = 0.1):
+        self.k_sigma = k_sigma
+        self.min_power_step = min_power_step
+        self.min_current_step = min_current_step
+        self.max_staleness = max_staleness
+        self.noise_alpha = noise_alpha
+        self._meters: Dict[str, _MeterState] = {}
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.skipped = 0
+        self.reasons: Dict[str, int] = {}
+
+    def check(self, key: str, reading: dict, now: Optional[float] = None) -> Tuple[bool, str]:
+        """
+        Decide whether `reading` needs a fresh inference. Returns (infer, reason).
+        Non-finite Power or Irms gives (True, "invalid") without touching the meter's state.
+        """
+        now = time.time() if now is None else now
+        power = reading.get('Power', 0.0)
+        irms = reading.get('Irms', 0.0)
+
+        with self._lock:
+            if not (np.isfinite(power) and np.isfinite(irms)):
+                # Leave the meter's state alone; the data-quality gate decides what to do with it
+                self.evaluated += 1
+                self.reasons["invalid"] = self.reasons.get("invalid", 0) + 1
+                return True, "invalid"
+
+            state = self._meters.get(key)
+            if state is None:
+                state = self._meters[key] = _MeterState()
+
+            # Rolling noise from consecutive readings
+            if state.prev_power is not None:
+                a = self.noise_alpha
+                state.noise_power = (1 - a) * state.noise_power + a * abs(power - state.prev_power)
+                state.noise_irms = (1 - a) * state.noise_irms + a * abs(irms - state.prev_irms)
+            state.prev_power = power
+            state.prev_irms = irms
+
+            if state.decision is None:
+                reason = "no_decision"
+            elif now - state.decided_at > self.max_staleness:
+                reason = "stale"
+            elif abs(power - state.ref_power) > max(self.min_power_step, self.k_sigma * state.noise_power):
+                reason = "power_step"
+            elif abs(irms - state.ref_irms) > max(self.min_current_step, self.k_sigma * state.noise_irms):
+                reason = "current_step"
+            else:
+                reason = "unchanged"
+
+            self.evaluated += 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            if reason == "unchanged":
+                self.skipped += 1
+                return False, reason
+            return True, reason
+
+    def record(self, key: str, reading: dict, decision, now: Optional[float] = None):
+        """
+        Store the decision of a fresh inference and the load signature it was made on.
+        """
+        with self._lock:
+            state = self._meters.get(key)
+            if state is None:
+                state = self._meters[key] = _MeterState()
+            state.ref_power = reading.get('Power', 0.0)
+            state.ref_irms = reading.get('Irms', 0.0)
+            state.decision = decision
+            state.decided_at = time.time() if now is None else now
+
+    def last_decision(self, key: str):
+        state = self._meters.get(key)
+        return state.decision if state else None
+
+    def reset(self, key: str):
+        """
+        Forget the last decision of one meter, forcing its next reading through the model.
+        """
+        with self._lock:
+            self._meters.pop(key, None)
+
+    _FLOATS = ("ref_power", "ref_irms", "prev_power", "prev_irms", "noise_power", "noise_irms", "decided_at")
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            meters = list(self._meters.items())
+        return {
+            "meters": str_array(k for k, _ in meters),
+            "values": np.array([[np.nan if getattr(s, f) is None else getattr(s, f) for f in self._FLOATS]
+                                for _, s in meters], dtype=float).reshape(-1, len(self._FLOATS)),
+            "decisions": bits_array([s.decision for _, s in meters], 3),
+        }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        restored = {}
+        for key, values, bits in zip(state["meters"], state["values"], state["decisions"]):
+            meter = _MeterState()
+            for field, value in zip(self._FLOATS, values.tolist()):
+                setattr(meter, field, None if np.isnan(value) else value)
+            decision = bits_value(bits)
+            meter.decision = [decision] if decision is not None else None
+            restored[str(key)] = meter
+        with self._lock:
+            self._meters.update(restored)
+
+    def stats(self) -> dict:
+        return {
+            "meters": len(self._meters),
+            "evaluated": self.evaluated,
+            "skipped": self.skipped,
+            "skip_rate": self.skipped / self.evaluated if self.evaluated else 0.0,
+            "reasons": dict(self.reasons),
+        }
@@ -0,0 +1,233 @@
+import os
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from services.snapshot_service import str_array
+from services.timestamps import timestamp_seconds
+
+# Plausible ranges of a single-phase meter reading
+DQ_VRMS_MIN = float(os.getenv("DQ_VRMS_MIN", "90"))
+DQ_VRMS_MAX = float(os.getenv("DQ_VRMS_MAX", "300"))
+DQ_IRMS_MAX = float(os.getenv("DQ_IRMS_MAX", "32"))
+DQ_POWER_MAX = float(os.getenv("DQ_POWER_MAX", "7500"))
+# Negative Power/Irms down to this (sensor offset) is clamped to 0 instead of rejected
+DQ_NEGATIVE_TOLERANCE = float(os.getenv("DQ_NEGATIVE_TOLERANCE", "1.0"))
+# Allowed backwards step of the cumulative kWh counter (float rounding on the meter)
+DQ_KWH_TOLERANCE = float(os.getenv("DQ_KWH_TOLERANCE", "0.001"))
+
+# Start of year 9999, the last one datetime.fromtimestamp can represent
+_MAX_EPOCH_SECONDS = 253370764800.0
+
+FIELDS = ('Irms', 'Power', 'Vrms', 'kWh')
+_I, _P, _V, _K = range(4)
+
+
+class QualityReport:
+    """
+    Outcome of validating one window: counts per check and whether the latest
+    reading survived (if not, the caller should skip all model and Firebase work).
+    """
+    def __init__(self):
+        self.received = 0
+        self.kept = 0
+        self.latest_rejected = False
+        self.counts: Dict[str, int] = {}
+
+    def add(self, reason: str, n: int):
+        if n:
+            self.counts[reason] = self.counts.get(reason, 0) + int(n)
+
+    def to_dict(self) -> dict:
+        return {"received": self.received, "kept": self.kept,
+                "latest_rejected": self.latest_rejected, "counts": dict(self.counts)}
+
+
+class DataQualityGate:
+    """
+    Vectorized validation of a reading window before it reaches the models.
+
+    Readings with duplicate or out-of-order timestamps are dropped. Slightly
+    negative Power/Irms is clamped to 0. Missing, non-finite or out-of-range
+    fields, and kWh that runs backwards, are imputed from the last known-good
+    value of the meter (earlier in the window, or from previous windows). A
+    reading is rejected when more than one of Power/Vrms/Irms is bad, or when a
+    bad field has no known-good value to impute from. Consecutive windows
+    overlap, so only readings newer than the last validated one are counted.
+    """
+    def __init__(self, vrms_range=(DQ_VRMS_MIN, DQ_VRMS_MAX), irms_max: float = DQ_IRMS_MAX,
+                 power_max: float = DQ_POWER_MAX, negative_tolerance: float = DQ_NEGATIVE_TOLERANCE,
+                 kwh_tolerance: float = DQ_KWH_TOLERANCE):
+        self.vrms_min, self.vrms_max = vrms_range
+        self.irms_max = irms_max
+        self.power_max = power_max
+        self.negative_tolerance = negative_tolerance
+        self.kwh_tolerance = kwh_tolerance
+        self._last_good: Dict[str, Tuple[np.ndarray, float]] = {}  # meter -> (values, timestamp)
+        self._lock = threading.Lock()
+        self.windows = 0
+        self.short_circuited = 0
+        self.totals: Dict[str, int] = {}
+
+    def check_reading(self, reading: dict) -> bool:
+        """
+        Cheap plausibility check of a single reading (no imputation).
+        """
+        try:
+            p, v, i = float(reading.get('Power')), float(reading.get('Vrms')), float(reading.get('Irms'))
+        except (TypeError, ValueError):
+            return False
+        return bool(self.valid_mask(np.array([i]), np.array([p]), np.array([v]))[0])
+
+    def valid_mask(self, irms: np.ndarray, power: np.ndarray, vrms: np.ndarray,
+                   kwh: Optional[np.ndarray] = None, timestamp: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Range check over whole columns (bulk uploads); NaN fails. kWh must be finite
+        and epoch-second timestamps representable as datetimes, when given.
+        """
+        mask = ((vrms >= self.vrms_min) & (vrms <= self.vrms_max)
+                & (power >= -self.negative_tolerance) & (power <= self.power_max)
+                & (irms >= -self.negative_tolerance) & (irms <= self.irms_max))
+        if kwh is not None:
+            mask &= np.isfinite(kwh)
+        if timestamp is not None:
+            mask &= (timestamp >= 0) & (timestamp < _MAX_EPOCH_SECONDS)
+        return mask
+
+    def count(self, reason: str, n: int):
+        with self._lock:
+            self.totals[reason] = self.totals.get(reason, 0) + int(n)
+
+    def validate(self, readings: List[dict], meter_key: str = "default") -> Tuple[List[dict], QualityReport]:
+        """
+        Validate a window (oldest first). Returns the cleaned readings and a report.
+        """
+        report = QualityReport()
+        report.received = n = len(readings)
+        if n == 0:
+            return [], report
+
+        values = np.full((n, 4), np.nan)
+        for row, reading in enumerate(readings):
+            for col, field in enumerate(FIELDS):
+                try:
+                    values[row, col] = float(reading.get(field))
+                except (TypeError, ValueError):
+                    pass
+        timestamps = np.array([timestamp_seconds(r.get('timestamp')) for r in readings])
+
+        with self._lock:
+            last_good = self._last_good.get(meter_key)
+        # Windows overlap; only readings newer than the last validated one are counted
+        last_ts = last_good[1] if last_good else -np.inf
+        unparsed = np.isnan(timestamps)
+        new = unparsed | (timestamps > last_ts)
+
+        # 1. Timestamps: drop duplicates and anything older than an earlier reading of the window
+        prior_max = np.maximum.accumulate(np.concatenate([[-np.inf], np.where(unparsed, -np.inf, timestamps)]))[:-1]
+        duplicate = ~unparsed & (timestamps == prior_max)
+        out_of_order = ~unparsed & (timestamps < prior_max)
+        keep = ~(duplicate | out_of_order | unparsed)
+        report.add("duplicate_timestamp", (new & duplicate).sum())
+        report.add("out_of_order", (new & out_of_order).sum())
+        report.add("bad_timestamp", unparsed.sum())
+
+        # 2. Ranges, with small negative offsets clamped
+        p, v, i = values[:, _P], values[:, _V], values[:, _I]
+        clamp_p = (p < 0) & (p >= -self.negative_tolerance)
+        clamp_i = (i < 0) & (i >= -self.negative_tolerance)
+        values[clamp_p, _P] = 0.0
+        values[clamp_i, _I] = 0.0
+        report.add("clamped", (new & keep & (clamp_p | clamp_i)).sum())
+
+        bad = np.zeros((n, 4), dtype=bool)
+        bad[:, _P] = ~np.isfinite(p) | (p < 0) | (p > self.power_max)
+        bad[:, _V] = ~np.isfinite(v) | (v < self.vrms_min) | (v > self.vrms_max)
+        bad[:, _I] = ~np.isfinite(i) | (i < 0) | (i > self.irms_max)
+
+        # 3. kWh must not run backwards within the window, nor below the last
+        # known-good value for readings newer than it
+        k = np.where(keep, values[:, _K], np.nan)
+        running = np.fmax.accumulate(np.concatenate([[-np.inf], np.where(np.isfinite(k), k, -np.inf)]))[:-1]
+        bad[:, _K] = ~np.isfinite(k) | (k < running - self.kwh_tolerance)
+        if last_good:
+            bad[:, _K] |= new & (k < last_good[0][_K] - self.kwh_tolerance)
+        for col, field in enumerate(FIELDS):
+            report.add(f"bad_{field}", (new & keep & bad[:, col]).sum())
+
+        # 4. Reject readings with more than one bad electrical field
+        multi = keep & (bad[:, [_P, _V, _I]].sum(axis=1) > 1)
+        report.add("rejected_multiple_fields", (new & multi).sum())
+        keep &= ~multi
+
+        # 5. Impute the remaining bad fields: forward fill from the last good value
+        kept_values = values[keep]
+        kept_bad = bad[keep]
+        if len(kept_values):
+            seeded = np.vstack([last_good[0] if last_good else np.full(4, np.nan), kept_values])
+            seeded_bad = np.vstack([np.zeros(4, dtype=bool) if last_good else np.ones(4, dtype=bool), kept_bad])
+            rows = np.arange(len(seeded))[:, None]
+            source = np.maximum.accumulate(np.where(~seeded_bad, rows, 0), axis=0)
+            filled = np.take_along_axis(seeded, source, axis=0)[1:]
+            no_source = np.isnan(filled).any(axis=1)
+            kept_new = new[keep]
+            report.add("imputed", (kept_new & kept_bad.any(axis=1) & ~no_source).sum())
+            report.add("rejected_no_reference", (kept_new & no_source).sum())
+            keep_idx = np.flatnonzero(keep)[~no_source]
+            filled = filled[~no_source]
+        else:
+            keep_idx = np.zeros(0, dtype=int)
+            filled = kept_values
+
+        clean = []
+        for row, vals in zip(keep_idx, filled):
+            reading = dict(readings[row])
+            reading.update(zip(FIELDS, (float(x) for x in vals)))
+            clean.append(reading)
+
+        report.kept = len(clean)
+        report.latest_rejected = bool(not len(keep_idx) or keep_idx[-1] != n - 1)
+        with self._lock:
+            if len(keep_idx) and timestamps[keep_idx[-1]] >= last_ts:
+                self._last_good[meter_key] = (filled[-1].copy(), float(timestamps[keep_idx[-1]]))
+            self.windows += 1
+            if report.latest_rejected:
+                self.short_circuited += 1
+            for reason, count in report.counts.items():
+                self.totals[reason] = self.totals.get(reason, 0) + count
+        return clean, report
+
+    def forget(self, meter_key: str):
+        with self._lock:
+            self._last_good.pop(meter_key, None)
+
+    def latest_readings(self) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Last accepted reading of every meter: (meters, (N, 4) values in FIELDS order, epoch timestamps).
+        """
+        with self._lock:
+            last_good = list(self._last_good.items())
+        values = np.array([v for _, (v, _) in last_good], dtype=float).reshape(-1, len(FIELDS))
+        return [k for k, _ in last_good], values, np.array([t for _, (_, t) in last_good], dtype=float)
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            last_good = list(self._last_good.items())
+        return {
+            "meters": str_array(k for k, _ in last_good),
+            "values": np.array([v for _, (v, _) in last_good], dtype=float).reshape(-1, len(FIELDS)),
+            "timestamps": np.array([t for _, (_, t) in last_good], dtype=float),
+        }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        with self._lock:
+            for key, values, ts in zip(state["meters"], state["values"], state["timestamps"]):
+                self._last_good[str(key)] = (values.copy(), float(ts))
+
+    def stats(self) -> dict:
+        return {
+            "windows": self.windows,
+            "short_circuited": self.short_circuited,
+            "counts": dict(self.totals),
+        }
+
+data_quality_instance = DataQualityGate()
@@ -0,0 +1,234 @@
+import csv
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from services.timestamps import timestamp_key, timestamp_seconds
+
+
+class DataEvent:
+    """
+    Minimal stand-in for firebase_admin.db.Event, as seen by RealtimeProcessor.
+    scheduled_at is the (perf_counter) time the event was due, for latency accounting.
+    """
+    def __init__(self, event_type: str, path: str, data, scheduled_at: Optional[float] = None):
+        self.event_type = event_type
+        self.path = path
+        self.data = data
+        self.scheduled_at = scheduled_at
+
+
+class DataSource:
+    """
+    Where RealtimeProcessor gets its readings from: a change subscription per
+    user plus a fetch of the most recent readings.
+    """
+    def listen(self, user_id: str, callback: Callable):
+        """
+        Subscribe to new readings of a user. Returns an object with close().
+        """
+        raise NotImplementedError
+
+    def get_recent_readings(self, user_id: str, limit: int = 7) -> List[dict]:
+        raise NotImplementedError
+
+
+class FirebaseDataSource(DataSource):
+    """
+    Live RTDB readings under /SmartMeter/users/{user_id}/data.
+    """
+    def listen(self, user_id: str, callback: Callable):
+        from services.firebase_service import db  # ensures the app is initialized
+        return db.reference(f'/SmartMeter/users/{user_id}/data').listen(callback)
+
+    def get_recent_readings(self, user_id: str, limit: int = 7) -> List[dict]:
+        from services.firebase_service import get_recent_readings
+        return get_recent_readings(user_id, limit=limit)
+
+
+def to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+def _to_reading(raw: dict, key: Optional[str] = None) -> dict:
+    # Missing or unparsable fields become NaN, as in firebase_service.get_recent_readings
+    return {
+        'Irms': to_float(raw.get('Irms')),
+        'Power': to_float(raw.get('Power')),
+        'Vrms': to_float(raw.get('Vrms')),
+        'kWh': to_float(raw.get('kWh')),
+        'timestamp': key if key is not None else str(raw.get('timestamp', "")),
+    }
+
+def reading_from_event(event) -> Optional[dict]:
+    """
+    The newest reading carried by a listener event, or None if it holds none.
+    A single new reading arrives as data at /<timestamp_key>; the initial event
+    at '/' carries the whole data node.
+    """
+    data = event.data
+    if not isinstance(data, dict):
+        return None
+    if 'Power' in data:
+        key = event.path.strip('/') or None
+        return _to_reading(data, key if 'timestamp' not in data else None)
+    readings = [k for k, v in data.items() if isinstance(v, dict) and 'Power' in v]
+    if not readings:
+        return None
+    latest = max(readings)
+    return _to_reading(data[latest], latest)
+
+def load_recorded_streams(path: str) -> Dict[str, List[dict]]:
+    """
+    Load recorded readings from a JSON or CSV file into {user_id: [reading, ...]}.
+
+    JSON may be an RTDB export of one user's data node ({timestamp_key: reading}),
+    a list of readings, or {user_id: {"data": {...}}} as exported from /SmartMeter/users.
+    CSV needs Irms, Power, Vrms, kWh and timestamp columns and an optional user_id column.
+    """
+    streams: Dict[str, List[dict]] = {}
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                streams.setdefault(row.get('user_id') or "recorded", []).append(_to_reading(row))
+    else:
+        with open(path) as f:
+            raw = json.load(f)
+        if isinstance(raw, list):
+            streams["recorded"] = [_to_reading(r) for r in raw]
+        elif raw and all(isinstance(v, dict) and 'data' in v for v in raw.values()):
+            for user_id, node in raw.items():
+                streams[user_id] = [_to_reading(node['data'][k], k) for k in sorted(node['data'])]
+        else:
+            streams["recorded"] = [_to_reading(raw[k], k) for k in sorted(raw)]
+
+    for readings in streams.values():
+        readings.sort(key=lambda r: timestamp_seconds(r['timestamp']))
+    return streams
+
+
+def fan_out(base: List[dict], users: int, step: int = 7) -> Dict[str, List[dict]]:
+    """
+    Fan one recorded stream out to `users` simulated users (sim-0, sim-1, ...),
+    user u starting u * step readings into the recording. The readings before
+    that start are played after the end, with their timestamps moved forward by
+    the recording's length (plus one mean reading interval), so every stream
+    stays in time order.
+    """
+    if not base:
+        return {f"sim-{u}": [] for u in range(users)}
+    stamps = [timestamp_seconds(r['timestamp']) for r in base]
+    span = stamps[-1] - stamps[0]
+    period = span + (span / (len(base) - 1) if len(base) > 1 else 1.0)
+    wrapped = [dict(r, timestamp=timestamp_key(datetime.fromtimestamp(ts + period)))
+               for r, ts in zip(base, stamps)]
+    streams = {}
+    for u in range(users):
+        shift = (u * step) % len(base)
+        streams[f"sim-{u}"] = base[shift:] + wrapped[:shift]
+    return streams
+
+
+class _Subscription:
+    def __init__(self, source: "ReplayDataSource", user_id: str):
+        self.source = source
+        self.user_id = user_id
+
+    def close(self):
+        self.source._callbacks.pop(self.user_id, None)
+
+
+class ReplayDataSource(DataSource):
+    """
+    Replays recorded reading streams to subscribed processors.
+
+    speed=1.0 keeps the recorded spacing, speed=N plays N times faster and
+    speed=0 replays as fast as possible. With retime=True each reading's
+    timestamp is rewritten to the wall clock at emit time, so freshness checks
+    behave as they would on live data.
+    """
+    def __init__(self, streams: Dict[str, List[dict]], speed: float = 1.0, retime: bool = True, window: int = 20):
+        self.streams = streams
+        self.speed = speed
+        self.retime = retime
+        self._windows: Dict[str, deque] = {u: deque(maxlen=window) for u in streams}
+        self._callbacks: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+        self.emitted = 0
+        self.lag_seconds = 0.0
+        self.latencies: List[float] = []  # due time -> callback finished, per event
+
+    @classmethod
+    def from_file(cls, path: str, users: Optional[int] = None, **kwargs) -> "ReplayDataSource":
+        """
+        Load a recording; with `users`, fan the first stream out to that many
+        simulated users (sim-0, sim-1, ...), each starting at a different offset.
+        """
+        streams = load_recorded_streams(path)
+        if users:
+            streams = fan_out(next(iter(streams.values())), users)
+        return cls(streams, **kwargs)
+
+    def listen(self, user_id: str, callback: Callable):
+        self._callbacks[user_id] = callback
+        return _Subscription(self, user_id)
+
+    def get_recent_readings(self, user_id: str, limit: int = 7) -> List[dict]:
+        with self._lock:
+            window = self._windows.get(user_id)
+            return list(window)[-limit:] if window else []
+
+    def _schedule(self):
+        """
+        Merge all streams into one (offset, user_id, reading) schedule. Each user's
+        stream starts at offset 0 so simulated users run concurrently.
+        """
+        events = []
+        for user_id, readings in self.streams.items():
+            if not readings:
+                continue
+            t0 = timestamp_seconds(readings[0]['timestamp'])
+            for reading in readings:
+                events.append((timestamp_seconds(reading['timestamp']) - t0, user_id, reading))
+        events.sort(key=lambda e: e[0])
+        return events
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> dict:
+        """
+        Replay every stream once on the calling thread. Returns a summary.
+        """
+        schedule = self._schedule()
+        start = time.perf_counter()
+        for offset, user_id, reading in schedule:
+            if stop_event is not None and stop_event.is_set():
+                break
+            due = start + (offset / self.speed if self.speed > 0 else 0.0)
+            now = time.perf_counter()
+            if due > now:
+                time.sleep(due - now)
+            elif self.speed > 0:
+                self.lag_seconds = max(self.lag_seconds, now - due)
+
+            reading = dict(reading)
+            if self.retime:
+                reading['timestamp'] = timestamp_key(datetime.now())
+            with self._lock:
+                self._windows[user_id].append(reading)
+
+            callback = self._callbacks.get(user_id)
+            if callback is not None:
+                scheduled_at = due if self.speed > 0 else time.perf_counter()
+                callback(DataEvent("put", f"/{reading['timestamp']}", reading, scheduled_at=scheduled_at))
+                self.latencies.append(time.perf_counter() - scheduled_at)
+            self.emitted += 1
+
+        return {
+            "events": self.emitted,
+            "users": len(self.streams),
+            "wall_seconds": time.perf_counter() - start,
+            "max_lag_seconds": self.lag_seconds,
+        }
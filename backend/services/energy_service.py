@@ -0,0 +1,199 @@
+import threading
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional
+from services.ml_service import DEVICE_LABELS, DEVICE_WATTS
+from services.snapshot_service import str_array, bits_array, bits_value
+from services.timestamps import reading_time
+
+# Energy not explained by an identified device (standby, meter self-consumption, ...)
+OTHER_DEVICE = "Other"
+
+PERIODS = {
+    # period: (bucket key format, buckets kept per user)
+    "hour": ("%Y-%m-%dT%H", 24 * 62),
+    "day": ("%Y-%m-%d", 400),
+    "month": ("%Y-%m", 36),
+}
+
+
+class _UserState:
+    __slots__ = ("last_kwh", "last_time", "last_power", "last_bits")
+
+    def __init__(self):
+        self.last_kwh = None
+        self.last_time = None
+        self.last_power = None
+        self.last_bits = None
+
+
+class EnergyAggregator:
+    """
+    Incremental kWh rollups per user and device.
+
+    Each reading contributes the energy consumed since the previous one (the
+    delta of the cumulative kWh counter, or Power x dt if the counter went
+    backwards). That energy is split across the bulbs that were ON during the
+    interval in proportion to their rated power against the measured average
+    power; the remainder goes to OTHER_DEVICE. Hour, day and month buckets are
+    updated in place, so each reading costs O(1) and range queries only touch
+    the requested user's buckets.
+    """
+    def __init__(self):
+        self._users: Dict[str, _UserState] = {}
+        # user_id -> period -> bucket key -> device -> kWh
+        self._totals: Dict[str, Dict[str, Dict[str, Dict[str, float]]]] = {}
+        self._lock = threading.Lock()
+        self.readings = 0
+
+    def _interval_energy(self, state: _UserState, kwh: float, power: float, when: datetime) -> float:
+        if state.last_kwh is None:
+            return 0.0
+        if np.isfinite(kwh):
+            delta = kwh - state.last_kwh
+            if delta >= 0:
+                return delta
+        # Counter reset, replaced meter or unreadable counter: estimate from power instead
+        seconds = max((when - state.last_time).total_seconds(), 0.0)
+        return (state.last_power + power) / 2.0 * seconds / 3600.0 / 1000.0
+
+    def _split(self, energy: float, avg_power: float, bits) -> Dict[str, float]:
+        shares = {}
+        if energy <= 0:
+            return shares
+        attributed = 0.0
+        if bits is not None and avg_power > 0:
+            on_watts = sum(w for w, b in zip(DEVICE_WATTS, bits) if b)
+            # Never attribute more than the measured energy
+            scale = min(1.0, avg_power / on_watts) if on_watts > 0 else 0.0
+            for label, watts, bit in zip(DEVICE_LABELS, DEVICE_WATTS, bits):
+                if bit:
+                    share = energy * watts * scale / avg_power
+                    shares[label] = share
+                    attributed += share
+        shares[OTHER_DEVICE] = max(energy - attributed, 0.0)
+        return shares
+
+    def observe(self, user_id: str, reading: dict, states=None):
+        """
+        Attribute the energy since the user's previous reading. The interval is
+        credited to the bulb states decided at its start (the previous decision).
+        """
+        kwh = reading.get('kWh', 0.0)
+        power = reading.get('Power', 0.0)
+        when = reading_time(reading)
+        bits = None
+        if states:
+            bits = [int(b) for b in (states[0] if isinstance(states[0], (list, tuple)) else states)]
+
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                state = self._users[user_id] = _UserState()
+
+            energy = self._interval_energy(state, kwh, power, when)
+            if energy > 0:
+                avg_power = (state.last_power + power) / 2.0
+                interval_bits = state.last_bits if state.last_bits is not None else bits
+                shares = self._split(energy, avg_power, interval_bits)
+                self._add(user_id, when, shares)
+
+            # A non-finite counter value keeps the previous one, so later deltas still work
+            if np.isfinite(kwh):
+                state.last_kwh = kwh
+            state.last_time = when
+            state.last_power = power
+            state.last_bits = bits
+            self.readings += 1
+
+    def _add(self, user_id: str, when: datetime, shares: Dict[str, float]):
+        periods = self._totals.get(user_id)
+        if periods is None:
+            periods = self._totals[user_id] = {p: {} for p in PERIODS}
+        total = sum(shares.values())
+        for period, (fmt, keep) in PERIODS.items():
+            buckets = periods[period]
+            key = when.strftime(fmt)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {}
+                if len(buckets) > keep:
+                    # Late or replayed readings open buckets out of order; keys sort by time
+                    del buckets[min(buckets)]
+            for device, kwh in shares.items():
+                bucket[device] = bucket.get(device, 0.0) + kwh
+            bucket["total"] = bucket.get("total", 0.0) + total
+
+    def get_range(self, user_id: str, period: str = "day", start: Optional[str] = None,
+                  end: Optional[str] = None, device: Optional[str] = None) -> List[dict]:
+        """
+        Buckets of `period` with start <= key <= end (keys compare as ISO-like strings,
+        so '2026-02' selects from February on for day buckets too).
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}'")
+        with self._lock:
+            buckets = dict(self._totals.get(user_id, {}).get(period, {}))
+
+        rows = []
+        for key in sorted(buckets):
+            if start and key < start[:len(key)]:
+                continue
+            if end and key[:len(end)] > end:
+                continue
+            bucket = buckets[key]
+            if device:
+                rows.append({"bucket": key, "device": device, "kwh": bucket.get(device, 0.0)})
+            else:
+                devices = {d: v for d, v in bucket.items() if d != "total"}
+                rows.append({"bucket": key, "devices": devices, "total_kwh": bucket.get("total", 0.0)})
+        return rows
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """
+        Last reading per user, and every bucket flattened to one row per
+        (user, period, bucket, device) in insertion order.
+        """
+        with self._lock:
+            users = list(self._users.items())
+            index = {u: i for i, (u, _) in enumerate(users)}
+            rows = [(index[u], p, key, device, kwh)
+                    for u, periods in self._totals.items() if u in index
+                    for p, period in enumerate(PERIODS)
+                    for key, bucket in periods[period].items()
+                    for device, kwh in bucket.items()]
+        return {
+            "users": str_array(u for u, _ in users),
+            "last": np.array([[np.nan if s.last_kwh is None else s.last_kwh,
+                               s.last_time.timestamp() if s.last_time else np.nan,
+                               np.nan if s.last_power is None else s.last_power] for _, s in users],
+                             dtype=float).reshape(-1, 3),
+            "last_bits": bits_array([s.last_bits for _, s in users], len(DEVICE_LABELS)),
+            "bucket_user": np.array([r[0] for r in rows], dtype=np.int32),
+            "bucket_period": np.array([r[1] for r in rows], dtype=np.int8),
+            "bucket_key": str_array(r[2] for r in rows),
+            "bucket_device": str_array(r[3] for r in rows),
+            "bucket_kwh": np.array([r[4] for r in rows], dtype=float),
+        }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        users = [str(u) for u in state["users"]]
+        periods = list(PERIODS)
+        with self._lock:
+            for user_id, (kwh, when, power), bits in zip(users, state["last"].tolist(), state["last_bits"]):
+                user = self._users[user_id] = _UserState()
+                user.last_kwh = None if np.isnan(kwh) else kwh
+                user.last_time = None if np.isnan(when) else datetime.fromtimestamp(when)
+                user.last_power = None if np.isnan(power) else power
+                user.last_bits = bits_value(bits)
+            for user_id in users:
+                self._totals[user_id] = {p: {} for p in PERIODS}
+            for u, p, key, device, kwh in zip(state["bucket_user"].tolist(), state["bucket_period"].tolist(),
+                                              state["bucket_key"].tolist(), state["bucket_device"].tolist(),
+                                              state["bucket_kwh"].tolist()):
+                self._totals[users[u]][periods[p]].setdefault(key, {})[device] = kwh
+
+    def stats(self) -> dict:
+        return {"users": len(self._users), "readings": self.readings}
+
+energy_service_instance = EnergyAggregator()
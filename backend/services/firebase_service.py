@@ -2,11 +2,22 @@ import firebase_admin
 from firebase_admin import credentials, db, firestore
 import os
 import json
+import time
+import random
+import threading
 from dotenv import load_dotenv
+from services.read_cache import ReadCache
+from services.data_sources import to_float
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Path of the maintained unread-alert counter (kept next to, not inside, /alerts)
+UNREAD_COUNT_PATH = '/alerts_meta/unread_count'
+
+# Device pages served from memory between Firestore reads
+devices_cache = ReadCache(float(os.getenv("DEVICES_CACHE_SECONDS", "10")))
+
 # Initialize Firebase Admin
 # Assuming serviceaccount.json is in the parent directory (backend root)
 cred_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "serviceaccount.json")
@@ -25,14 +36,20 @@ if not firebase_admin._apps:
 def get_firestore_client():
     return firestore.client()
 
-def get_firestore_devices():
+def get_firestore_devices(limit: int = None, after: str = None):
     """
-    Fetch all devices from Firestore 'devices' collection.
+    Fetch devices from Firestore 'devices' collection, ordered by document id.
+    With `limit`, returns one page starting after the document id `after`.
     """
     try:
         db_fs = get_firestore_client()
         devices_ref = db_fs.collection('devices')
-        docs = devices_ref.stream()
+        query = devices_ref
+        if limit is not None:
+            query = devices_ref.order_by('__name__').limit(limit)
+            if after:
+                query = query.start_after({'__name__': after})
+        docs = query.stream()
         
         devices = {}
         for doc in docs:
@@ -47,6 +64,7 @@ def get_firestore_devices():
 def update_firestore_device_status(device_name: str, status_str: str):
     """
     Find a device by name in Firestore and update its status.
+    Returns False if the update failed (an unknown device is not a failure).
     """
     try:
         db_fs = get_firestore_client()
@@ -63,11 +81,14 @@ def update_firestore_device_status(device_name: str, status_str: str):
             })
             print(f"Updated Firestore device '{device_name}' to {status_str}")
             updated = True
+            devices_cache.invalidate()
         
         if not updated:
             print(f"Device '{device_name}' not found in Firestore.")
+        return True
     except Exception as e:
         print(f"Error updating Firestore device {device_name}: {e}")
+        return False
 
 def get_realtime_data(path: str = "/"):
     try:
@@ -77,6 +98,29 @@ def get_realtime_data(path: str = "/"):
         print(f"Error fetching data from {path}: {e}")
         return None
 
+def readings_from_snapshot(snapshot: dict):
+    """
+    Turn a {timestamp_key: raw reading} snapshot into a sorted list of reading dicts.
+    """
+    # snapshot is a dict, we want a sorted list of reading objects
+    sorted_keys = sorted(snapshot.keys())
+    readings = []
+    for key in sorted_keys:
+        data = snapshot[key]
+        if not isinstance(data, dict):
+            continue
+        # Convert raw strings to floats; missing or unparsable fields become NaN
+        # so the data-quality gate can impute or reject them
+        reading = {
+            'Irms': to_float(data.get('Irms')),
+            'Power': to_float(data.get('Power')),
+            'Vrms': to_float(data.get('Vrms')),
+            'kWh': to_float(data.get('kWh')),
+            'timestamp': key # The key itself is the ISO-like timestamp
+        }
+        readings.append(reading)
+    return readings
+
 def get_recent_readings(user_id: str, limit: int = 7):
     """
     Fetch the latest N readings for a user from RTDB.
@@ -90,25 +134,53 @@ def get_recent_readings(user_id: str, limit: int = 7):
         if not snapshot:
             return []
             
-        # snapshot is a dict, we want a sorted list of reading objects
-        sorted_keys = sorted(snapshot.keys())
-        readings = []
-        for key in sorted_keys:
-            data = snapshot[key]
-            # Convert raw strings to floats, default to 0.0
-            reading = {
-                'Irms': float(data.get('Irms', 0)),
-                'Power': float(data.get('Power', 0)),
-                'Vrms': float(data.get('Vrms', 0)),
-                'kWh': float(data.get('kWh', 0)),
-                'timestamp': key # The key itself is the ISO-like timestamp
-            }
-            readings.append(reading)
-        return readings
+        return readings_from_snapshot(snapshot)
     except Exception as e:
         print(f"Error fetching recent readings for {user_id}: {e}")
         return []
 
+def fetch_recent_readings_many(user_ids, limit: int = 7):
+    """
+    Latest N readings for many users at once: {user_id: [reading, ...]}.
+    Reads fan out concurrently over the pooled REST client; users whose REST read
+    failed (or all of them, if REST is disabled) fall back to the Admin SDK.
+    """
+    from services.rtdb_client import rtdb_rest_client, RTDB_REST_ENABLED
+
+    user_ids = list(user_ids)
+    results = {}
+    if RTDB_REST_ENABLED and rtdb_rest_client.available:
+        try:
+            snapshots = rtdb_rest_client.run(rtdb_rest_client.recent_readings_many(user_ids, limit))
+            for user_id, snapshot in snapshots.items():
+                if snapshot is not None:
+                    results[user_id] = readings_from_snapshot(snapshot)
+        except Exception as e:
+            print(f"REST fan-out failed, falling back to SDK: {e}")
+
+    for user_id in user_ids:
+        if user_id not in results:
+            results[user_id] = get_recent_readings(user_id, limit)
+    return results
+
+def list_user_ids():
+    """
+    Ids of all users with meter data, via a shallow read (REST client, else Admin SDK).
+    """
+    from services.rtdb_client import rtdb_rest_client, RTDB_REST_ENABLED
+
+    if RTDB_REST_ENABLED and rtdb_rest_client.available:
+        try:
+            return rtdb_rest_client.run(rtdb_rest_client.user_ids())
+        except Exception as e:
+            print(f"REST user listing failed, falling back to SDK: {e}")
+    try:
+        users = db.reference('/SmartMeter/users').get(shallow=True)
+        return sorted(users) if isinstance(users, dict) else []
+    except Exception as e:
+        print(f"Error listing users: {e}")
+        return []
+
 def update_device_status(device_id: str, status: dict):
     try:
         ref = db.reference(f'/devices/{device_id}')
@@ -116,24 +188,161 @@ def update_device_status(device_id: str, status: dict):
     except Exception as e:
         print(f"Error updating device {device_id}: {e}")
 
+def update_device_statuses(statuses: dict):
+    """
+    Merge several device statuses ({device_id: fields}) in one multi-path update.
+    """
+    try:
+        updates = {f"devices/{device_id}/{field}": value
+                   for device_id, status in statuses.items() for field, value in status.items()}
+        db.reference('/').update(updates)
+        return True
+    except Exception as e:
+        print(f"Error updating {len(statuses)} devices: {e}")
+        return False
+
 def add_alert(alert: dict):
     try:
         ref = db.reference('/alerts')
         ref.push(alert)
+        if not alert.get('is_read'):
+            adjust_unread_alert_count(1)
     except Exception as e:
         print(f"Error adding alert: {e}")
 
+PUSH_CHARS = '-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+_push_lock = threading.Lock()
+_last_push_time = 0
+_last_rand_chars = [0] * 12
+
+def generate_push_key() -> str:
+    """
+    Chronologically ordered key in the same format as ref.push(), generated
+    locally so several alerts can be written in one multi-path update.
+    """
+    global _last_push_time
+    with _push_lock:
+        now = int(time.time() * 1000)
+        duplicate = now == _last_push_time
+        _last_push_time = now
+
+        time_chars = []
+        for _ in range(8):
+            time_chars.append(PUSH_CHARS[now % 64])
+            now //= 64
+        key = ''.join(reversed(time_chars))
+
+        if not duplicate:
+            for i in range(12):
+                _last_rand_chars[i] = random.randrange(64)
+        else:
+            # Same millisecond: increment the random part to keep keys ordered
+            i = 11
+            while i >= 0 and _last_rand_chars[i] == 63:
+                _last_rand_chars[i] = 0
+                i -= 1
+            _last_rand_chars[i] += 1
+        return key + ''.join(PUSH_CHARS[c] for c in _last_rand_chars)
+
+def add_alerts(alerts: dict):
+    """
+    Write several alerts ({push_key: alert}) under /alerts in one multi-path update.
+    """
+    try:
+        ref = db.reference('/alerts')
+        ref.update(alerts)
+        unread = sum(1 for a in alerts.values() if not a.get('is_read'))
+        if unread:
+            adjust_unread_alert_count(unread)
+        return True
+    except Exception as e:
+        print(f"Error adding {len(alerts)} alerts: {e}")
+        return False
+
+def get_alerts_page(limit: int = 50, before: str = None):
+    """
+    Up to `limit` alerts by push key, newest first, older than the push key `before`
+    (exclusive) when given. Uses order_by_key() with end_at/limit_to_last, so only
+    the requested page is transferred.
+    """
+    try:
+        query = db.reference('/alerts').order_by_key()
+        if before:
+            # end_at is inclusive, so fetch one extra and drop the cursor itself
+            snapshot = query.end_at(before).limit_to_last(limit + 1).get() or {}
+            snapshot.pop(before, None)
+        else:
+            snapshot = query.limit_to_last(limit).get() or {}
+        keys = sorted(snapshot, reverse=True)[:limit]
+        return {key: snapshot[key] for key in keys}
+    except Exception as e:
+        print(f"Error fetching alerts page: {e}")
+        return None
+
+def _count_unread_alerts() -> int:
+    alerts = db.reference('/alerts').get() or {}
+    return sum(1 for a in alerts.values() if isinstance(a, dict) and not a.get('is_read'))
+
+def adjust_unread_alert_count(delta: int):
+    """
+    Atomically add `delta` to the unread-alert counter. Called after the alerts
+    themselves were written, so a counter that does not exist yet is seeded by
+    counting /alerts (which already includes the change) instead.
+    """
+    def _update(current):
+        if current is None:
+            return _count_unread_alerts()
+        return max(current + delta, 0)
+
+    try:
+        db.reference(UNREAD_COUNT_PATH).transaction(_update)
+    except Exception as e:
+        print(f"Error updating unread alert count: {e}")
+
+def get_unread_alert_count():
+    """
+    Read the maintained unread-alert counter. If it has never been written,
+    count once from /alerts and store the result (in a transaction, so a
+    concurrent adjustment is not lost).
+    """
+    try:
+        count = db.reference(UNREAD_COUNT_PATH).get()
+        if count is None:
+            count = db.reference(UNREAD_COUNT_PATH).transaction(
+                lambda current: _count_unread_alerts() if current is None else current)
+        return int(count)
+    except Exception as e:
+        print(f"Error reading unread alert count: {e}")
+        return None
+
+class AlertNotFound(Exception):
+    pass
+
 def acknowledge_alert(alert_id: str):
     """
     Mark an alert as read in Realtime Database.
-    Note: alert_id here is the Firebase push key. If using custom IDs, 
-    we must find the child with that ID.
-    However, Alerts.tsx uses the key as ID (line 47).
+    alert_id is the Firebase push key (Alerts.tsx uses the key as ID). The
+    read-modify-write runs as one transaction on /alerts/<alert_id>, so
+    concurrent acknowledgements decrement the unread counter only once.
+    Returns True on success, None if the alert does not exist, False on errors.
     """
+    newly_read = []
+
+    def _mark(current):
+        newly_read.clear()
+        if not isinstance(current, dict):
+            raise AlertNotFound(alert_id)
+        if not current.get('is_read'):
+            newly_read.append(True)
+        return {**current, "is_read": True}
+
     try:
-        ref = db.reference(f'/alerts/{alert_id}')
-        ref.update({"is_read": True})
-        return True
+        db.reference(f'/alerts/{alert_id}').transaction(_mark)
+    except AlertNotFound:
+        return None
     except Exception as e:
         print(f"Error acknowledging alert {alert_id}: {e}")
         return False
+    if newly_read:
+        adjust_unread_alert_count(-1)
+    return True
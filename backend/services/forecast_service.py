@@ -0,0 +1,288 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional
+from services.snapshot_service import str_array
+from services.timestamps import reading_time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds between forecast materialization runs (0 disables the scheduler)
+FORECAST_INTERVAL_SECONDS = float(os.getenv("FORECAST_INTERVAL_SECONDS", "300"))
+# Materialized forecasts older than this are not served; the API runs live inference instead
+FORECAST_MAX_AGE_SECONDS = float(os.getenv("FORECAST_MAX_AGE_SECONDS", "900"))
+# Users who asked for a forecast stay in the materialization set this long
+FORECAST_ACTIVE_SECONDS = float(os.getenv("FORECAST_ACTIVE_SECONDS", "86400"))
+# Users per batched BiLSTM run
+FORECAST_BATCH_USERS = int(os.getenv("FORECAST_BATCH_USERS", "256"))
+# On-disk forecast table, rewritten after every run; empty keeps it in memory only
+FORECAST_TABLE_PATH = os.getenv("FORECAST_TABLE_PATH", os.path.join(BASE_DIR, "forecasts.npz"))
+
+HORIZON_HOURS = 24
+
+
+def forecast_features(reading: dict) -> List[float]:
+    """
+    BiLSTM features of a reading: ['Power', 'Vrms', 'Irms', 'PF', 'hour', 'is_daytime'].
+    """
+    power, vrms, irms = reading['Power'], reading['Vrms'], reading['Irms']
+    va = vrms * irms
+    hour = reading_time(reading).hour
+    return [power, vrms, irms, power / va if va > 0 else 1.0, hour, int(6 <= hour < 18)]
+
+
+def hourly_rows(features: np.ndarray) -> np.ndarray:
+    """
+    (N, 6) features -> (N * 24, 6): each row with its hour advanced by 0..23,
+    one row per hour of the next day.
+    """
+    rows = np.repeat(np.asarray(features, dtype=np.float64), HORIZON_HOURS, axis=0)
+    hours = (rows[:, 4] + np.tile(np.arange(HORIZON_HOURS), len(features))) % 24
+    rows[:, 4] = hours
+    rows[:, 5] = (hours >= 6) & (hours < 18)
+    return rows
+
+
+class ForecastScheduler:
+    """
+    Materialized energy forecasts per user, computed off the request path.
+
+    Every interval the latest reading of each active user (the users processed
+    by this node plus those who asked for a forecast recently) is read in one
+    bulk fetch, checked by the data-quality gate (users whose latest reading is
+    rejected are skipped), expanded into one row per hour of the next day, and
+    all rows are scored in batched BiLSTM runs. next_hour is the prediction for the
+    reading's own hour (what POST /predict/energy computes for it), next_day the
+    sum over the 24 hours. Forecasts are kept in memory with their computation
+    time and written to FORECAST_TABLE_PATH after every scheduled run, which is
+    loaded again at startup.
+    get() only returns forecasts younger than max_age_seconds; callers fall
+    back to live inference otherwise.
+    """
+    def __init__(self, ml_service=None, quality_gate=None, fetch: Callable = None,
+                 active_users: Callable[[], Iterable[str]] = None,
+                 path: Optional[str] = FORECAST_TABLE_PATH, interval_seconds: float = FORECAST_INTERVAL_SECONDS,
+                 max_age_seconds: float = FORECAST_MAX_AGE_SECONDS,
+                 active_seconds: float = FORECAST_ACTIVE_SECONDS, batch_users: int = FORECAST_BATCH_USERS):
+        self._ml_service = ml_service
+        self._quality_gate = quality_gate
+        self._fetch = fetch
+        self.active_users = active_users or (lambda: [])
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.active_seconds = active_seconds
+        self.batch_users = batch_users
+        self.table: Dict[str, dict] = {}
+        self._requested: Dict[str, float] = {}  # user id -> last request time
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run: Optional[dict] = None
+        self.counters = {"runs": 0, "materialized": 0, "served": 0, "missing": 0, "expired": 0,
+                         "no_readings": 0, "invalid": 0, "errors": 0}
+
+    @property
+    def ml_service(self):
+        if self._ml_service is None:
+            from services.ml_service import ml_service_instance
+            self._ml_service = ml_service_instance
+        return self._ml_service
+
+    @property
+    def quality_gate(self):
+        if self._quality_gate is None:
+            from services.data_quality import data_quality_instance
+            self._quality_gate = data_quality_instance
+        return self._quality_gate
+
+    def fetch(self, user_ids: List[str]) -> Dict[str, List[dict]]:
+        if self._fetch is None:
+            from services.firebase_service import fetch_recent_readings_many
+            self._fetch = fetch_recent_readings_many
+        return self._fetch(user_ids, limit=1)
+
+    def touch(self, user_id: str):
+        """
+        Keep a user in the materialization set (called on every forecast request).
+        """
+        self._requested[user_id] = time.time()
+
+    def _active(self) -> List[str]:
+        cutoff = time.time() - self.active_seconds
+        for user_id, at in list(self._requested.items()):
+            if at < cutoff:
+                self._requested.pop(user_id, None)
+        return list(dict.fromkeys(list(self.active_users()) + list(self._requested)))
+
+    def materialize(self, user_ids: Optional[Iterable[str]] = None) -> dict:
+        """
+        Compute and store forecasts for the given users (default: all active users,
+        which counts as a scheduled run).
+        """
+        scheduled = user_ids is None
+        user_ids = self._active() if scheduled else list(user_ids)
+        t0 = time.perf_counter()
+        readings = self.fetch(user_ids) if user_ids else {}
+        fetch_ms = (time.perf_counter() - t0) * 1000.0
+        users, features, stamps = [], [], []
+        for user_id in user_ids:
+            window = readings.get(user_id)
+            if not window:
+                self.counters["no_readings"] += 1
+                continue
+            # NaN or out-of-range values would fail the whole batch (and the request behind it)
+            clean, quality = self.quality_gate.validate(window, user_id)
+            row = forecast_features(clean[-1]) if clean and not quality.latest_rejected else None
+            if row is None or not np.all(np.isfinite(row)):
+                self.counters["invalid"] += 1
+                continue
+            users.append(user_id)
+            features.append(row)
+            stamps.append(clean[-1].get('timestamp', ""))
+
+        model_ms = 0.0
+        for start in range(0, len(users), self.batch_users):
+            chunk = np.array(features[start:start + self.batch_users])
+            t1 = time.perf_counter()
+            try:
+                hourly = self.ml_service.predict_energy_batch(hourly_rows(chunk)).reshape(len(chunk), HORIZON_HOURS)
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"[ForecastScheduler] Batch of {len(chunk)} users failed: {e}")
+                continue
+            model_ms += (time.perf_counter() - t1) * 1000.0
+            now = time.time()
+            with self._lock:
+                for i, user_id in enumerate(users[start:start + self.batch_users]):
+                    self.table[user_id] = {
+                        "next_hour": float(hourly[i, 0]),
+                        "next_day": float(hourly[i].sum()),
+                        "hourly": hourly[i].tolist(),
+                        "computed_at": now,
+                        "reading_timestamp": stamps[start + i],
+                    }
+            self.counters["materialized"] += len(chunk)
+
+        run = {"at": time.time(), "users": len(users), "fetch_ms": fetch_ms, "model_ms": model_ms,
+               "total_ms": (time.perf_counter() - t0) * 1000.0}
+        if scheduled:
+            self.counters["runs"] += 1
+            self.last_run = run
+        return run
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """
+        The user's materialized forecast with its age, or None if missing or expired.
+        """
+        entry = self.table.get(user_id)
+        if entry is None:
+            self.counters["missing"] += 1
+            return None
+        age = time.time() - entry["computed_at"]
+        if age > self.max_age_seconds:
+            self.counters["expired"] += 1
+            return None
+        self.counters["served"] += 1
+        return {**entry, "age_seconds": age}
+
+    def forecast(self, user_id: str) -> Optional[dict]:
+        """
+        Materialized forecast, or one computed live for this user when missing or expired.
+        """
+        self.touch(user_id)
+        entry = self.get(user_id)
+        if entry is not None:
+            return {**entry, "materialized": True}
+        self.materialize([user_id])
+        entry = self.table.get(user_id)
+        return {**entry, "age_seconds": time.time() - entry["computed_at"], "materialized": False} if entry else None
+
+    # --- persistence ----------------------------------------------------------
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            users = list(self.table)
+            entries = [self.table[u] for u in users]
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, users=str_array(users),
+                     hourly=np.array([e["hourly"] for e in entries], dtype=np.float64).reshape(-1, HORIZON_HOURS),
+                     computed_at=np.array([e["computed_at"] for e in entries], dtype=np.float64),
+                     reading_timestamp=str_array(e["reading_timestamp"] for e in entries),
+                     requested_users=str_array(self._requested),
+                     requested_at=np.array(list(self._requested.values()), dtype=np.float64))
+        os.replace(tmp, self.path)
+
+    def load(self) -> int:
+        """
+        Load the forecast table of the previous run. Returns the number of forecasts
+        still within the staleness bound.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                state = {key: data[key] for key in data.files}
+        except Exception as e:
+            print(f"[ForecastScheduler] Could not read {self.path}: {e}")
+            return 0
+        with self._lock:
+            for user_id, hourly, at, stamp in zip(state["users"], state["hourly"], state["computed_at"],
+                                                  state["reading_timestamp"]):
+                self.table[str(user_id)] = {"next_hour": float(hourly[0]), "next_day": float(hourly.sum()),
+                                            "hourly": hourly.tolist(), "computed_at": float(at),
+                                            "reading_timestamp": str(stamp)}
+        for user_id, at in zip(state["requested_users"], state["requested_at"]):
+            self._requested.setdefault(str(user_id), float(at))
+        fresh = sum(1 for e in self.table.values() if time.time() - e["computed_at"] <= self.max_age_seconds)
+        print(f"[ForecastScheduler] Loaded {len(self.table)} forecasts ({fresh} fresh) from {self.path}")
+        return fresh
+
+    # --- scheduling -----------------------------------------------------------
+
+    def _loop(self):
+        while True:
+            try:
+                self.materialize()
+                self.save()
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"[ForecastScheduler] Materialization failed: {e}")
+            if self._stop.wait(self.interval_seconds):
+                return
+
+    def start(self):
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="forecasts", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+        try:
+            self.save()
+        except Exception as e:
+            print(f"[ForecastScheduler] Could not save {self.path}: {e}")
+
+    def stats(self) -> dict:
+        now = time.time()
+        ages = [now - e["computed_at"] for e in self.table.values()]
+        return {
+            **self.counters,
+            "forecasts": len(self.table),
+            "fresh": sum(1 for a in ages if a <= self.max_age_seconds),
+            "requested_users": len(self._requested),
+            "oldest_age_seconds": max(ages) if ages else None,
+            "last_run": self.last_run,
+        }
+
+forecast_service_instance = ForecastScheduler()
@@ -0,0 +1,103 @@
+"""
+Columnar binary format for bulk reading uploads (Content-Type: application/x-sem-readings).
+
+All integers and floats are little-endian; every section starts on an 8-byte boundary.
+
+    header   16 bytes   magic b"SEMR", version u8 (=1), reserved u8 x3,
+                        n_meters u32, n_readings u32
+    meters              n_meters x (u16 byte length + UTF-8 meter/user id), zero-padded
+    columns             meter u32[n]      index into the meter table
+                        timestamp f64[n]  epoch seconds
+                        Irms f32[n], Power f32[n], Vrms f32[n]
+                        kWh f64[n]        cumulative, kept in double precision
+
+Decoding does not copy the columns: they are numpy views into the request body.
+"""
+import struct
+import numpy as np
+from typing import List, Sequence
+
+CONTENT_TYPE = "application/x-sem-readings"
+MAGIC = b"SEMR"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sB3xII")
+_COLUMNS = (
+    ("meter", np.dtype("<u4")),
+    ("timestamp", np.dtype("<f8")),
+    ("Irms", np.dtype("<f4")),
+    ("Power", np.dtype("<f4")),
+    ("Vrms", np.dtype("<f4")),
+    ("kWh", np.dtype("<f8")),
+)
+
+
+def _pad(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class ReadingBatch:
+    """
+    Decoded upload: meter_ids plus one numpy array per column, all of length n.
+    """
+    def __init__(self, meter_ids: List[str], columns: dict):
+        self.meter_ids = meter_ids
+        self.meter = columns["meter"]
+        self.timestamp = columns["timestamp"]
+        self.Irms = columns["Irms"]
+        self.Power = columns["Power"]
+        self.Vrms = columns["Vrms"]
+        self.kWh = columns["kWh"]
+
+    def __len__(self):
+        return len(self.meter)
+
+
+def encode_readings(meter_ids: Sequence[str], meter, timestamp, irms, power, vrms, kwh) -> bytes:
+    """
+    Pack readings into the wire format. `meter` holds indices into `meter_ids`.
+    """
+    n = len(meter)
+    parts = [_HEADER.pack(MAGIC, VERSION, len(meter_ids), n)]
+    table = b"".join(struct.pack("<H", len(m.encode())) + m.encode() for m in meter_ids)
+    parts.append(table + b"\0" * (_pad(len(table)) - len(table)))
+    for (_, dtype), values in zip(_COLUMNS, (meter, timestamp, irms, power, vrms, kwh)):
+        column = np.ascontiguousarray(values, dtype=dtype).tobytes()
+        if len(column) != n * dtype.itemsize:
+            raise ValueError("All columns must have the same length")
+        parts.append(column + b"\0" * (_pad(len(column)) - len(column)))
+    return b"".join(parts)
+
+
+def decode_readings(buf: bytes) -> ReadingBatch:
+    """
+    Parse an upload. Raises ValueError when the payload is malformed.
+    """
+    if len(buf) < _HEADER.size:
+        raise ValueError("Payload shorter than header")
+    magic, version, n_meters, n = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported payload (magic={magic!r}, version={version})")
+
+    offset = _HEADER.size
+    meter_ids = []
+    for _ in range(n_meters):
+        if offset + 2 > len(buf):
+            raise ValueError("Truncated meter table")
+        (length,) = struct.unpack_from("<H", buf, offset)
+        offset += 2
+        meter_ids.append(bytes(buf[offset:offset + length]).decode())
+        offset += length
+    offset = _HEADER.size + _pad(offset - _HEADER.size)
+
+    columns = {}
+    for name, dtype in _COLUMNS:
+        size = n * dtype.itemsize
+        if offset + size > len(buf):
+            raise ValueError(f"Truncated column {name}")
+        columns[name] = np.frombuffer(buf, dtype=dtype, count=n, offset=offset)
+        offset += _pad(size)
+
+    if n and int(columns["meter"].max()) >= n_meters:
+        raise ValueError("Meter index out of range")
+    return ReadingBatch(meter_ids, columns)
@@ -1,9 +1,26 @@
 import os
+import hashlib
 import joblib
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from typing import List
+import time
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from services.model_registry import ModelRegistry
+from services.change_detector import ChangeDetector
+from services.sinks import StatusSink
+from services.outbox import outbox_instance
+from services.alert_service import AlertPipeline, alert_service_instance
+from services.tf_runtime import BiLSTMRuntime, configure_threads
+from services.timestamps import timestamp_key, parse_timestamp, reading_time
+from services.profiler import pipeline_tracer_instance
+from services.data_quality import DataQualityGate, data_quality_instance
+from services.baseline_service import BaselineProfiler, baseline_service_instance
+from services.snapshot_service import str_array
 
 # Paths to models
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,17 +32,617 @@ XGBOOST_MODEL_PATH = os.path.join(MODELS_DIR, "nilm_xgboost_model.pkl")
 BILSTM_SCALER_PATH = os.path.join(MODELS_DIR, "bilstm_scaler.pkl")
 ANOMALY_MODEL_PATH = os.path.join(MODELS_DIR, "energy_anomaly_model.pkl")
 ANOMALY_SCALER_PATH = os.path.join(MODELS_DIR, "anomaly_scaler.pkl")
+# Random-forest device classifier (optional; the engine stays disabled without the model file)
+RF_MODEL_PATH = os.path.join(MODELS_DIR, "rf_device_classifier.pkl")
+RF_FEATURES_PATH = os.path.join(MODELS_DIR, "rf_features.pkl")
+RF_SCALER_PATH = os.path.join(MODELS_DIR, "rf_scaler.pkl")
+RF_LABEL_ENCODER_PATH = os.path.join(MODELS_DIR, "rf_label_encoder.pkl")
+# Per-state load averages of the behavior clustering, the default source of the signature engine
+KMEANS_BEHAVIOR_RESULTS_PATH = os.path.join(MODELS_DIR, "kmeans_behavior_results.csv")
+
+DEVICE_LABELS = ['12W Bulb', '15W Bulb', '7W Bulb']
+FIRESTORE_LABELS = ['Bulb 12W', 'Bulb 15W', 'Bulb 7W']
+DEVICE_WATTS = [12.0, 15.0, 7.0]  # Rated power of each device, same order
+
+# RF label encoder classes -> on/off bits in DEVICE_LABELS order (Bulb1 = 12W, Bulb2 = 15W, Bulb3 = 7W)
+STATE_LABEL_BITS = {
+    'All_OFF': [0, 0, 0],
+    'All_ON': [1, 1, 1],
+    'Bulb1_Bulb2': [1, 1, 0],
+    'Bulb1_Bulb3': [1, 0, 1],
+    'Bulb2_Bulb3': [0, 1, 1],
+    'Only_Bulb1': [1, 0, 0],
+    'Only_Bulb2': [0, 1, 0],
+    'Only_Bulb3': [0, 0, 1],
+}
+
+# Identification engine: 'auto' (benchmark/load driven), 'xgboost', 'rf', 'signature' or 'both'
+IDENTIFICATION_ENGINE = os.getenv("IDENTIFICATION_ENGINE", "auto")
+# Identification calls per second above which 'auto' switches to the cheapest engine
+IDENTIFICATION_HIGH_LOAD_EPS = float(os.getenv("IDENTIFICATION_HIGH_LOAD_EPS", "50"))
+# Signature engine: readings whose nearest signature is not clearly closer than the
+# second nearest (distance ratio above this), or farther than SIGNATURE_MAX_DISTANCE
+# (in units of the spread between signatures), are identified by XGBoost
+SIGNATURE_AMBIGUITY_RATIO = float(os.getenv("SIGNATURE_AMBIGUITY_RATIO", "0.5"))
+SIGNATURE_MAX_DISTANCE = float(os.getenv("SIGNATURE_MAX_DISTANCE", "1.0"))
+
+# Seconds between content-hash checks of registered artifacts (0 disables watching)
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "0"))
+
+def _warm_xgboost(model):
+    # Typical 12W-bulb reading: [Irms, Power, Vrms, kWh, DeltaP, VarP, PF]
+    sample = np.array([[0.055, 12.0, 230.0, 1.0, 0.0, 3.0, 0.95]] * 4)
+    for _ in range(3):
+        model.predict(sample)
+
+def _warm_anomaly(model):
+    # [Voltage, Global_intensity, power_w, hour]
+    sample = np.array([[230.0, 0.055, 12.0, 12]] * 4)
+    for _ in range(3):
+        model.predict(sample)
+        if hasattr(model, 'decision_function'):
+            model.decision_function(sample)
+
+
+def identification_features(readings: List[dict]) -> List[float]:
+    """
+    XGBoost features for the latest reading: ['Irms', 'Power', 'Vrms', 'kWh', 'DeltaP', 'VarP', 'PF'].
+    DeltaP is taken against the previous reading.
+    """
+    curr = readings[-1]
+    prev = readings[-2] if len(readings) > 1 else curr
+
+    irms = curr['Irms']
+    power = curr['Power']
+    vrms = curr['Vrms']
+    kwh = curr['kWh']
+    delta_p = power - prev['Power']
+
+    va = vrms * irms
+    var_p = np.sqrt(max(0, (va**2) - (power**2)))
+    pf = power / va if va > 0 else 1.0
+    return [irms, power, vrms, kwh, delta_p, var_p, pf]
+
+def identification_feature_matrix(irms, power, vrms, kwh, prev_power) -> np.ndarray:
+    """
+    Vectorized identification_features: one row of XGBoost features per reading,
+    with DeltaP taken against prev_power.
+    """
+    va = vrms * irms
+    var_p = np.sqrt(np.maximum(0.0, va ** 2 - power ** 2))
+    pf = np.divide(power, va, out=np.ones_like(va), where=va > 0)
+    return np.column_stack([irms, power, vrms, kwh, power - prev_power, var_p, pf])
+
+class IdentificationEngine:
+    """
+    Base class for NILM identification backends.
+    predict() takes a window of reading dicts (latest last) and returns the
+    on/off bits for DEVICE_LABELS as a (1, 3) array. Latency is recorded per call.
+    """
+    name = "base"
+
+    def __init__(self):
+        self.latencies = deque(maxlen=1000)
+        self.calls = 0
+
+    def is_ready(self) -> bool:
+        return False
+
+    def version(self) -> Optional[str]:
+        """
+        Version of the model(s) behind this engine's decisions.
+        """
+        return None
+
+    def features(self, readings: List[dict]) -> List[float]:
+        raise NotImplementedError
+
+    def _predict(self, readings: List[dict]) -> np.ndarray:
+        raise NotImplementedError
+
+    def predict(self, readings: List[dict]) -> np.ndarray:
+        t0 = time.perf_counter()
+        bits = self._predict(readings)
+        self.latencies.append(time.perf_counter() - t0)
+        self.calls += 1
+        return bits
+
+    def predict_offline(self, readings: List[dict]) -> np.ndarray:
+        """
+        Same bits as predict(), without counting towards the live call stats.
+        Used by benchmarks.
+        """
+        return self._predict(readings)
+
+    def stats(self) -> dict:
+        lat_ms = np.array(self.latencies) * 1000.0
+        return {
+            "ready": self.is_ready(),
+            "calls": self.calls,
+            "latency_ms_mean": float(lat_ms.mean()) if len(lat_ms) else None,
+            "latency_ms_p50": float(np.percentile(lat_ms, 50)) if len(lat_ms) else None,
+            "latency_ms_p95": float(np.percentile(lat_ms, 95)) if len(lat_ms) else None,
+        }
+
+class XGBoostEngine(IdentificationEngine):
+    name = "xgboost"
+
+    def __init__(self, registry: ModelRegistry):
+        super().__init__()
+        self.registry = registry
+
+    def is_ready(self) -> bool:
+        return self.registry.get("xgboost") is not None
+
+    def version(self) -> Optional[str]:
+        return self.registry.version("xgboost")
+
+    def features(self, readings: List[dict]) -> List[float]:
+        return identification_features(readings)
+
+    def _predict(self, readings: List[dict]) -> np.ndarray:
+        data = np.array(self.features(readings)).reshape(1, -1)
+        prediction = self.registry.get("xgboost").predict(data)
+        return prediction.reshape(1, -1)
+
+    def predict_matrix(self, features: np.ndarray) -> np.ndarray:
+        """
+        Bits for an (N, 7) identification_feature_matrix in one model call.
+        """
+        t0 = time.perf_counter()
+        bits = np.asarray(self.registry.get("xgboost").predict(features), dtype=int).reshape(len(features), -1)
+        self.latencies.append(time.perf_counter() - t0)
+        self.calls += 1
+        return bits
+
+class RandomForestEngine(IdentificationEngine):
+    """
+    Random-forest classifier over the 12 rf_features, predicting one of the
+    eight bulb-combination labels of rf_label_encoder.
+    """
+    name = "rf"
+
+    def __init__(self, registry: ModelRegistry):
+        super().__init__()
+        self.registry = registry
+        self.feature_names = None
+        self.scaler = None
+        self.label_bits = None
+
+    def load(self):
+        try:
+            self.feature_names = joblib.load(RF_FEATURES_PATH)
+            self.scaler = joblib.load(RF_SCALER_PATH)
+            encoder = joblib.load(RF_LABEL_ENCODER_PATH)
+            # Class index -> bits lookup, so prediction needs no inverse_transform
+            self.label_bits = np.array([STATE_LABEL_BITS[c] for c in encoder.classes_])
+        except Exception as e:
+            print(f"Error loading RF preprocessing artifacts: {e}")
+            return
+
+        if not os.path.exists(RF_MODEL_PATH):
+            print(f"RF classifier not found at {RF_MODEL_PATH}; RF engine disabled.")
+            return
+        try:
+            print(f"Loading RF classifier from {RF_MODEL_PATH}...")
+            self.registry.load("rf")
+            print("RF classifier loaded.")
+        except Exception as e:
+            print(f"Error loading RF classifier: {e}")
+
+    def is_ready(self) -> bool:
+        return self.label_bits is not None and self.registry.get("rf") is not None
+
+    def version(self) -> Optional[str]:
+        return self.registry.version("rf")
+
+    def features(self, readings: List[dict]) -> List[float]:
+        curr = readings[-1]
+        prev = readings[-2] if len(readings) > 1 else curr
+        power = curr['Power']
+        vrms = curr['Vrms']
+        irms = curr['Irms']
+        va = vrms * irms
+        pf = power / va if va > 0 else 1.0
+        var_p = np.sqrt(max(0, (va**2) - (power**2)))
+        hour = reading_time(curr).hour
+        powers = [r['Power'] for r in readings]
+        values = {
+            'Power': power, 'Vrms': vrms, 'Irms': irms, 'VA': va, 'PF': pf, 'VAR': var_p,
+            'hour': hour, 'is_daytime': int(6 <= hour < 18),
+            'Power_rolling_mean': float(np.mean(powers)),
+            'Power_rolling_std': float(np.std(powers)) if len(powers) > 1 else 0.0,
+            'Power_change': power - prev['Power'],
+            'Current_change': irms - prev['Irms'],
+        }
+        return [values[name] for name in self.feature_names]
+
+    def _predict(self, readings: List[dict]) -> np.ndarray:
+        data = self.scaler.transform(np.array(self.features(readings)).reshape(1, -1))
+        label_idx = self.registry.get("rf").predict(data)
+        return self.label_bits[np.asarray(label_idx, dtype=int)].reshape(1, -1)
+
+class DualEngine(IdentificationEngine):
+    """
+    Runs a primary and a secondary engine on every call, returns the primary's
+    decision and counts disagreements (useful for shadowing a new engine).
+    """
+    name = "both"
+
+    def __init__(self, primary: IdentificationEngine, secondary: IdentificationEngine):
+        super().__init__()
+        self.primary = primary
+        self.secondary = secondary
+        self.compared = 0
+        self.disagreements = 0
+
+    def is_ready(self) -> bool:
+        return self.primary.is_ready()
+
+    def version(self) -> Optional[str]:
+        # The primary decides; the secondary only shadows it
+        return self.primary.version()
+
+    def features(self, readings: List[dict]) -> List[float]:
+        return self.primary.features(readings)
+
+    def _predict(self, readings: List[dict]) -> np.ndarray:
+        bits = self.primary.predict(readings)
+        if self.secondary.is_ready():
+            other = self.secondary.predict(readings)
+            self.compared += 1
+            if not np.array_equal(np.asarray(bits, dtype=int), np.asarray(other, dtype=int)):
+                self.disagreements += 1
+        return bits
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "compared": self.compared,
+            "disagreements": self.disagreements,
+        }
+
+class SignatureEngine(IdentificationEngine):
+    """
+    Nearest-signature lookup over the eight on/off combinations of the known bulbs.
+    Each combination has a centroid of (Power, Irms, PF, VAR), learned from labeled
+    readings or taken from the per-state averages of kmeans_behavior_results.csv.
+    A reading gets the bits of its nearest centroid (distance in units of the spread
+    between centroids). When the nearest and second-nearest centroids are about
+    equally close, or no centroid is close, the fallback engine (XGBoost) decides.
+    """
+    name = "signature"
+
+    def __init__(self, fallback: IdentificationEngine, ambiguity_ratio: float = SIGNATURE_AMBIGUITY_RATIO,
+                 max_distance: float = SIGNATURE_MAX_DISTANCE):
+        super().__init__()
+        self.fallback = fallback
+        self.ambiguity_ratio = ambiguity_ratio
+        self.max_distance = max_distance
+        # Row i is combination i: bits of DEVICE_LABELS as a binary number (12W bulb = MSB)
+        self.combo_bits = np.array([[(i >> s) & 1 for s in (2, 1, 0)] for i in range(8)])
+        self.centroids = np.full((8, 4), np.nan)
+        self.samples = np.zeros(8, dtype=int)
+        self.scale = np.ones(4)
+        self.source = None
+        self.lookups = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        return self.source is not None and self.fallback.is_ready()
+
+    def version(self) -> Optional[str]:
+        # Content hash of the centroids, plus the fallback model's version
+        with self._lock:
+            digest = hashlib.sha256(self.centroids.tobytes()).hexdigest()[:12]
+        return f"{digest}+{self.fallback.version()}"
+
+    @staticmethod
+    def signature_matrix(features: np.ndarray) -> np.ndarray:
+        # (Power, Irms, PF, VAR) columns of an identification_feature_matrix
+        return np.asarray(features, dtype=np.float64)[:, [1, 0, 6, 5]]
+
+    def _set_centroids(self, centroids: np.ndarray, samples: np.ndarray, source: str):
+        known = np.isfinite(centroids).all(axis=1)
+        spread = np.std(centroids[known], axis=0) if known.sum() > 1 else np.ones(4)
+        with self._lock:
+            self.centroids = centroids
+            self.samples = samples
+            self.scale = np.where(spread > 1e-9, spread, 1.0)
+            self.source = source
+
+    def load_csv(self, path: str = KMEANS_BEHAVIOR_RESULTS_PATH):
+        """
+        Centroids from the per-state averages of the behavior clustering results
+        (day and night rows of a state are weighted by their energy).
+        """
+        try:
+            df = pd.read_csv(path)
+        except Exception as e:
+            print(f"[SignatureEngine] Could not read {path}: {e}")
+            return
+        va = df['avg_voltage'] * df['avg_current']
+        power = df['avg_power']
+        sig = np.column_stack([power, df['avg_current'], np.where(va > 0, power / va, 1.0),
+                               np.sqrt(np.maximum(0.0, va ** 2 - power ** 2))])
+        weights = df['total_kwh'].clip(lower=0.01).to_numpy()
+        centroids = np.full((8, 4), np.nan)
+        samples = np.zeros(8, dtype=int)
+        for label, bits in STATE_LABEL_BITS.items():
+            rows = (df['state_label'] == label).to_numpy()
+            if rows.any():
+                combo = bits[0] * 4 + bits[1] * 2 + bits[2]
+                centroids[combo] = np.average(sig[rows], axis=0, weights=weights[rows])
+                samples[combo] = int(rows.sum())
+        self._set_centroids(centroids, samples, "kmeans_behavior_results")
+        print(f"[SignatureEngine] Loaded {int(np.isfinite(centroids).all(axis=1).sum())} signatures from {path}")
+
+    def fit(self, features: np.ndarray, bits: np.ndarray, min_samples: int = 5) -> dict:
+        """
+        Learn centroids from labeled readings: features is an (N, 7)
+        identification_feature_matrix, bits the (N, 3) true states. Combinations
+        with fewer than min_samples readings keep their previous centroid.
+        """
+        sig = self.signature_matrix(features)
+        combo = np.asarray(bits, dtype=int) @ np.array([4, 2, 1])
+        counts = np.bincount(combo, minlength=8)
+        sums = np.zeros((8, 4))
+        np.add.at(sums, combo, sig)
+        learned = counts >= min_samples
+        centroids = self.centroids.copy()
+        centroids[learned] = sums[learned] / counts[learned, None]
+        samples = np.where(learned, counts, self.samples)
+        self._set_centroids(centroids, samples, "labeled")
+        print(f"[SignatureEngine] Learned {int(learned.sum())} signatures from {len(combo)} labeled readings")
+        return {"readings": int(len(combo)), "learned": self.combo_bits[learned].tolist(),
+                "signatures": self.signatures()}
+
+    def lookup(self, features: np.ndarray):
+        """
+        Nearest-signature bits for an (N, 7) identification_feature_matrix, and
+        the mask of rows whose match is ambiguous.
+        """
+        with self._lock:
+            centroids, scale = self.centroids, self.scale
+        d = np.sqrt(np.nansum(((self.signature_matrix(features)[:, None, :] - centroids[None]) / scale) ** 2, axis=2))
+        d[:, ~np.isfinite(centroids).all(axis=1)] = np.inf
+        nearest = np.argsort(d, axis=1)[:, :2]
+        d1 = np.take_along_axis(d, nearest[:, :1], axis=1)[:, 0]
+        d2 = np.take_along_axis(d, nearest[:, 1:], axis=1)[:, 0]
+        ambiguous = (d1 > self.max_distance) | (d1 > self.ambiguity_ratio * d2)
+        return self.combo_bits[nearest[:, 0]], ambiguous
+
+    def features(self, readings: List[dict]) -> List[float]:
+        return identification_features(readings)
+
+    def _match(self, readings: List[dict]):
+        # (bits, whether the fallback decided)
+        bits, ambiguous = self.lookup(np.array([self.features(readings)]))
+        if ambiguous[0]:
+            return self.fallback._predict(readings), True
+        return bits.reshape(1, -1), False
+
+    def _predict(self, readings: List[dict]) -> np.ndarray:
+        bits, fell_back = self._match(readings)
+        self.lookups += 1
+        self.fallbacks += int(fell_back)
+        return bits
+
+    def predict_offline(self, readings: List[dict]) -> np.ndarray:
+        return self._match(readings)[0]
+
+    def predict_matrix(self, features: np.ndarray) -> np.ndarray:
+        """
+        Bits for an (N, 7) identification_feature_matrix: one lookup for all rows,
+        one fallback model call for the ambiguous ones.
+        """
+        t0 = time.perf_counter()
+        bits, ambiguous = self.lookup(features)
+        if ambiguous.any():
+            bits[ambiguous] = np.asarray(self.fallback.registry.get("xgboost").predict(features[ambiguous]),
+                                         dtype=int).reshape(int(ambiguous.sum()), -1)
+        self.lookups += len(features)
+        self.fallbacks += int(ambiguous.sum())
+        self.latencies.append(time.perf_counter() - t0)
+        self.calls += 1
+        return bits
+
+    def signatures(self) -> List[dict]:
+        return [{"bits": self.combo_bits[i].tolist(), "samples": int(self.samples[i]),
+                 "power": c[0], "irms": c[1], "pf": c[2], "var": c[3]}
+                for i, c in enumerate(self.centroids.tolist()) if np.isfinite(c).all()]
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        # Only learned signatures; the CSV ones are reloaded at startup
+        if self.source != "labeled":
+            return {}
+        return {"centroids": self.centroids.copy(), "samples": self.samples.copy()}
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        self._set_centroids(np.asarray(state["centroids"], dtype=np.float64),
+                            np.asarray(state["samples"], dtype=int), "labeled")
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "source": self.source,
+            "lookups": self.lookups,
+            "fallbacks": self.fallbacks,
+            "fallback_rate": self.fallbacks / self.lookups if self.lookups else None,
+        }
+
+class EngineSelector:
+    """
+    Chooses the identification engine per call.
+    benchmark() replays held-out reading windows through every ready engine and
+    records latency, and accuracy when labels are given; only a labelled run
+    changes the accurate/cheap engines. In 'auto' mode the most accurate engine
+    is used while there is spare capacity and the cheapest acceptable one once
+    the identification rate crosses the high-load threshold.
+    """
+    def __init__(self, engines: Dict[str, IdentificationEngine], reference: str = "xgboost",
+                 mode: str = IDENTIFICATION_ENGINE, high_load_eps: float = IDENTIFICATION_HIGH_LOAD_EPS,
+                 min_accuracy: float = 0.9):
+        self.engines = engines
+        self.reference = reference
+        self.mode = mode
+        self.high_load_eps = high_load_eps
+        self.min_accuracy = min_accuracy
+        self.results: Dict[str, dict] = {}
+        self.accurate = reference
+        self.cheap = reference
+        self._rate = 0.0
+        self._last_call = None
+        self._lock = threading.Lock()
+
+    def _record_call(self):
+        # Exponentially weighted calls/second across all users
+        now = time.perf_counter()
+        with self._lock:
+            if self._last_call is not None:
+                dt = max(now - self._last_call, 1e-6)
+                self._rate = 0.9 * self._rate + 0.1 * (1.0 / dt)
+            self._last_call = now
+
+    @property
+    def load_eps(self) -> float:
+        if self._last_call is None:
+            return 0.0
+        # Decay towards zero when calls stop arriving
+        idle = time.perf_counter() - self._last_call
+        return min(self._rate, 1.0 / idle) if idle > 0 else self._rate
+
+    def select(self) -> IdentificationEngine:
+        self._record_call()
+        if self.mode != "auto":
+            engine = self.engines.get(self.mode)
+            if engine is not None and engine.is_ready():
+                return engine
+            return self.engines[self.reference]
+
+        name = self.cheap if self.load_eps > self.high_load_eps else self.accurate
+        engine = self.engines.get(name)
+        if engine is None or not engine.is_ready():
+            engine = self.engines[self.reference]
+        return engine
+
+    def benchmark(self, windows: List[List[dict]], labels: Optional[List[List[int]]] = None) -> dict:
+        """
+        Replay reading windows through every ready single engine. With labels
+        (true bits of each window's latest reading), also measure accuracy and
+        pick the accurate/cheap engines for 'auto' mode; without labels only
+        latency is reported, since agreement with the reference engine would
+        always favour the reference itself. Benchmark calls are not counted in
+        the engines' live stats.
+        """
+        truth = None
+        if labels is not None:
+            truth = np.asarray(labels, dtype=int)
+            if truth.ndim != 2 or len(truth) != len(windows):
+                raise ValueError(f"Expected one row of bits per window ({len(windows)}), got shape {truth.shape}")
+        candidates = {n: e for n, e in self.engines.items() if e.is_ready() and not isinstance(e, DualEngine)}
+        results = {}
+        for name, engine in candidates.items():
+            preds = []
+            t0 = time.perf_counter()
+            for window in windows:
+                preds.append(np.asarray(engine.predict_offline(window), dtype=int).reshape(-1))
+            elapsed = time.perf_counter() - t0
+            results[name] = {"latency_ms_mean": elapsed * 1000.0 / max(len(windows), 1), "accuracy": None}
+            if truth is not None and len(preds):
+                results[name]["accuracy"] = float(np.mean(np.all(np.array(preds) == truth, axis=1)))
+
+        if truth is not None and results:
+            scored = {n: r for n, r in results.items() if r["accuracy"] is not None}
+            if scored:
+                self.accurate = max(scored, key=lambda n: (scored[n]["accuracy"], -scored[n]["latency_ms_mean"]))
+                acceptable = {n: r for n, r in scored.items() if r["accuracy"] >= self.min_accuracy} or scored
+                self.cheap = min(acceptable, key=lambda n: acceptable[n]["latency_ms_mean"])
+
+        self.results = results
+        print(f"[EngineSelector] Benchmark over {len(windows)} windows: {results}")
+        print(f"[EngineSelector] accurate={self.accurate}, cheap={self.cheap}")
+        return {
+            "windows": len(windows),
+            "labelled": labels is not None,
+            "engines": results,
+            "accurate_engine": self.accurate,
+            "cheap_engine": self.cheap,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "load_eps": self.load_eps,
+            "high_load_eps": self.high_load_eps,
+            "accurate_engine": self.accurate,
+            "cheap_engine": self.cheap,
+            "benchmark": self.results,
+            "engines": {n: e.stats() for n, e in self.engines.items()},
+        }
 
 class MLService:
     def __init__(self):
+        # Must run before TensorFlow executes its first op
+        configure_threads()
+        self.bilstm_model = None
+        self.bilstm_runtime: Optional[BiLSTMRuntime] = None # Compiled inference path of the BiLSTM
         self.bilstm_scaler = None
-        self.anomaly_model = None
         self.anomaly_scaler = None
-        self.bulb_history = {0: [], 1: [], 2: []} # Track last 10 states for each bulb
-        self.alerted_bulbs = set() # Track bulbs already alerted for fluctuation
+        self.registry = ModelRegistry(cache_size=3)
+        self.bulb_history = {} # meter key -> {bulb index: last 10 states}
+        self.sink: StatusSink = outbox_instance # Device statuses go through the write-behind outbox
+        self.alerts: AlertPipeline = alert_service_instance # Deduplicated, rate-limited alert dispatch
+        self.quality_gate: DataQualityGate = data_quality_instance # Validates reading windows before the models
+        self.baselines: BaselineProfiler = baseline_service_instance # Hour-of-day bands that pre-screen anomaly detection
         self.last_predict_features = None # Store features for rolling stats
+        self.decision_sources: Dict[str, tuple] = {} # meter key -> (engine, model version) of its last decision
         self.load_models()
 
+        xgb_engine = XGBoostEngine(self.registry)
+        rf_engine = RandomForestEngine(self.registry)
+        rf_engine.load()
+        self.signature_engine = SignatureEngine(xgb_engine)
+        self.signature_engine.load_csv()
+        self.change_detector = ChangeDetector()
+        self.engine_selector = EngineSelector({
+            "xgboost": xgb_engine,
+            "rf": rf_engine,
+            "signature": self.signature_engine,
+            "both": DualEngine(xgb_engine, rf_engine),
+        })
+        if MODEL_WATCH_INTERVAL > 0:
+            self.registry.start_watching(MODEL_WATCH_INTERVAL)
+
+    @property
+    def xgboost_model(self):
+        return self.registry.get("xgboost")
+
+    @property
+    def anomaly_model(self):
+        return self.registry.get("anomaly")
+
+    def model_version(self, name: str):
+        return self.registry.version(name)
+
+    def _record_source(self, meter_key: str, engine: Optional[IdentificationEngine]):
+        self.decision_sources[meter_key] = (engine.name, engine.version()) if engine is not None else (None, None)
+
+    def decision_source(self, user_id: Optional[str] = None) -> dict:
+        """
+        Engine and model version behind a meter's last identification decision
+        (both None for rule-based decisions: stale data or power below threshold).
+        """
+        engine, version = self.decision_sources.get(user_id or "default", (None, None))
+        return {"engine": engine, "model_version": version}
+
+    def reload_model(self, name: str, background: bool = True):
+        """
+        Load a changed artifact in the background and swap it in once warmed.
+        """
+        return self.registry.reload(name, background=background)
+
     def load_models(self):
         try:
             print(f"Loading BiLSTM model from {BILSTM_MODEL_PATH}...")
@@ -38,9 +655,22 @@ class MLService:
         except Exception as e:
             print(f"Error loading BiLSTM model: {e}")
 
+        if self.bilstm_model is not None:
+            try:
+                runtime = BiLSTMRuntime(self.bilstm_model)
+                runtime.warmup()
+                self.bilstm_runtime = runtime
+                print(f"BiLSTM runtime ready ({runtime.precision}, xla={runtime.xla}) in {runtime.warmup_seconds:.2f}s.")
+            except Exception as e:
+                print(f"Error preparing BiLSTM runtime, using model.predict: {e}")
+
+        self.registry.register("xgboost", XGBOOST_MODEL_PATH, joblib.load, warmup=_warm_xgboost)
+        self.registry.register("anomaly", ANOMALY_MODEL_PATH, joblib.load, warmup=_warm_anomaly)
+        self.registry.register("rf", RF_MODEL_PATH, joblib.load)
+
         try:
             print(f"Loading XGBoost model from {XGBOOST_MODEL_PATH}...")
-            self.xgboost_model = joblib.load(XGBOOST_MODEL_PATH)
+            self.registry.load("xgboost")
             print("XGBoost model loaded.")
         except Exception as e:
             print(f"Error loading XGBoost model: {e}")
@@ -54,7 +684,7 @@ class MLService:
 
         try:
             print(f"Loading Anomaly model from {ANOMALY_MODEL_PATH}...")
-            self.anomaly_model = joblib.load(ANOMALY_MODEL_PATH)
+            self.registry.load("anomaly")
             print("Anomaly model loaded.")
         except Exception as e:
             print(f"Error loading Anomaly model: {e}")
@@ -66,12 +696,34 @@ class MLService:
         except Exception as e:
             print(f"Error loading Anomaly scaler: {e}")
 
-    def _check_fluctuation(self, bulb_idx: int, state: int):
+    def _bulb_history(self, meter_key: str):
+        history = self.bulb_history.get(meter_key)
+        if history is None:
+            history = self.bulb_history[meter_key] = {i: [] for i in range(len(DEVICE_LABELS))}
+        return history
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """
+        Bulb histories as (meters, bulbs, 10) with -1 padding in front.
+        """
+        meters = list(self.bulb_history.items())
+        history = np.full((len(meters), len(DEVICE_LABELS), 10), -1, dtype=np.int8)
+        for row, (_, bulbs) in enumerate(meters):
+            for i, states in bulbs.items():
+                if states:
+                    history[row, i, -len(states):] = states[-10:]
+        return {"meters": str_array(k for k, _ in meters), "history": history}
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        for key, bulbs in zip(state["meters"], state["history"]):
+            self.bulb_history[str(key)] = {i: [int(s) for s in states if s >= 0] for i, states in enumerate(bulbs)}
+
+    def _check_fluctuation(self, bulb_idx: int, state: int, meter_key: str = "default"):
         """
         Check if a bulb is fluctuating based on history.
         Fluctuation: 4+ toggles in recent history.
         """
-        history = self.bulb_history[bulb_idx]
+        history = self._bulb_history(meter_key)[bulb_idx]
         history.append(state)
         if len(history) > 10:
             history.pop(0)
@@ -118,7 +770,10 @@ class MLService:
                     # Fallback or handle different features if any
                     data_3d = data.reshape(1, -1, 6)
                 
-                prediction = self.bilstm_model.predict(data_3d)
+                if self.bilstm_runtime is not None:
+                    prediction = self.bilstm_runtime.predict(data_3d)
+                else:
+                    prediction = self.bilstm_model.predict(data_3d)
             except Exception as e:
                 print(f"BiLSTM prediction failed with 3D input: {e}")
                 # Ultimate fallback to 2D
@@ -137,37 +792,73 @@ class MLService:
             print(f"Prediction error: {e}")
             raise e
 
-    def set_all_offline(self):
+    def predict_energy_batch(self, features: np.ndarray) -> np.ndarray:
+        """
+        predict_energy for an (N, 6) feature matrix in one batched BiLSTM run.
+        Returns the N raw positive predictions.
+        """
+        if not self.bilstm_model:
+            raise ValueError("BiLSTM model is not loaded.")
+        data = np.asarray(features, dtype=np.float64).reshape(-1, 6)
+        if len(data) == 0:
+            return np.zeros(0)
+        if self.bilstm_scaler:
+            data = self.bilstm_scaler.transform(data)
+        # Same single-reading sequence as predict_energy: the row repeated over 20 timesteps
+        data_3d = np.repeat(data[:, np.newaxis, :], 20, axis=1)
+        if self.bilstm_runtime is not None:
+            prediction = self.bilstm_runtime.predict(data_3d)
+        else:
+            prediction = self.bilstm_model.predict(data_3d, verbose=0)
+        return np.abs(np.asarray(prediction, dtype=np.float64)[:, 0])
+
+    def set_all_offline(self, meter_key: str = "default"):
         """
         Mark all devices as offline in both RTDB and Firestore.
-        Used when no real-time data is received within the threshold.
+        Used when no real-time data is received within the threshold for meter_key.
         """
-        labels = ['12W Bulb', '15W Bulb', '7W Bulb']
-        firestore_labels = ['Bulb 12W', 'Bulb 15W', 'Bulb 7W']
-        
-        from services.firebase_service import update_device_status, update_firestore_device_status
-        
+        labels = DEVICE_LABELS
+        firestore_labels = FIRESTORE_LABELS
+
+        # This meter's cached decision no longer matches what is stored; other meters keep theirs
+        self.change_detector.reset(meter_key)
+
         print("\n" + "!"*20 + " HEARTBEAT TIMEOUT: SETTING ALL OFFLINE " + "!"*20)
-        for i, label in enumerate(labels):
-            # RTDB
-            update_device_status(str(i), {"name": label, "status": "OFF", "is_active": False})
-            # Firestore
-            update_firestore_device_status(firestore_labels[i], "offline")
+        with pipeline_tracer_instance.stage("firebase_writes"):
+            for i, label in enumerate(labels):
+                # RTDB
+                self.sink.update_device_status(str(i), {"name": label, "status": "OFF", "is_active": False})
+                # Firestore
+                self.sink.update_firestore_device_status(firestore_labels[i], "offline")
         print("!"*64 + "\n")
 
-    def detect_anomaly(self, readings: List[dict]):
+    def detect_anomaly(self, readings: List[dict], user_id: Optional[str] = None, validated: bool = False):
         """
         Detect energy anomalies using the energy_anomaly_model.pkl.
         Expects a list of readings (at least 10 for rolling stats).
+        Anomalies raise an alert through the alert pipeline (deduplicated per user).
+        The window goes through the data-quality gate first unless validated=True.
+        Readings inside the user's hour-of-day baseline band are normal without running
+        the model (score None, screened_by "baseline"), except for a shadow sample.
         Features: ['Power', 'Vrms', 'Irms', 'PF', 'VA', 'VAR', 'Power_change', 'Current_change', 'Voltage_change', 'Power_rolling_std']
         """
-        if not self.anomaly_model:
+        anomaly_model = self.anomaly_model
+        if not anomaly_model:
             raise ValueError("Anomaly model is not loaded.")
 
         try:
             if len(readings) < 1:
                 return {"anomaly": False, "score": 0.0, "message": "Insufficient data"}
 
+            if not validated:
+                with pipeline_tracer_instance.stage("validate"):
+                    readings, quality = self.quality_gate.validate(readings, user_id or "default")
+                if quality.latest_rejected:
+                    print(f"[MLService] Latest reading failed data-quality checks: {quality.counts}")
+                    return {"is_anomaly": False, "score": 0.0,
+                            "message": "Latest reading failed data-quality checks",
+                            "quality": quality.to_dict()}
+
             # Get latest reading
             curr = readings[-1]
             prev = readings[-2] if len(readings) > 1 else curr
@@ -178,17 +869,7 @@ class MLService:
             irms = curr.get('Irms', 0.0)
             
             # Extract hour from timestamp: '2026-02-18_10:48:30_286'
-            hour = 12 # Default
-            ts_str = curr.get('timestamp', "")
-            if ts_str and "_" in ts_str:
-                try:
-                    time_part = ts_str.split('_')[1]
-                    hour = int(time_part.split(':')[0])
-                except:
-                    pass
-            elif not ts_str:
-                from datetime import datetime
-                hour = datetime.now().hour
+            hour = reading_time(curr).hour
 
             # Features for energy_anomaly_model.pkl
             features = [vrms, irms, power, hour]
@@ -202,112 +883,170 @@ class MLService:
             power_change = power - prev.get('Power', power)
             all_powers = [r.get('Power', 0.0) for r in readings]
             power_rolling_std = np.std(all_powers) if len(all_powers) > 1 else 0.0
+            feature_info = {
+                "Power": power,
+                "Vrms": vrms,
+                "Irms": irms,
+                "PF": pf,
+                "VA": va,
+                "VAR": var_p,
+                "Power_change": power_change,
+                "Power_rolling_std": power_rolling_std,
+                "Hour": hour
+            }
+
+            # Pre-screen: in-band readings skip the model
+            screened = self.baselines.prescreen(user_id or "default", curr)
+            if screened and not self.baselines.sample_shadow():
+                return {"is_anomaly": False, "score": None, "screened_by": "baseline", "features": feature_info}
 
             # Prediction
-            prediction = self.anomaly_model.predict(data)
+            with pipeline_tracer_instance.stage("anomaly"):
+                prediction = anomaly_model.predict(data)
             
-            # IsolationForest returns -1 for anomaly, 1 for normal
-            is_anomaly = bool(prediction[0] == -1)
+                # IsolationForest returns -1 for anomaly, 1 for normal
+                is_anomaly = bool(prediction[0] == -1)
 
-            # Try to get score if possible
-            score = 0.0
-            if hasattr(self.anomaly_model, 'decision_function'):
-                score = float(self.anomaly_model.decision_function(data)[0])
-            elif hasattr(self.anomaly_model, 'predict_proba'):
-                score = float(self.anomaly_model.predict_proba(data)[0][1])
+                # Try to get score if possible
+                score = 0.0
+                if hasattr(anomaly_model, 'decision_function'):
+                    score = float(anomaly_model.decision_function(data)[0])
+                elif hasattr(anomaly_model, 'predict_proba'):
+                    score = float(anomaly_model.predict_proba(data)[0][1])
 
             print(f"\n[MLService] Anomaly Detection: {'!!! ANOMALY !!!' if is_anomaly else 'Normal'}")
             print(f"Features (Model): {features}")
             print(f"Prediction: {prediction}, Score: {score}")
+            self.baselines.record_model_result(user_id or "default", curr, screened, is_anomaly)
+
+            if is_anomaly:
+                from datetime import datetime
+                import uuid
+                self.alerts.submit({
+                    "id": str(uuid.uuid4()),
+                    "title": "Energy Anomaly Detected",
+                    "message": f"Unusual consumption: {power:.1f}W at {vrms:.0f}V / {irms:.3f}A (score {score:.3f}).",
+                    "severity": "high" if score < -0.1 else "medium",
+                    "timestamp": datetime.now().isoformat(),
+                    "is_read": False
+                }, user_id=user_id, alert_type="anomaly")
 
             return {
                 "is_anomaly": is_anomaly,
                 "score": score,
-                "features": {
-                    "Power": power,
-                    "Vrms": vrms,
-                    "Irms": irms,
-                    "PF": pf,
-                    "VA": va,
-                    "VAR": var_p,
-                    "Power_change": power_change,
-                    "Power_rolling_std": power_rolling_std,
-                    "Hour": hour
-                }
+                "features": feature_info
             }
         except Exception as e:
             print(f"Anomaly detection error: {e}")
             raise e
 
-    def identify_device(self, readings: List[dict]):
+    def score_anomalies(self, features: np.ndarray):
+        """
+        Anomaly flags and scores for an (N, 4) [Voltage, Global_intensity, power_w, hour]
+        matrix in one model pass. Lower scores are more anomalous.
         """
-        Identify device using XGBoost model.
+        anomaly_model = self.anomaly_model
+        if not anomaly_model:
+            raise ValueError("Anomaly model is not loaded.")
+        data = np.asarray(features, dtype=np.float64).reshape(-1, 4)
+        if len(data) == 0:
+            return np.zeros(0, dtype=bool), np.zeros(0)
+        if hasattr(anomaly_model, 'decision_function'):
+            # IsolationForest.predict() is -1 exactly where decision_function() < 0
+            scores = np.asarray(anomaly_model.decision_function(data), dtype=np.float64)
+            return scores < 0, scores
+        flags = np.asarray(anomaly_model.predict(data)) == -1
+        return flags, np.where(flags, -1.0, 1.0)
+
+    def _reuse_decision(self, decision, meter_key: str):
+        """
+        Carry an unchanged decision forward without inference or Firebase writes.
+        Bulb histories still advance so fluctuation windows keep their meaning.
+        """
+        bits = decision[0]
+        histories = self._bulb_history(meter_key)
+        for i in range(len(DEVICE_LABELS)):
+            history = histories[i]
+            history.append(int(bits[i]))
+            if len(history) > 10:
+                history.pop(0)
+        return decision
+
+    def identify_device(self, readings: List[dict], user_id: Optional[str] = None, validated: bool = False,
+                        change: Optional[Tuple[bool, str]] = None):
+        """
+        Identify devices with the engine chosen by the engine selector (XGBoost by default).
         Expects a list of reading dicts: [{'Irms', 'Power', 'Vrms', 'kWh', 'timestamp'}, ...]
+        When the change detector sees no load change since the last inference for this
+        meter, the last decision is returned without running the model or writing statuses.
+        change is the detector's verdict when the caller already checked the latest reading.
+        The window goes through the data-quality gate first unless validated=True; if the
+        latest reading is rejected, the last decision is returned without any model or Firebase work.
         """
         if not self.xgboost_model:
             raise ValueError("XGBoost model is not loaded.")
         
         try:
             if not readings or len(readings) < 1:
-                return self.set_all_offline()
+                return self.set_all_offline(user_id or "default")
+
+            if not validated:
+                with pipeline_tracer_instance.stage("validate"):
+                    readings, quality = self.quality_gate.validate(readings, user_id or "default")
+                if quality.latest_rejected:
+                    print(f"[MLService] Latest reading failed data-quality checks: {quality.counts}")
+                    last_decision = self.change_detector.last_decision(user_id or "default")
+                    return last_decision if last_decision is not None else [[0, 0, 0]]
 
             # 1. Strict Freshness Check
-            from datetime import datetime
             latest_reading = readings[-1]
             ts_str = latest_reading['timestamp'] # '2026-02-18_10:48:30_286'
-            try:
-                # Format: YYYY-MM-DD_HH:MM:SS_mmm
-                read_dt = datetime.strptime(ts_str.split('_')[0] + " " + ts_str.split('_')[1], "%Y-%m-%d %H:%M:%S")
-                # Also handle the milliseconds part if needed, but seconds is enough for freshness
-                now = datetime.now()
-                diff_seconds = (now - read_dt).total_seconds()
-                
+            read_dt = parse_timestamp(ts_str)
+            if read_dt is None:
+                # If we can't parse, fall back to what we have or proceed with caution
+                print(f"[MLService] Timestamp parse error for '{ts_str}'")
+            else:
+                diff_seconds = (datetime.now() - read_dt).total_seconds()
+
                 # If data is older than 60 seconds, treat as offline
                 if diff_seconds > 60:
                     print(f"[MLService] Data is stale ({int(diff_seconds)}s old). Marking all offline.")
-                    self.set_all_offline()
+                    self.set_all_offline(user_id or "default")
+                    self._record_source(user_id or "default", None)
                     return [[0, 0, 0]] # Return zeros
-            except Exception as ts_err:
-                print(f"[MLService] Timestamp parse error for '{ts_str}': {ts_err}")
-                # If we can't parse, fall back to what we have or proceed with caution
 
-            # 2. Heuristic: If power is very low (noise), return offline
+            # 2. Skip inference when the load signature has not changed
+            meter_key = user_id or "default"
+            infer, reason = change if change is not None else self.change_detector.check(meter_key, latest_reading)
+            last_decision = self.change_detector.last_decision(meter_key)
+            if not infer and last_decision is not None:
+                return self._reuse_decision(last_decision, meter_key)
+
+            # 3. Heuristic: If power is very low (noise), return offline
             main_power = latest_reading.get('Power', 0.0)
             if main_power < 1.0:
                 print(f"[MLService] Total power {main_power}W is below threshold. Marking all offline.")
-                self.set_all_offline()
+                self.set_all_offline(meter_key)
+                self.change_detector.record(meter_key, latest_reading, [[0, 0, 0]])
+                self._record_source(meter_key, None)
                 return [[0, 0, 0]]
 
-            # 3. Calculate 7 Features for XGBoost: ['Irms', 'Power', 'Vrms', 'kWh', 'DeltaP', 'VarP', 'PF']
-            # We take the features from the latest reading, and calculate DeltaP using the previous one.
-            curr = latest_reading
-            prev = readings[-2] if len(readings) > 1 else curr
-
-            irms = curr['Irms']
-            power = curr['Power']
-            vrms = curr['Vrms']
-            kwh = curr['kWh']
-            delta_p = power - prev['Power']
-            
-            va = vrms * irms
-            var_p = np.sqrt(max(0, (va**2) - (power**2)))
-            pf = power / va if va > 0 else 1.0
-
-            # XGBoost expects 2D array [irms, power, vrms, kwh, delta_p, var_p, pf]
-            features = [irms, power, vrms, kwh, delta_p, var_p, pf]
-            data = np.array(features).reshape(1, -1)
-            
-            prediction = self.xgboost_model.predict(data)
+            # 4. Run the selected identification engine on the window.
+            # XGBoost uses ['Irms', 'Power', 'Vrms', 'kWh', 'DeltaP', 'VarP', 'PF'] of the latest reading.
+            engine = self.engine_selector.select()
+            with pipeline_tracer_instance.stage("features"):
+                features = engine.features(readings)
+            with pipeline_tracer_instance.stage(engine.name):
+                prediction = engine.predict(readings)
             
             # Log identified devices to terminal
             if len(prediction) > 0:
                 bits = prediction[0] if prediction.ndim > 1 else prediction
-                labels = ['12W Bulb', '15W Bulb', '7W Bulb']
-                firestore_labels = ['Bulb 12W', 'Bulb 15W', 'Bulb 7W']
-                print("\n" + "="*20 + " XGBOOST IDENTIFICATION " + "="*20)
+                labels = DEVICE_LABELS
+                firestore_labels = FIRESTORE_LABELS
+                print("\n" + "="*20 + f" {engine.name.upper()} IDENTIFICATION " + "="*20)
                 print(f"Features used: {features}")
                 
-                from services.firebase_service import add_alert, update_device_status, update_firestore_device_status
                 import uuid
 
                 for i, label in enumerate(labels):
@@ -315,12 +1054,13 @@ class MLService:
                     status = "ON" if state else "OFF"
                     status_str = "online" if state else "offline"
                     print(f"{label}: {status}")
-                    
-                    update_device_status(str(i), {"name": label, "status": status, "is_active": bool(state)})
-                    update_firestore_device_status(firestore_labels[i], status_str)
 
-                    if self._check_fluctuation(i, state):
-                        if i not in self.alerted_bulbs:
+                    with pipeline_tracer_instance.stage("firebase_writes"):
+                        self.sink.update_device_status(str(i), {"name": label, "status": status, "is_active": bool(state)})
+                        self.sink.update_firestore_device_status(firestore_labels[i], status_str)
+
+                    if self._check_fluctuation(i, state, meter_key):
+                        if not self.alerts.is_suppressed(user_id, label, "fluctuation"):
                             print(f"!!! FLUCTUATION DETECTED for {label} !!!")
                             alert_data = {
                                 "id": str(uuid.uuid4()),
@@ -330,13 +1070,136 @@ class MLService:
                                 "timestamp": datetime.now().isoformat(),
                                 "is_read": False
                             }
-                            add_alert(alert_data)
-                            self.alerted_bulbs.add(i)
+                            self.alerts.submit(alert_data, user_id=user_id, device=label, alert_type="fluctuation")
                 print("="*64 + "\n")
 
+            decision = np.asarray(prediction, dtype=int).reshape(1, -1).tolist()
+            self.change_detector.record(meter_key, latest_reading, decision)
+            self._record_source(meter_key, engine)
             return prediction.tolist()
         except Exception as e:
             print(f"Device identification error: {e}")
             raise e
 
+    def identify_batch(self, batch, freshness_seconds: float = 60.0):
+        """
+        Identify devices for every reading of a bulk upload (a decoded ReadingBatch)
+        in one vectorized XGBoost call (a signature lookup plus one XGBoost call for
+        the ambiguous rows when IDENTIFICATION_ENGINE=signature). Readings are ordered per meter by time and
+        DeltaP is taken against the meter's previous reading in the batch; readings
+        below 1 W are all-off, as in identify_device. Fluctuation histories advance
+        for every reading; the change detector is updated only for meters whose latest
+        reading is fresh, so backfills don't flip live statuses. The global /devices
+        statuses are written once per batch, from the newest fresh reading of any meter.
+        Returns (order, bits): the row order applied and the (N, 3) bits in that order.
+        """
+        engine = self.engine_selector.engines["xgboost"]
+        if not engine.is_ready():
+            raise ValueError("XGBoost model is not loaded.")
+        if self.engine_selector.mode == "signature" and self.signature_engine.is_ready():
+            engine = self.signature_engine
+
+        n = len(batch)
+        if n == 0:
+            return np.zeros(0, dtype=int), np.zeros((0, len(DEVICE_LABELS)), dtype=int)
+        order = np.lexsort((batch.timestamp, batch.meter))
+        meter = batch.meter[order]
+        irms, power, vrms, kwh = (np.asarray(c[order], dtype=np.float64)
+                                  for c in (batch.Irms, batch.Power, batch.Vrms, batch.kWh))
+
+        first = np.ones(n, dtype=bool)
+        first[1:] = meter[1:] != meter[:-1]
+        prev_power = np.roll(power, 1)
+        prev_power[first] = power[first]
+
+        bits = np.zeros((n, len(DEVICE_LABELS)), dtype=int)
+        active = power >= 1.0
+        if active.any():
+            features = identification_feature_matrix(irms[active], power[active], vrms[active],
+                                                     kwh[active], prev_power[active])
+            bits[active] = engine.predict_matrix(features)
+
+        starts = np.flatnonzero(first)
+        ends = np.append(starts[1:], n)
+        now = time.time()
+        newest = None
+        for start, end in zip(starts, ends):
+            meter_key = batch.meter_ids[meter[start]]
+            last = end - 1
+            latest_reading = {
+                'Irms': float(irms[last]), 'Power': float(power[last]),
+                'Vrms': float(vrms[last]), 'kWh': float(kwh[last]),
+                'timestamp': timestamp_key(datetime.fromtimestamp(batch.timestamp[order[last]])),
+            }
+            fresh = now - batch.timestamp[order[last]] <= freshness_seconds
+            self._apply_batch_decisions(meter_key, bits[start:end], latest_reading, fresh, engine)
+            if fresh and (newest is None or batch.timestamp[order[last]] > batch.timestamp[order[newest]]):
+                newest = last
+        if newest is not None:
+            self._write_batch_statuses(bits[newest])
+        return order, bits
+
+    def _write_batch_statuses(self, latest: np.ndarray):
+        for i, label in enumerate(DEVICE_LABELS):
+            state = int(latest[i])
+            self.sink.update_device_status(str(i), {"name": label, "status": "ON" if state else "OFF", "is_active": bool(state)})
+            self.sink.update_firestore_device_status(FIRESTORE_LABELS[i], "online" if state else "offline")
+
+    def _apply_batch_decisions(self, meter_key: str, bits: np.ndarray, latest_reading: dict, fresh: bool,
+                               engine: IdentificationEngine):
+        fluctuating = set()
+        for row in bits:
+            for i in range(len(DEVICE_LABELS)):
+                if self._check_fluctuation(i, int(row[i]), meter_key):
+                    fluctuating.add(i)
+
+        for i in sorted(fluctuating):
+            label = DEVICE_LABELS[i]
+            if not self.alerts.is_suppressed(meter_key, label, "fluctuation"):
+                alert_data = {
+                    "id": str(uuid.uuid4()),
+                    "title": "Device Fluctuation Detected",
+                    "message": f"Technical fault: {label} is fluctuating repeatedly.",
+                    "severity": "high",
+                    "timestamp": datetime.now().isoformat(),
+                    "is_read": False
+                }
+                self.alerts.submit(alert_data, user_id=meter_key, device=label, alert_type="fluctuation")
+
+        if not fresh:
+            return
+        latest = bits[-1]
+        self.change_detector.record(meter_key, latest_reading, latest.reshape(1, -1).tolist())
+        self._record_source(meter_key, engine if latest_reading['Power'] >= 1.0 else None)
+
+    def benchmark_engines(self, readings: List[dict], window: int = 7, labels: Optional[List[List[int]]] = None):
+        """
+        Replay a held-out sequence of readings through every identification engine
+        as sliding windows of `window` readings and update the engine selector.
+        labels, if given, hold the true bits for each window's latest reading.
+        """
+        windows = [readings[max(0, i - window + 1):i + 1] for i in range(len(readings))]
+        return self.engine_selector.benchmark(windows, labels)
+
+    def learn_signatures(self, readings: List[dict], labels: Optional[List[List[int]]] = None) -> dict:
+        """
+        Learn the signature engine's centroids from recorded readings. labels hold
+        the true bits of each reading; without them the XGBoost decisions are used.
+        Readings below 1 W are left out, as identification treats them as all-off.
+        """
+        readings = [r for r in readings if r.get('Power', 0.0) >= 1.0] if labels is None else readings
+        if not readings:
+            raise ValueError("No readings to learn signatures from.")
+        power = np.array([r['Power'] for r in readings], dtype=np.float64)
+        features = identification_feature_matrix(
+            np.array([r['Irms'] for r in readings], dtype=np.float64), power,
+            np.array([r['Vrms'] for r in readings], dtype=np.float64),
+            np.array([r['kWh'] for r in readings], dtype=np.float64),
+            np.concatenate([power[:1], power[:-1]]))
+        if labels is None:
+            bits = np.asarray(self.xgboost_model.predict(features), dtype=int).reshape(len(features), -1)
+        else:
+            bits = np.asarray(labels, dtype=int).reshape(len(features), -1)
+        return self.signature_engine.fit(features, bits)
+
 ml_service_instance = MLService()
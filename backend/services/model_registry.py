@@ -0,0 +1,227 @@
+import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+
+class ModelVersion:
+    """
+    A loaded model artifact together with the content hash it was loaded from.
+    """
+    def __init__(self, name: str, path: str, version: str, model, load_seconds: float, warm_seconds: float):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.model = model
+        self.load_seconds = load_seconds
+        self.warm_seconds = warm_seconds
+        self.loaded_at = time.time()
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 4),
+            "warm_seconds": round(self.warm_seconds, 4),
+        }
+
+
+class ModelRegistry:
+    """
+    Keeps model artifacts keyed by the SHA-256 of their file contents.
+    New versions are loaded and warmed off to the side and swapped in with a
+    single reference assignment, so requests never see a half-loaded model.
+    The last few versions of each model stay in memory for instant rollback.
+    A rollback pins the model: the watcher ignores the artifact that was rolled
+    back from until the file changes again (an explicit reload clears the pin).
+    """
+    def __init__(self, cache_size: int = 3):
+        self.cache_size = cache_size
+        self._specs: Dict[str, dict] = {}
+        self._active: Dict[str, ModelVersion] = {}
+        self._cache: Dict[str, "OrderedDict[str, ModelVersion]"] = {}
+        self._lock = threading.Lock()
+        self._reloading = set()
+        self._pinned: Dict[str, str] = {}  # name -> file hash the watcher must not load
+        self._watch_thread = None
+        self._watching = False
+
+    @staticmethod
+    def fingerprint(path: str) -> str:
+        """
+        Short content hash of a model file, used as its version string.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()[:12]
+
+    def register(self, name: str, path: str, loader: Callable, warmup: Optional[Callable] = None):
+        """
+        Register a model by name. loader(path) returns the model object and
+        warmup(model) runs a few synthetic inferences before it goes live.
+        """
+        self._specs[name] = {"path": path, "loader": loader, "warmup": warmup}
+        self._cache.setdefault(name, OrderedDict())
+
+    def _build(self, name: str, version: str) -> ModelVersion:
+        spec = self._specs[name]
+        t0 = time.perf_counter()
+        model = spec["loader"](spec["path"])
+        load_seconds = time.perf_counter() - t0
+
+        t1 = time.perf_counter()
+        if spec["warmup"] is not None:
+            spec["warmup"](model)
+        warm_seconds = time.perf_counter() - t1
+        return ModelVersion(name, spec["path"], version, model, load_seconds, warm_seconds)
+
+    def _activate(self, entry: ModelVersion):
+        with self._lock:
+            cache = self._cache[entry.name]
+            cache[entry.version] = entry
+            cache.move_to_end(entry.version)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+            self._active[entry.name] = entry
+
+    def load(self, name: str) -> Optional[ModelVersion]:
+        """
+        Load (or reuse from cache) the current artifact for a model and make it active.
+        Runs synchronously; use reload() to do it in the background.
+        """
+        spec = self._specs[name]
+        version = self.fingerprint(spec["path"])
+
+        active = self._active.get(name)
+        if active is not None and active.version == version:
+            return active
+
+        cached = self._cache[name].get(version)
+        if cached is not None:
+            print(f"[ModelRegistry] {name}: swapping to cached version {version}")
+            self._activate(cached)
+            return cached
+
+        print(f"[ModelRegistry] Loading {name} version {version} from {spec['path']}...")
+        entry = self._build(name, version)
+        self._activate(entry)
+        print(f"[ModelRegistry] {name} version {version} active "
+              f"(load {entry.load_seconds:.3f}s, warm-up {entry.warm_seconds:.3f}s)")
+        return entry
+
+    def reload(self, name: str, background: bool = True, unpin: bool = True) -> bool:
+        """
+        Pick up a changed artifact for a model. The currently active version keeps
+        serving until the new one is loaded and warmed. Returns False if a reload
+        for this model is already in progress.
+        """
+        with self._lock:
+            if name in self._reloading:
+                return False
+            self._reloading.add(name)
+            if unpin:
+                self._pinned.pop(name, None)
+
+        def _run():
+            try:
+                self.load(name)
+            except Exception as e:
+                print(f"[ModelRegistry] Reload of {name} failed, keeping current version: {e}")
+            finally:
+                with self._lock:
+                    self._reloading.discard(name)
+
+        if background:
+            threading.Thread(target=_run, daemon=True).start()
+        else:
+            _run()
+        return True
+
+    def rollback(self, name: str, version: Optional[str] = None) -> Optional[ModelVersion]:
+        """
+        Swap back to a cached version. Defaults to the one active before the current one.
+        """
+        with self._lock:
+            cache = self._cache.get(name) or OrderedDict()
+            active = self._active.get(name)
+            if version is None:
+                previous = [v for v in cache if active is None or v != active.version]
+                if not previous:
+                    return None
+                version = previous[-1]
+            entry = cache.get(version)
+            if entry is None:
+                return None
+            cache.move_to_end(version)
+            self._active[name] = entry
+        path = self._specs[name]["path"]
+        current = self.fingerprint(path) if os.path.exists(path) else None
+        with self._lock:
+            if current is not None and current != version:
+                self._pinned[name] = current
+        print(f"[ModelRegistry] {name}: rolled back to version {version}"
+              + (f" (ignoring artifact {current} until it changes)" if current != version else ""))
+        return entry
+
+    def get(self, name: str):
+        entry = self._active.get(name)
+        return entry.model if entry else None
+
+    def active(self, name: str) -> Optional[ModelVersion]:
+        return self._active.get(name)
+
+    def version(self, name: str) -> Optional[str]:
+        entry = self._active.get(name)
+        return entry.version if entry else None
+
+    def pinned(self, name: str) -> Optional[str]:
+        return self._pinned.get(name)
+
+    def versions(self, name: str) -> List[dict]:
+        active = self._active.get(name)
+        return [
+            {**entry.to_dict(), "active": active is not None and entry.version == active.version}
+            for entry in self._cache.get(name, {}).values()
+        ]
+
+    def describe(self) -> dict:
+        return {name: self.versions(name) for name in self._specs}
+
+    def _watch_loop(self, interval: float):
+        while self._watching:
+            time.sleep(interval)
+            for name, spec in list(self._specs.items()):
+                try:
+                    if not os.path.exists(spec["path"]):
+                        continue
+                    current = self.fingerprint(spec["path"])
+                    pinned = self._pinned.get(name)
+                    if pinned is not None:
+                        if current == pinned:
+                            continue
+                        with self._lock:
+                            self._pinned.pop(name, None)
+                    if current != self.version(name):
+                        self.reload(name, unpin=False)
+                except Exception as e:
+                    print(f"[ModelRegistry] Watch error for {name}: {e}")
+
+    def start_watching(self, interval: float = 30.0):
+        """
+        Poll registered artifacts and reload any whose content hash changed
+        (except a pinned artifact, see rollback()).
+        """
+        if self._watching:
+            return
+        self._watching = True
+        self._watch_thread = threading.Thread(target=self._watch_loop, args=(interval,), daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        self._watching = False
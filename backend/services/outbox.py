@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+import numpy as np
+from services.sinks import StatusSink, FirebaseSink
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Append-only log of queued writes, replayed at startup; empty keeps the outbox in memory only
+OUTBOX_LOG_PATH = os.getenv("OUTBOX_LOG_PATH", os.path.join(BASE_DIR, "outbox.log"))
+# The log is rewritten with only the pending writes once it grows past this
+OUTBOX_LOG_MAX_BYTES = int(os.getenv("OUTBOX_LOG_MAX_BYTES", str(4 * 1024 * 1024)))
+# fsync every log append (survives power loss, not just a process crash)
+OUTBOX_FSYNC = os.getenv("OUTBOX_FSYNC", "0") == "1"
+OUTBOX_FLUSH_SECONDS = float(os.getenv("OUTBOX_FLUSH_SECONDS", "0.2"))
+OUTBOX_MAX_BATCH = int(os.getenv("OUTBOX_MAX_BATCH", "500"))
+# Retry backoff after a failed flush: doubles from BASE up to MAX seconds
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "0.5"))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "30"))
+
+DEVICE, FIRESTORE, ALERT = "device", "firestore", "alert"
+
+
+class _Entry:
+    __slots__ = ("kind", "key", "value", "seqs", "enqueued_at")
+
+    def __init__(self, kind: str, key: str, value, seq: int, enqueued_at: float):
+        self.kind = kind
+        self.key = key
+        self.value = value
+        self.seqs = [seq]
+        self.enqueued_at = enqueued_at
+
+
+def _merge(kind: str, older, newer):
+    # Device statuses are partial updates; everything else is replaced
+    return {**older, **newer} if kind == DEVICE else newer
+
+
+class OutboxSink(StatusSink):
+    """
+    Write-behind sink in front of Firebase.
+
+    The pipeline's writes are appended to a local log and queued in memory, and
+    return immediately. A background flusher sends the queue to the target sink
+    in batches: all device statuses in one multi-path update, all alerts in
+    another, Firestore statuses one by one. A write to a path that is still
+    queued replaces the queued value (device statuses are merged), so only the
+    latest state is sent. Failed writes stay queued and are retried with
+    exponential backoff. Successful writes are acknowledged in the log; writes
+    left in the log at startup (crash, Firebase outage) are queued again.
+    The log is opened (and replayed) by open() or the first write, not at
+    construction, so importing the module touches no files.
+    """
+    def __init__(self, target: Optional[StatusSink] = None, log_path: Optional[str] = OUTBOX_LOG_PATH,
+                 flush_seconds: float = OUTBOX_FLUSH_SECONDS, max_batch: int = OUTBOX_MAX_BATCH,
+                 retry_base: float = OUTBOX_RETRY_BASE, retry_max: float = OUTBOX_RETRY_MAX,
+                 log_max_bytes: int = OUTBOX_LOG_MAX_BYTES, fsync: bool = OUTBOX_FSYNC):
+        self.target = target or FirebaseSink()
+        self.log_path = log_path
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.log_max_bytes = log_max_bytes
+        self.fsync = fsync
+        self._pending: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._inflight: List[_Entry] = []
+        self._seq = 0
+        self._log = None
+        self._log_bytes = 0
+        self._opened = False
+        self._open_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._failures = 0  # consecutive failed flushes
+        self.backoff = 0.0
+        self._latencies = deque(maxlen=200)
+        self.counters = {"enqueued": 0, "coalesced": 0, "written": 0, "batches": 0,
+                         "failed_batches": 0, "retried": 0, "replayed": 0}
+
+    # --- log ------------------------------------------------------------------
+
+    def open(self):
+        """
+        Open the log and queue the unacknowledged writes of a previous run.
+        Called at startup; the first write opens it otherwise.
+        """
+        if self._opened:
+            return
+        with self._open_lock:
+            if self._opened or self._closed:
+                return
+            if self.log_path:
+                self._replay()
+            self._opened = True
+
+    def _append(self, record: dict):
+        if self._log is None:
+            return
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        self._log.write(line)
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+        self._log_bytes += len(line)
+
+    def _replay(self):
+        """
+        Queue the writes of a previous run that were never acknowledged.
+        """
+        entries, acked = {}, set()
+        if os.path.exists(self.log_path):
+            with open(self.log_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of a crashed run
+                    if "a" in record:
+                        acked.update(record["a"])
+                    else:
+                        entries[record["s"]] = record
+        now = time.time()
+        for seq in sorted(entries):
+            if seq in acked:
+                continue
+            record = entries[seq]
+            self._queue(record["k"], record["p"], record["v"], seq, now)
+        self._seq = max(entries, default=0)
+        self.counters["replayed"] = len(self._pending)
+        self._compact()
+        if self._pending:
+            print(f"[Outbox] Replaying {len(self._pending)} unacknowledged writes from {self.log_path}")
+            self._ensure_flusher()
+
+    def _compact(self):
+        """
+        Rewrite the log with only the queued writes. Caller holds _flush_lock
+        (or runs before the flusher starts), so no batch is in flight.
+        """
+        tmp = self.log_path + ".tmp"
+        with open(tmp, "w") as f:
+            for entry in self._pending.values():
+                f.write(json.dumps({"s": max(entry.seqs), "k": entry.kind, "p": entry.key, "v": entry.value},
+                                   separators=(",", ":")) + "\n")
+                entry.seqs = [max(entry.seqs)]
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.log_path)
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self.log_path, "a")
+        self._log_bytes = os.path.getsize(self.log_path)
+
+    # --- queue ----------------------------------------------------------------
+
+    def _queue(self, kind: str, key: str, value, seq: int, now: float):
+        entry = self._pending.get((kind, key))
+        if entry is None:
+            self._pending[(kind, key)] = _Entry(kind, key, value, seq, now)
+        else:
+            entry.value = _merge(kind, entry.value, value)
+            entry.seqs.append(seq)
+            self.counters["coalesced"] += 1
+
+    def enqueue(self, kind: str, key: str, value):
+        self.open()
+        with self._lock:
+            self._seq += 1
+            self._append({"s": self._seq, "k": kind, "p": key, "v": value})
+            self._queue(kind, key, value, self._seq, time.time())
+            self.counters["enqueued"] += 1
+            batch_full = len(self._pending) >= self.max_batch
+        self._ensure_flusher()
+        if batch_full and not self.backoff:
+            self._wakeup.set()
+
+    def update_device_status(self, device_id: str, status: dict):
+        self.enqueue(DEVICE, str(device_id), status)
+
+    def update_device_statuses(self, statuses: Dict[str, dict]):
+        for device_id, status in statuses.items():
+            self.enqueue(DEVICE, str(device_id), status)
+
+    def update_firestore_device_status(self, device_name: str, status_str: str):
+        self.enqueue(FIRESTORE, device_name, status_str)
+
+    def add_alert(self, alert: dict):
+        from services.firebase_service import generate_push_key
+        self.enqueue(ALERT, generate_push_key(), alert)
+
+    def add_alerts(self, alerts: Dict[str, dict]):
+        for key, alert in alerts.items():
+            self.enqueue(ALERT, key, alert)
+
+    # --- flushing -------------------------------------------------------------
+
+    def _requeue(self, entries: List[_Entry]):
+        # Failed writes go back in front of anything queued for the same path since
+        with self._lock:
+            for entry in entries:
+                newer = self._pending.pop((entry.kind, entry.key), None)
+                if newer is not None:
+                    entry.value = _merge(entry.kind, entry.value, newer.value)
+                    entry.seqs += newer.seqs
+                self._pending[(entry.kind, entry.key)] = entry
+            self.counters["retried"] += len(entries)
+
+    def flush(self) -> int:
+        """
+        Send one batch of queued writes. Returns the number written; failed
+        writes are queued again.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._log is not None and self._log_bytes > self.log_max_bytes:
+                    self._compact()
+                keys = list(self._pending)[:self.max_batch]
+                batch = self._inflight = [self._pending.pop(k) for k in keys]
+            if not batch:
+                return 0
+
+            t0 = time.perf_counter()
+            groups = {DEVICE: [], FIRESTORE: [], ALERT: []}
+            for entry in batch:
+                groups[entry.kind].append(entry)
+            done, failed = [], []
+
+            def _send(entries, write):
+                if not entries:
+                    return
+                try:
+                    write()
+                    done.extend(entries)
+                except Exception as e:
+                    print(f"[Outbox] Failed to write {len(entries)} {entries[0].kind} updates: {e}")
+                    failed.extend(entries)
+
+            _send(groups[DEVICE], lambda: self.target.update_device_statuses(
+                {e.key: e.value for e in groups[DEVICE]}))
+            _send(groups[ALERT], lambda: self.target.add_alerts({e.key: e.value for e in groups[ALERT]}))
+            for entry in groups[FIRESTORE]:
+                _send([entry], lambda: self.target.update_firestore_device_status(entry.key, entry.value))
+
+            with self._lock:
+                if done:
+                    self._append({"a": [seq for e in done for seq in e.seqs]})
+                    self.counters["written"] += len(done)
+                    self._latencies.append((time.perf_counter() - t0) * 1000.0)
+                self.counters["batches"] += 1
+                self._inflight = []
+            if failed:
+                self._requeue(failed)
+                self._failures += 1
+                self.counters["failed_batches"] += 1
+                delay = min(self.retry_max, self.retry_base * 2 ** (self._failures - 1))
+                self.backoff = delay * random.uniform(0.8, 1.2)
+            else:
+                self._failures = 0
+                self.backoff = 0.0
+            return len(done)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.backoff or self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                # Drain full batches back to back unless Firebase is failing
+                while self.flush() >= self.max_batch and not self.backoff:
+                    pass
+            except Exception as e:
+                print(f"[Outbox] Flush error: {e}")
+
+    def _ensure_flusher(self):
+        if self._thread is None and not self._closed:
+            with self._lock:
+                if self._thread is None and not self._closed:
+                    self._thread = threading.Thread(target=self._flush_loop, name="outbox-flusher", daemon=True)
+                    self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """
+        Stop the flusher after a last attempt to drain the queue. Whatever is
+        still queued stays in the log for the next start.
+        """
+        deadline = time.time() + timeout
+        self._closed = True
+        self._wakeup.set()
+        # The flusher's batch in flight must be acknowledged before the log is closed
+        if self._thread is not None:
+            self._thread.join(timeout=max(deadline - time.time(), 0.0))
+        while self._pending and time.time() < deadline and self.flush():
+            pass
+        with self._flush_lock:
+            with self._lock:
+                if self._log is not None:
+                    self._compact()
+                    self._log.close()
+                    self._log = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = list(self._pending.values()) + self._inflight
+            oldest = min((e.enqueued_at for e in entries), default=None)
+            latencies = np.array(self._latencies)
+        return {
+            **self.counters,
+            "depth": len(entries),
+            "oldest_age_seconds": time.time() - oldest if oldest is not None else None,
+            "flush_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "flush_ms_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+            "backoff_seconds": self.backoff,
+            "log_bytes": self._log_bytes,
+        }
+
+outbox_instance = OutboxSink()
@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import signal
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+
+# Number of recent pipeline events kept with per-stage timings
+PIPELINE_TRACE_SIZE = int(os.getenv("PIPELINE_TRACE_SIZE", "200"))
+# Upper bound of one profiling run, and the length of a SIGUSR1-triggered run
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_SIGNAL_SECONDS = float(os.getenv("PROFILE_SIGNAL_SECONDS", "10"))
+# Where SIGUSR1 profiles are written
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", ".")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for the running process. A background thread
+    snapshots every thread's stack via sys._current_frames() at a fixed interval
+    and counts identical stacks, producing the collapsed-stack format
+    ("thread;module:function:line;... count") read by flamegraph.pl and speedscope.
+    """
+    def __init__(self, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self.running = False
+        self.last_run: Optional[dict] = None
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+        return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+    def profile(self, seconds: float, interval: float = 0.005) -> str:
+        """
+        Sample for `seconds` on the calling thread and return the collapsed stacks.
+        Raises RuntimeError if a run is already in progress.
+        """
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+        interval = max(interval, 0.001)
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profiling run is already in progress")
+        try:
+            self.running = True
+            me = threading.get_ident()
+            names = {}
+            counts: Dict[str, int] = {}
+            samples = 0
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                if len(names) != threading.active_count():
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    key = ";".join(reversed(stack))
+                    counts[key] = counts.get(key, 0) + 1
+                samples += 1
+                time.sleep(interval)
+
+            self.last_run = {
+                "finished_at": datetime.now().isoformat(),
+                "seconds": time.perf_counter() - started,
+                "samples": samples,
+                "stacks": len(counts),
+            }
+            return "\n".join(f"{stack} {count}" for stack, count in
+                             sorted(counts.items(), key=lambda kv: -kv[1])) + "\n"
+        finally:
+            self.running = False
+            self._lock.release()
+
+    def profile_to_file(self, seconds: float, directory: str = PROFILE_OUTPUT_DIR) -> str:
+        path = os.path.join(directory, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded")
+        output = self.profile(seconds)
+        with open(path, "w") as f:
+            f.write(output)
+        print(f"[SamplingProfiler] Wrote {path}")
+        return path
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR1", 0),
+                               seconds: float = PROFILE_SIGNAL_SECONDS) -> bool:
+        """
+        On `signum` (SIGUSR1 by default), profile for `seconds` in the background
+        and write a .folded file to PROFILE_OUTPUT_DIR. Must run on the main thread.
+        """
+        if not signum:
+            return False
+
+        def _handler(sig, frame):
+            if self.running:
+                print("[SamplingProfiler] Already running, signal ignored.")
+                return
+            threading.Thread(target=self.profile_to_file, args=(seconds,),
+                             name="sampling-profiler", daemon=True).start()
+
+        try:
+            signal.signal(signum, _handler)
+            return True
+        except ValueError as e:  # not on the main thread
+            print(f"[SamplingProfiler] Could not install signal handler: {e}")
+            return False
+
+
+class _Event:
+    __slots__ = ("kind", "user_id", "started_at", "stages", "wall_ms", "cpu_ms")
+
+    def __init__(self, kind: str, user_id: Optional[str]):
+        self.kind = kind
+        self.user_id = user_id
+        self.started_at = time.time()
+        self.stages: Dict[str, dict] = {}
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+
+
+class PipelineTracer:
+    """
+    Per-stage wall and CPU timings of the most recent pipeline events.
+    An event opened with event() is bound to the current thread; stage() blocks
+    inside it (in any module on that thread) add their timings to it, and are
+    no-ops when no event is open. Finished events go into a ring buffer.
+    """
+    def __init__(self, size: int = PIPELINE_TRACE_SIZE):
+        self.events = deque(maxlen=size)
+        self._local = threading.local()
+
+    @contextmanager
+    def event(self, kind: str, user_id: Optional[str] = None):
+        if getattr(self._local, "event", None) is not None:
+            # Nested pipeline call (e.g. identify_device from the processor): one event
+            yield self._local.event
+            return
+        event = _Event(kind, user_id)
+        self._local.event = event
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        try:
+            yield event
+        finally:
+            event.wall_ms = (time.perf_counter() - wall0) * 1000.0
+            event.cpu_ms = (time.thread_time() - cpu0) * 1000.0
+            self._local.event = None
+            self.events.append(event)
+
+    @contextmanager
+    def stage(self, name: str):
+        event = getattr(self._local, "event", None)
+        if event is None:
+            yield
+            return
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            stage = event.stages.get(name)
+            if stage is None:
+                stage = event.stages[name] = {"wall_ms": 0.0, "cpu_ms": 0.0}
+            stage["wall_ms"] += (time.perf_counter() - wall0) * 1000.0
+            stage["cpu_ms"] += (time.thread_time() - cpu0) * 1000.0
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        events = list(self.events)[-limit:]
+        return [{
+            "kind": e.kind,
+            "user_id": e.user_id,
+            "started_at": datetime.fromtimestamp(e.started_at).isoformat(),
+            "wall_ms": e.wall_ms,
+            "cpu_ms": e.cpu_ms,
+            "stages": e.stages,
+        } for e in reversed(events)]
+
+    def summary(self) -> dict:
+        """
+        p50/p95 wall and mean CPU per stage over the buffered events.
+        """
+        per_stage: Dict[str, List[tuple]] = {}
+        for e in list(self.events):
+            for name, t in e.stages.items():
+                per_stage.setdefault(name, []).append((t["wall_ms"], t["cpu_ms"]))
+        result = {}
+        for name, values in per_stage.items():
+            arr = np.array(values)
+            result[name] = {
+                "count": len(values),
+                "wall_ms_p50": float(np.percentile(arr[:, 0], 50)),
+                "wall_ms_p95": float(np.percentile(arr[:, 0], 95)),
+                "cpu_ms_mean": float(arr[:, 1].mean()),
+            }
+        return result
+
+sampling_profiler_instance = SamplingProfiler()
+pipeline_tracer_instance = PipelineTracer()
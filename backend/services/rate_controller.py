@@ -0,0 +1,193 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+from services.snapshot_service import str_array
+
+# Power (W) below which a meter counts as idle; identify_device marks everything offline below it
+RATE_IDLE_POWER = float(os.getenv("RATE_IDLE_POWER", "1.0"))
+# Consecutive readings without a load change before an active meter is demoted to stable
+RATE_STABLE_AFTER = int(os.getenv("RATE_STABLE_AFTER", "5"))
+# Minimum seconds between evaluations of a stable / idle meter (active meters: every reading)
+RATE_STABLE_INTERVAL = float(os.getenv("RATE_STABLE_INTERVAL", "5"))
+RATE_IDLE_INTERVAL = float(os.getenv("RATE_IDLE_INTERVAL", "30"))
+# Evaluations per second allowed per tier across all meters (0 = unlimited)
+RATE_BUDGET_ACTIVE = float(os.getenv("RATE_BUDGET_ACTIVE", "0"))
+RATE_BUDGET_STABLE = float(os.getenv("RATE_BUDGET_STABLE", "20"))
+RATE_BUDGET_IDLE = float(os.getenv("RATE_BUDGET_IDLE", "5"))
+# Process CPU use (fraction of all cores) above which stable/idle intervals are stretched
+RATE_CPU_TARGET = float(os.getenv("RATE_CPU_TARGET", "0.8"))
+RATE_MAX_THROTTLE = float(os.getenv("RATE_MAX_THROTTLE", "8"))
+
+TIERS = ("active", "stable", "idle")
+# ChangeDetector verdicts that make a meter active and are evaluated right away
+_PROMOTING = {"no_decision": "new", "power_step": "step", "current_step": "step"}
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "tokens", "updated")
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = max(rate, 1.0)
+        self.updated = time.time()
+
+    def take(self, now: float) -> bool:
+        if self.rate <= 0:
+            return True
+        self.tokens = min(max(self.rate, 1.0), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class _MeterRate:
+    __slots__ = ("tier", "calm", "evaluated_at")
+
+    def __init__(self):
+        self.tier = "active"
+        self.calm = 0
+        self.evaluated_at = 0.0
+
+
+class RateController:
+    """
+    Decides, per incoming reading, whether a meter's pipeline runs now.
+
+    Meters move between three tiers: active (evaluated on every reading),
+    stable (no load change for a few readings) and idle (below the offline
+    power threshold). Stable and idle meters are evaluated at most once per
+    tier interval and within a per-tier evaluations/s budget. Load changes are
+    not detected here: the caller passes the ChangeDetector's verdict on the
+    reading, and a step (or a meter without a decision yet) promotes the meter
+    to active and is always evaluated immediately. When the process CPU use is
+    above the target, the stable and idle intervals are stretched by a
+    throttle factor.
+    """
+    def __init__(self, idle_power: float = RATE_IDLE_POWER, stable_after: int = RATE_STABLE_AFTER,
+                 intervals: Optional[Dict[str, float]] = None, budgets: Optional[Dict[str, float]] = None,
+                 cpu_target: float = RATE_CPU_TARGET, max_throttle: float = RATE_MAX_THROTTLE):
+        self.idle_power = idle_power
+        self.stable_after = stable_after
+        self.intervals = intervals or {"active": 0.0, "stable": RATE_STABLE_INTERVAL, "idle": RATE_IDLE_INTERVAL}
+        budgets = budgets or {"active": RATE_BUDGET_ACTIVE, "stable": RATE_BUDGET_STABLE, "idle": RATE_BUDGET_IDLE}
+        self._buckets = {tier: _TokenBucket(budgets.get(tier, 0.0)) for tier in TIERS}
+        self.cpu_target = cpu_target
+        self.max_throttle = max_throttle
+        self.throttle = 1.0
+        self.cpu_usage = 0.0
+        self._cpu_mark = (time.perf_counter(), time.process_time())
+        self._cores = os.cpu_count() or 1
+        self._meters: Dict[str, _MeterRate] = {}
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.skipped = 0
+        self.reasons: Dict[str, int] = {}
+
+    def _update_throttle(self):
+        """
+        Sample process CPU use about once a second and adjust the throttle factor.
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        elapsed = wall - self._cpu_mark[0]
+        if elapsed < 1.0:
+            return
+        self.cpu_usage = (cpu - self._cpu_mark[1]) / elapsed / self._cores
+        self._cpu_mark = (wall, cpu)
+        if self.cpu_usage > self.cpu_target:
+            self.throttle = min(self.max_throttle, self.throttle * 1.5)
+        else:
+            self.throttle = max(1.0, self.throttle / 1.25)
+
+    def admit(self, key: str, reading: dict, change: Tuple[bool, str],
+              now: Optional[float] = None) -> Tuple[bool, str, str]:
+        """
+        Decide whether `reading` of meter `key` is evaluated now, given the
+        ChangeDetector's (infer, reason) verdict on it. Returns (evaluate, tier, reason).
+        """
+        now = time.time() if now is None else now
+        power = reading.get('Power', 0.0)
+
+        with self._lock:
+            self._update_throttle()
+            state = self._meters.get(key)
+            if state is None:
+                state = self._meters[key] = _MeterRate()
+
+            reason = _PROMOTING.get(change[1])
+            if reason is not None:
+                state.tier = "active"
+                state.calm = 0
+            else:
+                state.calm += 1
+                if power < self.idle_power:
+                    state.tier = "idle"
+                elif state.calm >= self.stable_after:
+                    state.tier = "stable"
+                else:
+                    state.tier = "active"
+
+                interval = self.intervals.get(state.tier, 0.0)
+                if state.tier != "active":
+                    interval *= self.throttle
+                if now - state.evaluated_at < interval:
+                    reason = "interval"
+                elif not self._buckets[state.tier].take(now):
+                    reason = "budget"
+                else:
+                    reason = "due"
+
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            if reason in ("interval", "budget"):
+                self.skipped += 1
+                return False, state.tier, reason
+
+            state.evaluated_at = now
+            self.evaluated += 1
+            return True, state.tier, reason
+
+    def forget(self, key: str):
+        with self._lock:
+            self._meters.pop(key, None)
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        with self._lock:
+            meters = list(self._meters.items())
+        return {
+            "meters": str_array(k for k, _ in meters),
+            "tiers": np.array([TIERS.index(s.tier) for _, s in meters], dtype=np.int8),
+            "calm": np.array([s.calm for _, s in meters], dtype=np.int32),
+            "evaluated_at": np.array([s.evaluated_at for _, s in meters], dtype=float),
+        }
+
+    def import_state(self, state: Dict[str, np.ndarray]):
+        restored = {}
+        for key, tier, calm, evaluated_at in zip(
+                state["meters"], state["tiers"], state["calm"], state["evaluated_at"].tolist()):
+            meter = _MeterRate()
+            meter.tier = TIERS[int(tier)]
+            meter.calm = int(calm)
+            meter.evaluated_at = evaluated_at
+            restored[str(key)] = meter
+        with self._lock:
+            self._meters.update(restored)
+
+    def stats(self) -> dict:
+        tiers = {tier: 0 for tier in TIERS}
+        for state in list(self._meters.values()):
+            tiers[state.tier] += 1
+        total = self.evaluated + self.skipped
+        return {
+            "meters": tiers,
+            "evaluated": self.evaluated,
+            "skipped": self.skipped,
+            "skip_rate": self.skipped / total if total else 0.0,
+            "reasons": dict(self.reasons),
+            "throttle": self.throttle,
+            "cpu_usage": self.cpu_usage,
+        }
+
+rate_controller_instance = RateController()
@@ -0,0 +1,66 @@
+import json
+import time
+import hashlib
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+
+class ReadCache:
+    """
+    Short-lived cache for Firebase reads served over HTTP.
+    Each entry keeps a content ETag, so a poll whose If-None-Match matches a
+    fresh entry can be answered with 304 without touching Firebase.
+    """
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[tuple, Tuple[float, object, str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_etag(value) -> str:
+        body = json.dumps(value, sort_keys=True, default=str).encode()
+        return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+    def _fresh(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] < self.ttl_seconds:
+            return entry
+        return None
+
+    def peek_etag(self, key: tuple) -> Optional[str]:
+        entry = self._fresh(key)
+        return entry[2] if entry else None
+
+    def get(self, key: tuple, loader: Callable):
+        """
+        Cached (value, etag) for key, calling loader() on a miss. Failed loads (None) are not cached.
+        """
+        entry = self._fresh(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1], entry[2]
+
+        self.misses += 1
+        value = loader()
+        if value is None:
+            return None, None
+        etag = self.make_etag(value)
+        with self._lock:
+            self._entries[key] = (time.time(), value, etag)
+        return value, etag
+
+    def invalidate(self):
+        with self._lock:
+            self._entries = {}
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag in candidates or "*" in candidates
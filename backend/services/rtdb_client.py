@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import concurrent.futures
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import httpx
+except ImportError:  # SDK-only deployments
+    httpx = None
+
+# Use the REST client for bulk RTDB access (falls back to the Admin SDK on errors)
+RTDB_REST_ENABLED = os.getenv("RTDB_REST_ENABLED", "1") == "1"
+# Base URL of the database; a local stand-in such as http://127.0.0.1:9000 for offline runs
+RTDB_REST_URL = os.getenv("RTDB_REST_URL") or os.getenv(
+    'FIREBASE_DATABASE_URL', 'https://smartenergymeter-91219-default-rtdb.firebaseio.com')
+RTDB_MAX_CONNECTIONS = int(os.getenv("RTDB_MAX_CONNECTIONS", "20"))
+RTDB_MAX_CONCURRENCY = int(os.getenv("RTDB_MAX_CONCURRENCY", "64"))
+
+
+class PreconditionFailed(Exception):
+    """
+    A conditional write was rejected because the ETag no longer matches.
+    Carries the current value and ETag so the caller can retry.
+    """
+    def __init__(self, value, etag: str):
+        super().__init__("ETag mismatch")
+        self.value = value
+        self.etag = etag
+
+
+class RTDBRestClient:
+    """
+    Pooled, keep-alive async client for the RTDB REST API.
+
+    One httpx.AsyncClient (HTTP/2 where the server supports it, otherwise a
+    pool of keep-alive HTTP/1.1 connections) lives on a private event loop
+    thread, so both async endpoints and the threaded realtime pipeline share the
+    same connections. Reads for many paths fan out concurrently under a
+    semaphore, and plain-path reads remember ETags for conditional requests.
+    """
+    def __init__(self, base_url: str = RTDB_REST_URL, use_credentials: bool = True,
+                 max_connections: int = RTDB_MAX_CONNECTIONS, max_concurrency: int = RTDB_MAX_CONCURRENCY,
+                 http2: bool = True, timeout: float = 10.0):
+        self.base_url = base_url.rstrip("/")
+        self.use_credentials = use_credentials
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.http2 = http2
+        self.timeout = timeout
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._token = None
+        self._token_expiry = 0.0
+        self._etags: Dict[str, Tuple[str, object]] = {}
+        self.counters = {"requests": 0, "errors": 0, "not_modified": 0, "bytes": 0}
+        self._latency_total = 0.0
+
+    @property
+    def available(self) -> bool:
+        return httpx is not None
+
+    # --- event loop ownership -------------------------------------------------
+
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=loop.run_forever, name="rtdb-rest", daemon=True)
+            self._thread.start()
+            self._loop = loop
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Run a coroutine of this client from synchronous code and wait for it.
+        """
+        self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # A request given up on must not land later (e.g. a stale lease renewal).
+            # Before Python 3.11 this is not the builtin TimeoutError.
+            future.cancel()
+            raise
+
+    async def call(self, coro):
+        """
+        Await a coroutine of this client from another event loop (e.g. FastAPI's).
+        """
+        self._ensure_loop()
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._client is not None:
+            self.run(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._client = None
+
+    # --- plumbing -------------------------------------------------------------
+
+    def _get_client(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            try:
+                self._client = httpx.AsyncClient(http2=self.http2, limits=limits, timeout=self.timeout)
+            except ImportError:
+                # h2 not installed: keep-alive HTTP/1.1 pool
+                self._client = httpx.AsyncClient(limits=limits, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    async def _auth_headers(self) -> dict:
+        if not self.use_credentials:
+            return {}
+        if self._token is None or time.time() > self._token_expiry - 60:
+            import firebase_admin
+            credential = firebase_admin.get_app().credential
+            info = await asyncio.to_thread(credential.get_access_token)
+            self._token = info.access_token
+            self._token_expiry = info.expiry.timestamp() if info.expiry else time.time() + 3000
+        return {"Authorization": f"Bearer {self._token}"}
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}/{path.strip('/')}.json"
+
+    async def _request(self, method: str, path: str, params: Optional[dict] = None,
+                       body=None, headers: Optional[dict] = None):
+        client = self._get_client()
+        request_headers = {**(await self._auth_headers()), **(headers or {})}
+        query = {k: json.dumps(v) if k in ("orderBy", "startAt", "endAt", "equalTo") else v
+                 for k, v in (params or {}).items()}
+        content = json.dumps(body) if body is not None else None
+
+        async with self._semaphore:
+            t0 = time.perf_counter()
+            try:
+                response = await client.request(method, self._url(path), params=query,
+                                                content=content, headers=request_headers)
+            except Exception:
+                self.counters["errors"] += 1
+                raise
+            self._latency_total += time.perf_counter() - t0
+        self.counters["requests"] += 1
+        self.counters["bytes"] += len(response.content)
+        if response.status_code >= 400 and response.status_code != 412:
+            self.counters["errors"] += 1
+            response.raise_for_status()
+        return response
+
+    # --- RTDB operations ------------------------------------------------------
+
+    async def get(self, path: str, params: Optional[dict] = None):
+        response = await self._request("GET", path, params=params)
+        return response.json()
+
+    async def get_conditional(self, path: str) -> Tuple[object, bool]:
+        """
+        Read a plain path using its last ETag. Returns (value, changed); when the
+        server reports the same ETag the cached value is returned with changed=False.
+        """
+        key = path.strip("/")
+        cached = self._etags.get(key)
+        headers = {"X-Firebase-ETag": "true"}
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        response = await self._request("GET", path, headers=headers)
+        etag = response.headers.get("ETag")
+        if cached and (response.status_code == 304 or etag == cached[0]):
+            self.counters["not_modified"] += 1
+            return cached[1], False
+        value = response.json()
+        if etag:
+            self._etags[key] = (etag, value)
+        return value, True
+
+    async def get_with_etag(self, path: str) -> Tuple[object, Optional[str]]:
+        response = await self._request("GET", path, headers={"X-Firebase-ETag": "true"})
+        return response.json(), response.headers.get("ETag")
+
+    async def put(self, path: str, value, if_match: Optional[str] = None) -> Optional[str]:
+        """
+        Write a value; with if_match, only if the stored ETag still matches
+        (raises PreconditionFailed otherwise). Returns the new ETag when known.
+        """
+        headers = {"X-Firebase-ETag": "true"}
+        if if_match is not None:
+            headers["if-match"] = if_match
+        response = await self._request("PUT", path, body=value, headers=headers)
+        if response.status_code == 412:
+            raise PreconditionFailed(response.json(), response.headers.get("ETag"))
+        self._etags.pop(path.strip("/"), None)
+        return response.headers.get("ETag")
+
+    async def patch(self, path: str, updates: dict):
+        response = await self._request("PATCH", path, body=updates)
+        return response.json()
+
+    async def post(self, path: str, value) -> str:
+        response = await self._request("POST", path, body=value)
+        return response.json()["name"]
+
+    async def delete(self, path: str):
+        await self._request("DELETE", path)
+
+    async def get_many(self, paths: Iterable[str], params: Optional[dict] = None) -> List[object]:
+        """
+        Read many paths concurrently over the shared pool. Failed reads come back as exceptions.
+        """
+        return await asyncio.gather(*(self.get(p, params) for p in paths), return_exceptions=True)
+
+    async def user_ids(self) -> List[str]:
+        """
+        Ids of all users under SmartMeter/users (shallow read, no readings transferred).
+        """
+        users = await self.get("SmartMeter/users", {"shallow": "true"})
+        return sorted(users) if isinstance(users, dict) else []
+
+    async def recent_readings_many(self, user_ids: List[str], limit: int = 7) -> Dict[str, object]:
+        """
+        Last `limit` raw readings of each user, keyed by user id (None where the read failed).
+        """
+        params = {"orderBy": "$key", "limitToLast": limit}
+        snapshots = await self.get_many([f"SmartMeter/users/{u}/data" for u in user_ids], params)
+        return {u: (None if isinstance(s, Exception) else (s or {})) for u, s in zip(user_ids, snapshots)}
+
+    def stats(self) -> dict:
+        requests = self.counters["requests"]
+        return {
+            **self.counters,
+            "enabled": RTDB_REST_ENABLED and self.available,
+            "base_url": self.base_url,
+            "latency_ms_mean": self._latency_total * 1000.0 / requests if requests else None,
+        }
+
+rtdb_rest_client = RTDBRestClient()
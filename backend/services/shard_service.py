@@ -0,0 +1,284 @@
+import os
+import time
+import bisect
+import asyncio
+import hashlib
+import threading
+import concurrent.futures
+from typing import Callable, Dict, Iterable, List, Optional
+from services.rtdb_client import RTDBRestClient, PreconditionFailed, rtdb_rest_client
+
+# Name of this backend node; sharding is off when unset
+SHARD_NODE_ID = os.getenv("SHARD_NODE_ID")
+# A node (and each lease it holds) counts as gone this long after its last heartbeat
+SHARD_LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", "15"))
+SHARD_HEARTBEAT_SECONDS = float(os.getenv("SHARD_HEARTBEAT_SECONDS", "5"))
+# A node stops processing a user this long before its lease runs out in the store
+SHARD_LEASE_MARGIN_SECONDS = float(os.getenv("SHARD_LEASE_MARGIN_SECONDS", "3"))
+# Virtual nodes per node on the hash ring
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "64"))
+# RTDB path of the membership and lease records
+SHARD_PATH = os.getenv("SHARD_PATH", "shards")
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring of node names with `vnodes` points per node. Adding or
+    removing a node only moves the keys between its points and their neighbours
+    (about 1/N of all keys).
+    """
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = SHARD_VNODES):
+        self.vnodes = vnodes
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [n for _, n in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._hashes:
+            return None
+        i = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[i]
+
+    def assign(self, keys: Iterable[str]) -> Dict[str, str]:
+        return {key: self.owner(key) for key in keys}
+
+
+class ShardCoordinator:
+    """
+    Splits meters (user ids) across backend nodes.
+
+    Every heartbeat a node refreshes its membership record under
+    {path}/nodes, builds a hash ring of the nodes whose record has not expired,
+    and keeps leases under {path}/leases for the users the ring assigns to it.
+    Leases are taken and renewed with conditional writes (ETag if-match), so
+    only one node can hold a user's lease at a time even when two nodes
+    briefly disagree about membership. A node gives a user up when the ring
+    moves it elsewhere (the new owner takes the lease once it is released).
+    Locally a lease ends lease_margin_seconds before it does in the store, and
+    a watchdog thread (independent of the heartbeat, which may be blocked on a
+    hanging request) stops processing a user once that local expiry passes
+    without a renewal. All requests of one heartbeat share a deadline of
+    (lease - margin - heartbeat) / 2, so a healthy node always renews in time
+    and a failing one stops before another node can take its users.
+    on_acquire/on_release start and stop the processing. Expiry uses
+    wall-clock time, so node clocks must be in sync within the margin.
+    """
+    def __init__(self, node_id: str, user_ids: Iterable[str],
+                 on_acquire: Callable[[str], None], on_release: Callable[[str], None],
+                 store: RTDBRestClient = None, path: str = SHARD_PATH,
+                 lease_seconds: float = SHARD_LEASE_SECONDS,
+                 heartbeat_seconds: float = SHARD_HEARTBEAT_SECONDS,
+                 lease_margin_seconds: float = SHARD_LEASE_MARGIN_SECONDS, vnodes: int = SHARD_VNODES):
+        self.node_id = node_id
+        self.user_ids: List[str] = list(dict.fromkeys(user_ids))
+        self.on_acquire = on_acquire
+        self.on_release = on_release
+        self.store = store or rtdb_rest_client
+        self.path = path.strip("/")
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_margin_seconds = lease_margin_seconds
+        # Two heartbeats' worth of requests plus the pause between them fit inside the local lease
+        self.call_timeout = (lease_seconds - lease_margin_seconds - heartbeat_seconds) / 2
+        if self.call_timeout <= 0:
+            raise ValueError("SHARD_LEASE_SECONDS must exceed SHARD_HEARTBEAT_SECONDS + SHARD_LEASE_MARGIN_SECONDS")
+        self.vnodes = vnodes
+        self.ring = HashRing(vnodes=vnodes)
+        self.owned: Dict[str, float] = {}  # user id -> local lease expiry
+        self.is_running = False
+        self._thread = None
+        self._watchdog = None
+        self._stop = threading.Event()
+        self._lock = threading.RLock()
+        self.counters = {"ticks": 0, "acquired": 0, "released": 0, "expired": 0,
+                         "conflicts": 0, "errors": 0, "rebalances": 0}
+
+    def _call(self, coro, deadline: float):
+        # Every request of a heartbeat shares one deadline, well inside the local lease
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            coro.close()
+            raise TimeoutError("heartbeat deadline passed")
+        try:
+            return self.store.run(coro, timeout=remaining)
+        except (TimeoutError, concurrent.futures.TimeoutError):
+            raise TimeoutError(f"no reply within {remaining:.1f} s") from None
+
+    # --- membership -----------------------------------------------------------
+
+    def _heartbeat(self, now: float, deadline: float) -> List[str]:
+        self._call(self.store.put(f"{self.path}/nodes/{self.node_id}",
+                                  {"expires": now + self.lease_seconds}), deadline)
+        nodes = self._call(self.store.get(f"{self.path}/nodes"), deadline) or {}
+        live = [n for n, record in nodes.items()
+                if isinstance(record, dict) and record.get("expires", 0) > now]
+        return sorted(set(live) | {self.node_id})
+
+    # --- leases ---------------------------------------------------------------
+
+    async def _try_lease(self, user_id: str, now: float) -> bool:
+        """
+        Take or renew the lease of a user. False if another node holds it.
+        """
+        path = f"{self.path}/leases/{user_id}"
+        lease, etag = await self.store.get_with_etag(path)
+        if isinstance(lease, dict) and lease.get("owner") != self.node_id and lease.get("expires", 0) > now:
+            return False
+        try:
+            await self.store.put(path, {"owner": self.node_id, "expires": now + self.lease_seconds}, if_match=etag)
+        except PreconditionFailed:
+            self.counters["conflicts"] += 1
+            return False
+        return True
+
+    async def _release_lease(self, user_id: str):
+        """
+        Mark our lease as expired so the next owner can take it right away.
+        """
+        path = f"{self.path}/leases/{user_id}"
+        lease, etag = await self.store.get_with_etag(path)
+        if isinstance(lease, dict) and lease.get("owner") == self.node_id:
+            try:
+                await self.store.put(path, {"owner": self.node_id, "expires": 0}, if_match=etag)
+            except PreconditionFailed:
+                pass
+
+    async def _gather(self, coros) -> list:
+        # Lease requests of all users fan out concurrently over the client's pool
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+    def _release_all(self, user_ids: List[str], deadline: float):
+        for user_id in user_ids:
+            self._drop(user_id, "released")
+        results = self._call(self._gather([self._release_lease(u) for u in user_ids]), deadline) if user_ids else []
+        for user_id, result in zip(user_ids, results):
+            if isinstance(result, Exception):
+                self.counters["errors"] += 1
+                print(f"[ShardCoordinator] Could not release {user_id}: {result}")
+
+    def _drop(self, user_id: str, reason: str):
+        with self._lock:
+            if self.owned.pop(user_id, None) is None:
+                return
+            self.counters[reason] += 1
+            try:
+                self.on_release(user_id)
+            except Exception as e:
+                print(f"[ShardCoordinator] on_release failed for {user_id}: {e}")
+
+    def expire(self, now: float):
+        """
+        Stop processing every user whose local lease has run out without a renewal.
+        """
+        with self._lock:
+            expired = [u for u, expires in self.owned.items() if expires <= now]
+            for user_id in expired:
+                print(f"[ShardCoordinator] Lease of {user_id} expired without renewal")
+                self._drop(user_id, "expired")
+
+    def tick(self):
+        """
+        One heartbeat: refresh membership, release users that moved away,
+        acquire or renew the users this node owns.
+        """
+        now = time.time()
+        deadline = now + self.call_timeout
+        self.counters["ticks"] += 1
+        self.expire(now)
+
+        try:
+            nodes = self._heartbeat(now, deadline)
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"[ShardCoordinator] Heartbeat failed: {e}")
+            return
+        if nodes != self.ring.nodes:
+            print(f"[ShardCoordinator] {self.node_id}: ring is now {nodes}")
+            self.ring = HashRing(nodes, self.vnodes)
+            self.counters["rebalances"] += 1
+
+        mine = sorted(u for u in self.user_ids if self.ring.owner(u) == self.node_id)
+        try:
+            self._release_all([u for u in list(self.owned) if u not in set(mine)], deadline)
+            results = self._call(self._gather([self._try_lease(u, now) for u in mine]), deadline)
+        except Exception as e:
+            self.counters["errors"] += 1
+            print(f"[ShardCoordinator] Lease requests failed: {e}")
+            return
+
+        expires = now + self.lease_seconds - self.lease_margin_seconds
+        with self._lock:
+            for user_id, held in zip(mine, results):
+                if isinstance(held, Exception):
+                    self.counters["errors"] += 1
+                    print(f"[ShardCoordinator] Lease request for {user_id} failed: {held}")
+                    continue
+                if not held:
+                    self._drop(user_id, "released")
+                    continue
+                if expires <= time.time():
+                    # Renewed too late to be safe; the watchdog stops it
+                    continue
+                if user_id not in self.owned:
+                    self.counters["acquired"] += 1
+                    try:
+                        self.on_acquire(user_id)
+                    except Exception as e:
+                        print(f"[ShardCoordinator] on_acquire failed for {user_id}: {e}")
+                self.owned[user_id] = expires
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.tick()
+            self._stop.wait(self.heartbeat_seconds)
+
+    def _watch_loop(self):
+        # Checked several times per margin, so processing ends before the store lease does
+        while not self._stop.wait(self.lease_margin_seconds / 4):
+            self.expire(time.time())
+
+    def start(self):
+        if self.is_running:
+            return
+        print(f"[ShardCoordinator] Node {self.node_id} joining with {len(self.user_ids)} candidate users")
+        self.is_running = True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="shard-coordinator", daemon=True)
+        self._thread.start()
+        self._watchdog = threading.Thread(target=self._watch_loop, name="shard-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        """
+        Leave the cluster: stop processing, release all leases and remove the
+        membership record so other nodes rebalance on their next heartbeat.
+        """
+        if not self.is_running:
+            return
+        self.is_running = False
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat_seconds + self.call_timeout * 2)
+        if self._watchdog:
+            self._watchdog.join(timeout=self.lease_margin_seconds)
+        try:
+            deadline = time.time() + self.call_timeout
+            self._release_all(list(self.owned), deadline)
+            self._call(self.store.delete(f"{self.path}/nodes/{self.node_id}"), deadline)
+        except Exception as e:
+            print(f"[ShardCoordinator] Could not leave cleanly: {e}")
+        print(f"[ShardCoordinator] Node {self.node_id} left")
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "node_id": self.node_id,
+            "nodes": self.ring.nodes,
+            "candidates": len(self.user_ids),
+            "owned": sorted(self.owned),
+        }
@@ -0,0 +1,102 @@
+import time
+import threading
+from typing import Dict, List
+
+
+class StatusSink:
+    """
+    Destination of the pipeline's side effects: device statuses and alerts.
+    """
+    def update_device_status(self, device_id: str, status: dict):
+        raise NotImplementedError
+
+    def update_firestore_device_status(self, device_name: str, status_str: str):
+        raise NotImplementedError
+
+    def update_device_statuses(self, statuses: Dict[str, dict]):
+        """
+        Merge several device statuses keyed by device id. Sinks that can batch override this.
+        """
+        for device_id, status in statuses.items():
+            self.update_device_status(device_id, status)
+
+    def add_alert(self, alert: dict):
+        raise NotImplementedError
+
+    def add_alerts(self, alerts: Dict[str, dict]):
+        """
+        Write several alerts keyed by push key. Sinks that can batch override this.
+        """
+        for alert in alerts.values():
+            self.add_alert(alert)
+
+
+class FirebaseSink(StatusSink):
+    """
+    Writes straight to RTDB / Firestore through services.firebase_service.
+    Batch writes and Firestore updates raise when Firebase reports a failure.
+    """
+    def update_device_status(self, device_id: str, status: dict):
+        from services.firebase_service import update_device_status
+        update_device_status(device_id, status)
+
+    def update_firestore_device_status(self, device_name: str, status_str: str):
+        from services.firebase_service import update_firestore_device_status
+        if not update_firestore_device_status(device_name, status_str):
+            raise RuntimeError(f"Failed to update Firestore device {device_name}")
+
+    def update_device_statuses(self, statuses: Dict[str, dict]):
+        from services.firebase_service import update_device_statuses
+        if not update_device_statuses(statuses):
+            raise RuntimeError(f"Failed to update {len(statuses)} devices")
+
+    def add_alert(self, alert: dict):
+        from services.firebase_service import add_alert
+        add_alert(alert)
+
+    def add_alerts(self, alerts: Dict[str, dict]):
+        from services.firebase_service import add_alerts
+        if not add_alerts(alerts):
+            raise RuntimeError(f"Failed to write {len(alerts)} alerts")
+
+
+class MemorySink(StatusSink):
+    """
+    In-memory stand-in for Firebase, used by the replay harness and offline checks.
+    Keeps the latest value per path and counts writes.
+    """
+    def __init__(self, keep_alerts: int = 1000):
+        self.devices: Dict[str, dict] = {}
+        self.firestore_devices: Dict[str, str] = {}
+        self.alerts: List[dict] = []
+        self.keep_alerts = keep_alerts
+        self.writes = 0
+        self.last_write_at = 0.0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        self.writes += 1
+        self.last_write_at = time.perf_counter()
+
+    def update_device_status(self, device_id: str, status: dict):
+        with self._lock:
+            self.devices.setdefault(device_id, {}).update(status)
+            self._count()
+
+    def update_firestore_device_status(self, device_name: str, status_str: str):
+        with self._lock:
+            self.firestore_devices[device_name] = status_str
+            self._count()
+
+    def add_alert(self, alert: dict):
+        with self._lock:
+            self.alerts.append(alert)
+            if len(self.alerts) > self.keep_alerts:
+                self.alerts.pop(0)
+            self._count()
+
+    def add_alerts(self, alerts: Dict[str, dict]):
+        with self._lock:
+            self.alerts.extend(alerts.values())
+            del self.alerts[:max(0, len(self.alerts) - self.keep_alerts)]
+            self._count()
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Snapshot file of the per-user pipeline state; empty disables snapshots
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(BASE_DIR, "pipeline_state.npz"))
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "60"))
+# Snapshots older than this are not restored (the state would be misleading)
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "3600"))
+
+
+def str_array(values) -> np.ndarray:
+    """
+    Keys as a fixed-width unicode array (loads without pickle). None becomes "".
+    """
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def bits_array(decisions, width: int) -> np.ndarray:
+    """
+    Bit vectors (or [[bits]] decisions) as an (n, width) int8 array, -1 rows for None.
+    """
+    out = np.full((len(decisions), width), -1, dtype=np.int8)
+    for row, decision in enumerate(decisions):
+        if decision is not None:
+            bits = np.asarray(decision).reshape(-1)[:width]
+            out[row, :len(bits)] = bits
+    return out
+
+
+def bits_value(row: np.ndarray):
+    return None if row[0] < 0 else [int(b) for b in row]
+
+
+class SnapshotService:
+    """
+    Periodic binary snapshots of the pipeline's per-user in-memory state, so a
+    restarted process continues where it stopped instead of rebuilding change
+    detector references, data-quality references, fluctuation windows, alert
+    suppression, aggregates and heartbeat clocks from cold.
+
+    Components register under a name and implement export_state() -> dict of
+    numpy arrays and import_state(dict). All arrays go into one .npz file,
+    written to a temporary file and renamed, so a crash never leaves a torn
+    snapshot. restore() runs once at startup, before the processors start.
+    """
+    def __init__(self, path: Optional[str] = SNAPSHOT_PATH, interval_seconds: float = SNAPSHOT_INTERVAL_SECONDS,
+                 max_age_seconds: float = SNAPSHOT_MAX_AGE_SECONDS):
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self._components: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.saves = 0
+        self.last_save: Optional[dict] = None
+        self.last_restore: Optional[dict] = None
+
+    def register(self, name: str, component):
+        self._components[name] = component
+
+    def save(self) -> Optional[dict]:
+        if not self.path:
+            return None
+        t0 = time.perf_counter()
+        arrays = {"_meta/saved_at": np.array(time.time())}
+        for name, component in self._components.items():
+            try:
+                for key, value in component.export_state().items():
+                    arrays[f"{name}/{key}"] = np.asarray(value)
+            except Exception as e:
+                print(f"[SnapshotService] Could not export {name}: {e}")
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self.path)
+        self.saves += 1
+        self.last_save = {
+            "at": time.time(),
+            "ms": (time.perf_counter() - t0) * 1000.0,
+            "bytes": os.path.getsize(self.path),
+        }
+        return self.last_save
+
+    def restore(self) -> List[str]:
+        """
+        Load the last snapshot into the registered components. Returns the names restored.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return []
+        t0 = time.perf_counter()
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                arrays = {key: data[key] for key in data.files}
+        except Exception as e:
+            print(f"[SnapshotService] Could not read {self.path}: {e}")
+            return []
+        age = time.time() - float(arrays.get("_meta/saved_at", 0.0))
+        if age > self.max_age_seconds:
+            print(f"[SnapshotService] Snapshot is {age:.0f}s old, starting cold")
+            return []
+
+        restored = []
+        for name, component in self._components.items():
+            prefix = f"{name}/"
+            state = {key[len(prefix):]: value for key, value in arrays.items() if key.startswith(prefix)}
+            if not state:
+                continue
+            try:
+                component.import_state(state)
+                restored.append(name)
+            except Exception as e:
+                print(f"[SnapshotService] Could not restore {name}: {e}")
+        self.last_restore = {"at": time.time(), "ms": (time.perf_counter() - t0) * 1000.0,
+                             "age_seconds": age, "components": restored}
+        print(f"[SnapshotService] Restored {restored} from a {age:.0f}s old snapshot "
+              f"in {self.last_restore['ms']:.0f} ms")
+        return restored
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"[SnapshotService] Snapshot failed: {e}")
+
+    def start(self):
+        if not self.path or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the periodic snapshots and take a final one.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        try:
+            self.save()
+        except Exception as e:
+            print(f"[SnapshotService] Final snapshot failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "components": list(self._components),
+            "saves": self.saves,
+            "last_save": self.last_save,
+            "last_restore": self.last_restore,
+        }
+
+snapshot_service_instance = SnapshotService()
@@ -0,0 +1,208 @@
+import os
+import time
+import threading
+import numpy as np
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+from services.timestamps import timestamp_seconds
+
+# Seconds between scheduled fleet anomaly sweeps (0 = on demand only)
+ANOMALY_SWEEP_INTERVAL_SECONDS = float(os.getenv("ANOMALY_SWEEP_INTERVAL_SECONDS", "0"))
+# Meters whose latest reading is older than this are reported as stale, not scored
+ANOMALY_SWEEP_MAX_AGE_SECONDS = float(os.getenv("ANOMALY_SWEEP_MAX_AGE_SECONDS", "3600"))
+# Anomalous meters kept in a sweep result
+ANOMALY_SWEEP_TOP = int(os.getenv("ANOMALY_SWEEP_TOP", "100"))
+
+SOURCES = ("auto", "local", "rtdb")
+
+
+class AnomalySweep:
+    """
+    Fleet-wide anomaly check: the latest reading of every known meter scored in
+    one vectorized pass of the anomaly model.
+
+    Latest readings come from local state (the data-quality gate's last accepted
+    reading of each meter this process saw) and, for meters without fresh local
+    state, from one concurrent bulk RTDB read. Readings failing the range checks
+    or older than max_age_seconds are counted and left out. The rest form one
+    N x 4 [Voltage, Global_intensity, power_w, hour] matrix; flagged meters are
+    ranked by score, most anomalous first. A sweep has no side effects (no
+    alerts, no baseline updates); the last result is kept for GET requests.
+    """
+    def __init__(self, ml_service=None, quality_gate=None, known_users: Callable[[], Iterable[str]] = None,
+                 fetch: Callable = None, list_users: Callable[[], List[str]] = None,
+                 interval_seconds: float = ANOMALY_SWEEP_INTERVAL_SECONDS,
+                 max_age_seconds: float = ANOMALY_SWEEP_MAX_AGE_SECONDS, top: int = ANOMALY_SWEEP_TOP):
+        self._ml_service = ml_service
+        self._quality_gate = quality_gate
+        self.known_users = known_users or (lambda: [])
+        self._fetch = fetch
+        self._list_users = list_users
+        self.interval_seconds = interval_seconds
+        self.max_age_seconds = max_age_seconds
+        self.top = top
+        self.last_result: Optional[dict] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {"sweeps": 0, "scheduled": 0, "errors": 0}
+
+    @property
+    def ml_service(self):
+        if self._ml_service is None:
+            from services.ml_service import ml_service_instance
+            self._ml_service = ml_service_instance
+        return self._ml_service
+
+    @property
+    def quality_gate(self):
+        if self._quality_gate is None:
+            from services.data_quality import data_quality_instance
+            self._quality_gate = data_quality_instance
+        return self._quality_gate
+
+    def fetch(self, user_ids: List[str]) -> Dict[str, List[dict]]:
+        if self._fetch is None:
+            from services.firebase_service import fetch_recent_readings_many
+            self._fetch = fetch_recent_readings_many
+        return self._fetch(user_ids, limit=1)
+
+    def list_users(self) -> List[str]:
+        if self._list_users is None:
+            from services.firebase_service import list_user_ids
+            self._list_users = list_user_ids
+        return self._list_users()
+
+    def _local(self, now: float):
+        # meter -> (Irms, Power, Vrms, kWh, timestamp) from the data-quality gate
+        meters, values, stamps = self.quality_gate.latest_readings()
+        return {m: (values[i], stamps[i]) for i, m in enumerate(meters) if now - stamps[i] <= self.max_age_seconds}
+
+    def sweep(self, user_ids: Optional[Iterable[str]] = None, source: str = "auto",
+              discover: bool = False, top: Optional[int] = None) -> dict:
+        """
+        Score the latest reading of every meter and rank the anomalous ones.
+        user_ids defaults to the known users (plus every user in RTDB with
+        discover=True, plus every meter with local state). source 'local' only
+        uses local state, 'rtdb' always reads RTDB, 'auto' reads RTDB only for
+        meters without fresh local state.
+        """
+        if source not in SOURCES:
+            raise ValueError(f"source must be one of {SOURCES}")
+        t0 = time.perf_counter()
+        now = time.time()
+        local = self._local(now) if source != "rtdb" else {}
+        if user_ids is None:
+            users = list(self.known_users())
+            if discover:
+                users += self.list_users()
+            user_ids = users + list(local)
+        user_ids = list(dict.fromkeys(user_ids))
+
+        # Columns: Irms, Power, Vrms, kWh, epoch timestamp
+        rows, meters, sources = [], [], []
+        for user_id in user_ids:
+            if user_id in local:
+                values, ts = local[user_id]
+                rows.append([*values, ts])
+                meters.append(user_id)
+                sources.append("local")
+        remote = [u for u in user_ids if u not in local] if source != "local" else []
+        t1 = time.perf_counter()
+        fetched = self.fetch(remote) if remote else {}
+        fetch_ms = (time.perf_counter() - t1) * 1000.0
+        missing = 0
+        for user_id in remote:
+            latest = (fetched.get(user_id) or [None])[-1]
+            ts = timestamp_seconds(latest.get('timestamp', "")) if latest else np.nan
+            if np.isnan(ts):
+                missing += 1
+                continue
+            rows.append([latest['Irms'], latest['Power'], latest['Vrms'], latest['kWh'], ts])
+            meters.append(user_id)
+            sources.append("rtdb")
+        if source == "local":
+            missing = len([u for u in user_ids if u not in local])
+
+        table = np.array(rows, dtype=np.float64).reshape(-1, 5)
+        irms, power, vrms, stamps = table[:, 0], table[:, 1], table[:, 2], table[:, 4]
+        valid = self.quality_gate.valid_mask(irms, power, vrms)
+        fresh = now - stamps <= self.max_age_seconds
+        scored = valid & fresh
+        idx = np.flatnonzero(scored)
+        hours = np.array([datetime.fromtimestamp(t).hour for t in stamps[idx]], dtype=np.float64)
+        features = np.column_stack([vrms[idx], irms[idx], power[idx], hours])
+
+        t2 = time.perf_counter()
+        flags, scores = self.ml_service.score_anomalies(features)
+        score_ms = (time.perf_counter() - t2) * 1000.0
+
+        order = np.argsort(scores[flags], kind="stable")
+        flagged = idx[flags][order][:top if top is not None else self.top]
+        ranked_scores = scores[flags][order]
+        ranked = [{
+            "user_id": meters[i],
+            "score": float(ranked_scores[rank]),
+            "power": float(power[i]),
+            "vrms": float(vrms[i]),
+            "irms": float(irms[i]),
+            "timestamp": datetime.fromtimestamp(stamps[i]).isoformat(),
+            "source": sources[i],
+        } for rank, i in enumerate(flagged)]
+
+        result = {
+            "at": time.time(),
+            "source": source,
+            "meters": len(user_ids),
+            "scored": int(len(idx)),
+            "anomalies": int(flags.sum()),
+            "invalid": int((~valid).sum()),
+            "stale": int((valid & ~fresh).sum()),
+            "missing": missing,
+            "from_local": sources.count("local"),
+            "from_rtdb": sources.count("rtdb"),
+            "fetch_ms": fetch_ms,
+            "score_ms": score_ms,
+            "total_ms": (time.perf_counter() - t0) * 1000.0,
+            "model_version": self.ml_service.model_version("anomaly"),
+            "ranked": ranked,
+        }
+        with self._lock:
+            self.last_result = result
+        self.counters["sweeps"] += 1
+        print(f"[AnomalySweep] {result['scored']}/{result['meters']} meters scored, "
+              f"{result['anomalies']} anomalous, in {result['total_ms']:.0f} ms")
+        return result
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.sweep(discover=True)
+                self.counters["scheduled"] += 1
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"[AnomalySweep] Scheduled sweep failed: {e}")
+
+    def start(self):
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="anomaly-sweep", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def stats(self) -> dict:
+        last = self.last_result
+        return {
+            **self.counters,
+            "interval_seconds": self.interval_seconds,
+            "last_sweep": {k: v for k, v in last.items() if k != "ranked"} if last else None,
+        }
+
+anomaly_sweep_instance = AnomalySweep()
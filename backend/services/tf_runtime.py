@@ -0,0 +1,166 @@
+import os
+import time
+import threading
+import numpy as np
+import tensorflow as tf
+import keras
+from collections import deque
+from typing import Dict, List, Optional
+
+# TensorFlow thread pools (0 = leave TensorFlow's default of one thread per core).
+# The pools are process-wide, so they are only resized when set explicitly; small
+# pools keep TF from competing with uvicorn and XGBoost for the same cores.
+TF_INTRA_OP_THREADS = int(os.getenv("TF_INTRA_OP_THREADS", "0"))
+TF_INTER_OP_THREADS = int(os.getenv("TF_INTER_OP_THREADS", "0"))
+# XLA-compile the fixed-shape BiLSTM signatures
+BILSTM_XLA = os.getenv("BILSTM_XLA", "1") == "1"
+# Weight/compute dtype of the BiLSTM: float32, float16 or bfloat16
+BILSTM_PRECISION = os.getenv("BILSTM_PRECISION", "float32")
+# Batch sizes with a compiled (batch, 20, 6) signature; larger inputs are chunked
+BILSTM_BATCH_SIZES = [int(b) for b in os.getenv("BILSTM_BATCH_SIZES", "1,8").split(",") if b.strip()]
+
+_threads_configured = None
+
+
+def configure_threads(intra: int = TF_INTRA_OP_THREADS, inter: int = TF_INTER_OP_THREADS) -> dict:
+    """
+    Size TensorFlow's process-wide thread pools; 0 leaves a pool alone. Only
+    effective before TF runs its first op; afterwards the current sizes are
+    kept and reported.
+    """
+    global _threads_configured
+    if _threads_configured is None and (intra > 0 or inter > 0):
+        try:
+            if intra > 0:
+                tf.config.threading.set_intra_op_parallelism_threads(intra)
+            if inter > 0:
+                tf.config.threading.set_inter_op_parallelism_threads(inter)
+            _threads_configured = True
+        except RuntimeError as e:
+            print(f"[TFRuntime] Thread pools already initialized, keeping them: {e}")
+            _threads_configured = False
+    return thread_settings()
+
+
+def thread_settings() -> dict:
+    return {
+        "intra_op": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op": tf.config.threading.get_inter_op_parallelism_threads(),
+        "configured": _threads_configured,
+    }
+
+
+def _recast_config(node, dtype: str):
+    """
+    Copy of a Keras config with every layer policy set to `dtype`. Initializers
+    become zeros: the weights are overwritten anyway, and some (Orthogonal) have
+    no bfloat16 kernel.
+    """
+    if isinstance(node, dict):
+        if node.get("class_name") == "DTypePolicy":
+            return {**node, "config": {**node["config"], "name": dtype}}
+        return {
+            k: dtype if k == "dtype" and isinstance(v, str)
+            else "zeros" if k.endswith("_initializer")
+            else _recast_config(v, dtype)
+            for k, v in node.items()
+        }
+    if isinstance(node, list):
+        return [_recast_config(v, dtype) for v in node]
+    return node
+
+
+class BiLSTMRuntime:
+    """
+    Inference runtime for the forecasting BiLSTM.
+
+    Instead of an eager model.predict per request, inputs go through compiled
+    tf.function signatures of fixed shape (batch, timesteps, features), one per
+    configured batch size, optionally XLA-compiled and with the weights cast to
+    float16/bfloat16. Inputs are zero-padded up to the nearest compiled batch.
+    """
+    def __init__(self, model, precision: str = BILSTM_PRECISION, xla: bool = BILSTM_XLA,
+                 batch_sizes: Optional[List[int]] = None, timesteps: int = 20, n_features: int = 6):
+        self.precision = precision
+        self.xla = xla
+        self.batch_sizes = sorted(set(batch_sizes or BILSTM_BATCH_SIZES)) or [1]
+        self.timesteps = timesteps
+        self.n_features = n_features
+        self.dtype = tf.as_dtype(precision)
+        self.model = self._cast(model, precision)
+        self._signatures: Dict[int, object] = {}
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.warmup_seconds = None
+
+    @staticmethod
+    def _cast(model, precision: str):
+        if precision == "float32":
+            return model
+        cast = keras.Sequential.from_config(_recast_config(model.get_config(), precision))
+        cast.set_weights(model.get_weights())
+        return cast
+
+    def _signature(self, batch: int):
+        fn = self._signatures.get(batch)
+        if fn is not None:
+            return fn
+        with self._lock:
+            fn = self._signatures.get(batch)
+            if fn is None:
+                spec = tf.TensorSpec([batch, self.timesteps, self.n_features], self.dtype)
+                model = self.model
+                fn = tf.function(lambda x: model(x, training=False), jit_compile=self.xla,
+                                 autograph=False, input_signature=[spec])
+                fn = fn.get_concrete_function()
+                self._signatures[batch] = fn
+        return fn
+
+    def warmup(self, rounds: int = 2):
+        """
+        Trace (and XLA-compile) every signature and run it a few times, so the
+        first request does not pay for compilation.
+        """
+        t0 = time.perf_counter()
+        for batch in self.batch_sizes:
+            fn = self._signature(batch)
+            sample = tf.zeros([batch, self.timesteps, self.n_features], self.dtype)
+            for _ in range(rounds):
+                fn(sample)
+        self.warmup_seconds = time.perf_counter() - t0
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """
+        Run an (n, timesteps, features) array through the compiled signatures.
+        Returns float32 outputs of shape (n, outputs).
+        """
+        t0 = time.perf_counter()
+        data = np.asarray(data, dtype=np.float32)
+        n = len(data)
+        largest = self.batch_sizes[-1]
+        outputs = []
+        for start in range(0, n, largest):
+            chunk = data[start:start + largest]
+            batch = next(b for b in self.batch_sizes if b >= len(chunk))
+            if batch > len(chunk):
+                pad = np.zeros((batch - len(chunk),) + chunk.shape[1:], dtype=np.float32)
+                chunk = np.concatenate([chunk, pad])
+            result = self._signature(batch)(tf.constant(chunk, dtype=self.dtype))
+            outputs.append(tf.cast(result, tf.float32).numpy()[:min(largest, n - start)])
+        self.calls += 1
+        self.latencies.append(time.perf_counter() - t0)
+        return np.concatenate(outputs) if outputs else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self) -> dict:
+        lat_ms = np.array(self.latencies) * 1000.0
+        return {
+            "precision": self.precision,
+            "xla": self.xla,
+            "batch_sizes": self.batch_sizes,
+            "threads": thread_settings(),
+            "warmup_seconds": self.warmup_seconds,
+            "calls": self.calls,
+            "latency_ms_p50": float(np.percentile(lat_ms, 50)) if len(lat_ms) else None,
+            "latency_ms_p95": float(np.percentile(lat_ms, 95)) if len(lat_ms) else None,
+        }
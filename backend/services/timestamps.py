@@ -0,0 +1,47 @@
+import math
+from datetime import datetime
+from typing import Optional
+
+# Meter readings are keyed in the RTDB by local time: '2026-02-18_10:48:30_286'
+KEY_FORMAT = "%Y-%m-%d_%H:%M:%S"
+
+
+def timestamp_key(dt: datetime) -> str:
+    """
+    RTDB key of a reading taken at `dt`.
+    """
+    return dt.strftime(KEY_FORMAT + "_") + f"{dt.microsecond // 1000:03d}"
+
+
+def parse_timestamp(ts) -> Optional[datetime]:
+    """
+    Local datetime of an RTDB key timestamp; the milliseconds part is optional. Epoch seconds,
+    as a number or a numeric string, are accepted too. None if `ts` is neither.
+    """
+    try:
+        parts = str(ts).split('_')
+        if len(parts) in (2, 3):
+            ms = int(parts[2]) if len(parts) == 3 else 0
+            return datetime.strptime(f"{parts[0]}_{parts[1]}", KEY_FORMAT).replace(microsecond=ms * 1000)
+    except (TypeError, ValueError):
+        pass
+    try:
+        seconds = float(ts)
+        return datetime.fromtimestamp(seconds) if math.isfinite(seconds) else None
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def timestamp_seconds(ts) -> float:
+    """
+    Epoch seconds of a reading timestamp, NaN if it cannot be parsed.
+    """
+    dt = parse_timestamp(ts)
+    return dt.timestamp() if dt is not None else math.nan
+
+
+def reading_time(reading: dict) -> datetime:
+    """
+    When a reading was taken; readings without a usable timestamp count as now.
+    """
+    return parse_timestamp(reading.get('timestamp', "")) or datetime.now()
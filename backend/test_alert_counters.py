@@ -0,0 +1,59 @@
+import os
+import threading
+import firebase_admin
+from firebase_admin import db
+from local_rtdb_server import start_local_rtdb
+from services import firebase_service
+
+
+def _alerts():
+    return {"-a1": {"message": "m1", "is_read": False}, "-a2": {"message": "m2", "is_read": False},
+            "-a3": {"message": "m3", "is_read": False}, "-a4": {"message": "m4", "is_read": True}}
+
+
+def test_alert_counters():
+    print("--- Unread counter seeding and transactional acknowledgements (local stand-in) ---")
+    server, url = start_local_rtdb(data={"alerts": _alerts()})
+    # The Admin SDK talks to the stand-in the same way it talks to the emulator
+    os.environ["FIREBASE_DATABASE_EMULATOR_HOST"] = url.split("//")[1]
+    app = firebase_admin.initialize_app(options={"databaseURL": f"{url}?ns=test", "projectId": "test"},
+                                        name="[DEFAULT]") if not firebase_admin._apps else None
+    assert app is not None, "a real Firebase app is already initialized"
+    try:
+        # The first alert after deployment seeds the counter from the existing alerts
+        firebase_service.add_alerts({"-a5": {"message": "m5", "is_read": False}})
+        assert db.reference(firebase_service.UNREAD_COUNT_PATH).get() == 4
+        assert firebase_service.get_unread_alert_count() == 4
+
+        # Concurrent acknowledgements of the same alert decrement once
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(firebase_service.acknowledge_alert("-a1")))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results == [True] * 8
+        assert firebase_service.get_unread_alert_count() == 3
+        assert db.reference("/alerts/-a1").get() == {"message": "m1", "is_read": True}
+
+        # Acknowledging an already read or unknown alert changes nothing
+        assert firebase_service.acknowledge_alert("-a4") is True
+        assert firebase_service.acknowledge_alert("-missing") is None
+        assert db.reference("/alerts/-missing").get() is None
+        assert firebase_service.get_unread_alert_count() == 3
+
+        firebase_service.add_alert({"message": "m6", "is_read": False})
+        assert firebase_service.get_unread_alert_count() == 4
+
+        # Without a counter, the first read counts /alerts once
+        db.reference(firebase_service.UNREAD_COUNT_PATH).delete()
+        assert firebase_service.get_unread_alert_count() == 4
+    finally:
+        firebase_admin.delete_app(app)
+        os.environ.pop("FIREBASE_DATABASE_EMULATOR_HOST", None)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_alert_counters()
@@ -0,0 +1,97 @@
+import time
+from services.alert_service import AlertPipeline
+from services.sinks import MemorySink
+
+
+class _DownSink(MemorySink):
+    """
+    MemorySink whose first `failures` alert batches fail: raised or reported as False.
+    """
+    def __init__(self, failures: int, report_false: bool = False):
+        super().__init__()
+        self.failures = failures
+        self.report_false = report_false
+
+    def add_alerts(self, alerts):
+        if self.failures > 0:
+            self.failures -= 1
+            if self.report_false:
+                return False
+            raise RuntimeError("Firebase unavailable")
+        super().add_alerts(alerts)
+        return True
+
+
+def _pipeline(sink, **kwargs):
+    # Long flush interval: the tests flush by hand unless a batch fills up
+    return AlertPipeline(sink, flush_seconds=60, **kwargs)
+
+
+def test_alert_suppression():
+    print("--- Alert suppression window ---")
+    sink = MemorySink()
+    alerts = _pipeline(sink, suppression_seconds=0.3, burst=10)
+    assert alerts.submit({"title": "Fluctuation"}, "meter-1", "Bulb 1", "fluctuation")
+    # Still queued: a second copy is dropped before it is ever written
+    assert not alerts.submit({"title": "Fluctuation"}, "meter-1", "Bulb 1", "fluctuation")
+    # Other device, type or user are separate keys
+    assert alerts.submit({"title": "Fluctuation"}, "meter-1", "Bulb 2", "fluctuation")
+    assert alerts.submit({"title": "Anomaly"}, "meter-1", "Bulb 1", "anomaly")
+    assert alerts.submit({"title": "Fluctuation"}, "meter-2", "Bulb 1", "fluctuation")
+    assert alerts.flush() == 4 and len(sink.alerts) == 4
+
+    assert alerts.is_suppressed("meter-1", "Bulb 1", "fluctuation")
+    assert not alerts.submit({"title": "Fluctuation"}, "meter-1", "Bulb 1", "fluctuation")
+    time.sleep(0.35)
+    assert not alerts.is_suppressed("meter-1", "Bulb 1", "fluctuation")
+    assert alerts.submit({"title": "Fluctuation"}, "meter-1", "Bulb 1", "fluctuation")
+    assert alerts.counters["suppressed"] == 2
+
+
+def test_alert_token_bucket():
+    print("--- Alert token bucket ---")
+    # Burst of 3, then one token every 0.1 s
+    alerts = _pipeline(MemorySink(), suppression_seconds=0, burst=3, rate_per_minute=600)
+    accepted = [alerts.submit({"title": f"Alert {i}"}, "meter-1", f"Bulb {i}") for i in range(5)]
+    assert accepted == [True, True, True, False, False]
+    assert alerts.counters["rate_limited"] == 2
+    # Buckets are per user
+    assert alerts.submit({"title": "Alert"}, "meter-2", "Bulb 0")
+    time.sleep(0.12)
+    assert alerts.submit({"title": "Alert 5"}, "meter-1", "Bulb 5")
+    assert not alerts.submit({"title": "Alert 6"}, "meter-1", "Bulb 6")
+
+
+def test_alert_batching():
+    print("--- Alert batching and retries ---")
+    # A full batch wakes the flusher: one multi-path write for all of it
+    sink = MemorySink()
+    alerts = _pipeline(sink, burst=10, max_batch=5)
+    for i in range(5):
+        alerts.submit({"title": f"Alert {i}"}, "meter-1", f"Bulb {i}")
+    deadline = time.time() + 5
+    while len(sink.alerts) < 5 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(sink.alerts) == 5 and sink.writes == 1
+    assert alerts.counters["batches"] == 1 and alerts.stats()["pending"] == 0
+
+    # Failed batches, raised or reported, are kept and written by a later flush
+    for report_false in (False, True):
+        sink = _DownSink(failures=2, report_false=report_false)
+        alerts = _pipeline(sink, suppression_seconds=60, burst=10)
+        alerts.submit({"title": "Alert 0"}, "meter-1", "Bulb 0")
+        alerts.submit({"title": "Alert 1"}, "meter-1", "Bulb 1")
+        assert alerts.flush() == 0 and alerts.flush() == 0
+        assert alerts.counters["failed"] == 4 and alerts.stats()["pending"] == 2
+        # Not written yet, but still queued: no duplicate is accepted meanwhile
+        assert not alerts.submit({"title": "Alert 0"}, "meter-1", "Bulb 0")
+        alerts.submit({"title": "Alert 2"}, "meter-1", "Bulb 2")
+        assert alerts.flush() == 3
+        assert [a["title"] for a in sink.alerts] == ["Alert 0", "Alert 1", "Alert 2"]
+        assert alerts.is_suppressed("meter-1", "Bulb 0", "generic")
+
+
+if __name__ == "__main__":
+    test_alert_suppression()
+    test_alert_token_bucket()
+    test_alert_batching()
@@ -0,0 +1,42 @@
+import random
+from services.baseline_service import BaselineProfiler
+
+
+def _reading(day, minute, power, irms):
+    # 2026-02-16 is a Monday
+    return {'timestamp': f"2026-02-{16 + day:02d}_19:{minute:02d}:00_000", 'Power': power, 'Vrms': 230.0, 'Irms': irms}
+
+
+def test_anomaly_prescreen():
+    print("--- Hour-of-day baseline pre-screen ---")
+    random.seed(0)
+    baselines = BaselineProfiler(min_samples=30, band_sigma=3.0, shadow_rate=0.0)
+
+    # Too little history: the model has to decide
+    assert baselines.prescreen("user", _reading(0, 0, 60.0, 0.26)) is None
+
+    for minute in range(60):
+        power = 60.0 + random.gauss(0, 3)
+        baselines.observe("user", _reading(0, minute, power, power / 230.0))
+
+    # In band, but the model has not confirmed this slot yet
+    assert baselines.prescreen("user", _reading(0, 30, 62.0, 0.27)) is None
+    baselines.record_model_result("user", _reading(0, 30, 62.0, 0.27), None, False)
+    assert baselines.prescreen("user", _reading(0, 30, 62.0, 0.27)) is True
+    assert baselines.prescreen("user", _reading(0, 30, 900.0, 3.9)) is False
+    # Another weekday at the same hour has its own (empty) slot
+    assert baselines.prescreen("user", _reading(1, 30, 62.0, 0.27)) is None
+
+    baselines.record_model_result("user", _reading(0, 30, 900.0, 3.9), False, True)
+    # A shadow check the model disagrees with turns the slot off again
+    baselines.record_model_result("user", _reading(0, 30, 61.0, 0.26), True, True)
+    assert baselines.prescreen("user", _reading(0, 30, 62.0, 0.27)) is None
+
+    stats = baselines.stats()
+    print(stats)
+    assert stats["in_band"] == 1 and stats["out_of_band"] == 1 and stats["cold"] == 2 and stats["unverified"] == 2
+    assert stats["agreement"] == 0.0 and stats["out_of_band_anomaly_rate"] == 1.0
+
+
+if __name__ == "__main__":
+    test_anomaly_prescreen()
@@ -0,0 +1,87 @@
+import time
+import numpy as np
+from datetime import datetime, timedelta
+from local_rtdb_server import start_local_rtdb
+from services.rtdb_client import RTDBRestClient
+from services.firebase_service import readings_from_snapshot
+from services.timestamps import timestamp_key
+from services.data_quality import DataQualityGate
+from services.ml_service import ml_service_instance
+from services.sweep_service import AnomalySweep
+
+METERS = 10000
+
+
+def _seed(now: datetime):
+    # Two readings per meter; every 500th has a dead voltage sensor, every 700th stopped reporting 2 h ago
+    rng = np.random.default_rng(0)
+    users = {}
+    for u in range(METERS):
+        latest = now - timedelta(seconds=int(rng.integers(0, 600)) + (7200 if u % 700 == 0 else 0))
+        power = float(rng.choice([0.5, 6.4, 7.7, 10.3, 13.0, 40.0, 450.0]))
+        vrms = 0.0 if u % 500 == 0 else float(rng.normal(228, 4))
+        users[f"meter-{u}"] = {"data": {
+            timestamp_key(latest - timedelta(seconds=2)): {"Irms": "0.05", "Power": "12.0", "Vrms": "230", "kWh": "1.0"},
+            timestamp_key(latest): {"Irms": str(round(power / 228 / 0.95, 5)), "Power": str(power),
+                                     "Vrms": str(round(vrms, 2)), "kWh": "1.2"},
+        }}
+    return {"SmartMeter": {"users": users}}
+
+
+def test_anomaly_sweep():
+    print(f"--- Fleet anomaly sweep over {METERS} meters (local stand-in) ---")
+    now = datetime.now()
+    server, url = start_local_rtdb(data=_seed(now))
+    client = RTDBRestClient(url, use_credentials=False)
+
+    def fetch(user_ids, limit=1):
+        snapshots = client.run(client.recent_readings_many(user_ids, limit))
+        return {u: readings_from_snapshot(s) for u, s in snapshots.items() if s is not None}
+
+    # 300 meters this process has live readings for
+    gate = DataQualityGate()
+    for u in range(300):
+        gate.validate([{'Irms': 0.03, 'Power': 6.5, 'Vrms': 231.0, 'kWh': 1.0, 'timestamp': timestamp_key(now)}],
+                      f"meter-{u}")
+
+    known = [f"meter-{u}" for u in range(METERS)] + ["meter-gone-1", "meter-gone-2"]
+    sweep = AnomalySweep(ml_service_instance, quality_gate=gate, known_users=lambda: known, fetch=fetch,
+                         list_users=lambda: client.run(client.user_ids()), top=50)
+    try:
+        t0 = time.perf_counter()
+        result = sweep.sweep()
+        elapsed = time.perf_counter() - t0
+        print({k: v for k, v in result.items() if k != "ranked"})
+        print(f"Swept {result['meters']} meters in {elapsed:.2f} s "
+              f"(fetch {result['fetch_ms']:.0f} ms, scoring {result['score_ms']:.1f} ms)")
+
+        invalid = len(range(0, METERS, 500)) - 1  # meter-0 has local state
+        stale = len([u for u in range(0, METERS, 700) if u >= 300 and u % 500])
+        assert result["meters"] == METERS + 2 and result["missing"] == 2
+        assert result["from_local"] == 300 and result["from_rtdb"] == METERS - 300
+        assert result["invalid"] == invalid and result["stale"] == stale
+        assert result["scored"] == METERS - invalid - stale
+
+        # Same decisions as scoring each meter on its own, ranked most anomalous first
+        scores = [r["score"] for r in result["ranked"]]
+        assert scores == sorted(scores) and len(scores) == min(50, result["anomalies"])
+        for entry in result["ranked"][:20]:
+            row = [[entry["vrms"], entry["irms"], entry["power"], datetime.fromisoformat(entry["timestamp"]).hour]]
+            assert ml_service_instance.anomaly_model.predict(row)[0] == -1
+            assert abs(ml_service_instance.anomaly_model.decision_function(row)[0] - entry["score"]) < 1e-9
+
+        # Local state only: no RTDB reads at all
+        local = sweep.sweep(source="local")
+        assert local["from_rtdb"] == 0 and local["scored"] == 300
+
+        # Discovery finds the same fleet through a shallow read
+        sweep.known_users = lambda: []
+        discovered = sweep.sweep(discover=True, source="local")
+        assert discovered["meters"] == METERS and discovered["missing"] == METERS - 300
+    finally:
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_anomaly_sweep()
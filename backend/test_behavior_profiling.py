@@ -0,0 +1,47 @@
+import numpy as np
+from services.behavior_service import BehaviorProfiler, BEHAVIOR_FEATURES
+
+
+def _bucket(profiler, start_kwh, step_kwh, n=30):
+    # One bucket of readings per user; the kWh counters are large cumulative values.
+    # Like the All_ON training state, "high" has one dropout reading at 0 W.
+    for i in range(n):
+        profiler.observe("low", {'Power': 6.4 + 0.4 * (i % 2), 'Vrms': 232.0, 'Irms': 0.0295,
+                                 'kWh': start_kwh + step_kwh * i}, [0, 0, 0])
+        profiler.observe("high", {'Power': 0.0 if i == 0 else 13.0 + 0.8 * (i % 2), 'Vrms': 223.0, 'Irms': 0.0595,
+                                  'kWh': 10 * start_kwh + 2 * step_kwh * i}, [[1, 1, 1]])
+
+
+def test_behavior_profiling():
+    print("--- Behavior buckets with kWh deltas ---")
+    profiler = BehaviorProfiler(bucket_seconds=60)
+    assert profiler.centroids is not None
+
+    _bucket(profiler, 1520.0, 0.001)
+    assert profiler.close_buckets(60.0) == 2
+    _bucket(profiler, 1520.05, 0.001)
+    assert profiler.close_buckets(120.0) == 2
+
+    low, high = profiler.get_profile("low")["history"], profiler.get_profile("high")["history"]
+    print(low[-1], high[-1], sep="\n")
+    assert len(low) == 2 and len(high) == 2
+    assert [b["cluster_name"] for b in low] == ["Low usage"] * 2
+    assert [b["cluster_name"] for b in high] == ["High usage"] * 2
+
+    # First bucket: energy within the bucket; second: since the first bucket's last reading
+    assert np.isclose(low[0]["features"]["total_kwh"], 0.029)
+    assert np.isclose(low[1]["features"]["total_kwh"], 1520.05 + 0.029 - 1520.029)
+    assert np.isclose(high[1]["features"]["total_kwh"], 15200.5 + 0.058 - 15200.058)
+    current = high[-1]["features"]
+    assert set(current) == set(BEHAVIOR_FEATURES)
+    assert np.isclose(current["min_power"], 0.0) and np.isclose(current["max_power"], 13.8)
+    assert np.isclose(current["num_bulbs_on"], 3.0) and high[-1]["readings"] == 30
+
+    # A counter reset counts as no energy rather than a negative amount
+    profiler.observe("low", {'Power': 6.4, 'Vrms': 232.0, 'Irms': 0.0295, 'kWh': 0.0}, [0, 0, 0])
+    profiler.close_buckets(180.0)
+    assert profiler.get_profile("low")["current"]["features"]["total_kwh"] == 0.0
+
+
+if __name__ == "__main__":
+    test_behavior_profiling()
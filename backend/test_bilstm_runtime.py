@@ -0,0 +1,47 @@
+import numpy as np
+from services.ml_service import ml_service_instance
+from services.tf_runtime import BiLSTMRuntime, thread_settings, TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS
+
+
+def _inputs(n: int, seed: int = 0):
+    # Scaled single-reading sequences, as predict_energy_batch builds them
+    rng = np.random.default_rng(seed)
+    rows = rng.uniform(0.0, 1.0, (n, 6))
+    return np.repeat(rows[:, np.newaxis, :], 20, axis=1).astype(np.float32)
+
+
+def test_bilstm_runtime_parity():
+    print("--- BiLSTM runtime vs model.predict ---")
+    model = ml_service_instance.bilstm_model
+    assert model is not None
+    # Sizes below, at and above the compiled batches (padding and chunking)
+    for xla in (False, True):
+        runtime = BiLSTMRuntime(model, precision="float32", xla=xla, batch_sizes=[1, 8])
+        for n in (1, 3, 8, 13):
+            data = _inputs(n, seed=n)
+            expected = model.predict(data, verbose=0)
+            got = runtime.predict(data)
+            assert got.shape == expected.shape
+            diff = float(np.max(np.abs(got - expected)))
+            print(f"xla={xla} n={n}: max |diff| {diff:.2e}")
+            assert np.allclose(got, expected, rtol=1e-4, atol=1e-5)
+
+    # Half precision trades accuracy for speed, but stays close
+    runtime = BiLSTMRuntime(model, precision="bfloat16", xla=True, batch_sizes=[8])
+    data = _inputs(8)
+    assert np.allclose(runtime.predict(data), model.predict(data, verbose=0), rtol=0.05, atol=0.05)
+
+    # The service's own path agrees with the eager model too
+    features = np.array([[200.0, 230.0, 0.87, 0.95, 12, 1], [12.0, 228.0, 0.06, 0.9, 3, 0]])
+    batched = ml_service_instance.predict_energy_batch(features)
+    scaled = ml_service_instance.bilstm_scaler.transform(features)
+    eager = np.abs(model.predict(np.repeat(scaled[:, np.newaxis, :], 20, axis=1), verbose=0)[:, 0])
+    assert np.allclose(batched, eager, rtol=1e-4, atol=1e-5)
+
+    # Importing the service leaves TensorFlow's process-wide pools alone unless configured
+    if TF_INTRA_OP_THREADS <= 0 and TF_INTER_OP_THREADS <= 0:
+        assert thread_settings()["configured"] is None
+
+
+if __name__ == "__main__":
+    test_bilstm_runtime_parity()
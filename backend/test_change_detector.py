@@ -0,0 +1,82 @@
+import numpy as np
+from services.change_detector import ChangeDetector
+
+T = 1000.0
+
+
+def _reading(power, irms=None):
+    return {'Power': power, 'Irms': power / 230.0 if irms is None else irms}
+
+
+def test_change_steps():
+    print("--- Change detector: step decisions ---")
+    detector = ChangeDetector(min_power_step=2.0, min_current_step=0.008, max_staleness=30)
+    assert detector.check("meter-1", _reading(60.0), now=T) == (True, "no_decision")
+    detector.record("meter-1", _reading(60.0), [[1, 0, 0]], now=T)
+
+    assert detector.check("meter-1", _reading(61.0), now=T + 1) == (False, "unchanged")
+    assert detector.check("meter-1", _reading(63.0), now=T + 2) == (True, "power_step")
+    # Irms can move on its own, e.g. a power factor change at the same real power
+    assert detector.check("meter-1", _reading(60.5, irms=60.0 / 230.0 + 0.02), now=T + 3) == (True, "current_step")
+    assert detector.last_decision("meter-1") == [[1, 0, 0]]
+
+
+def test_change_noise():
+    print("--- Change detector: noise-scaled steps ---")
+    detector = ChangeDetector(k_sigma=4.0, min_power_step=2.0, max_staleness=1e9)
+    rng = np.random.default_rng(0)
+    detector.check("noisy", _reading(100.0), now=T)
+    detector.record("noisy", _reading(100.0), [[1, 1, 0]], now=T)
+    # A meter swinging by about +-5 W between readings builds up a rolling noise of a few W
+    for t in range(1, 60):
+        detector.check("noisy", _reading(100.0 + (5.0 if t % 2 else -5.0) + rng.normal(0, 0.5)), now=T + t)
+    # so an 8 W move is within its noise, while a quiet meter treats it as a step
+    assert detector.check("noisy", _reading(108.0, irms=100.0 / 230.0), now=T + 60) == (False, "unchanged")
+
+    quiet = ChangeDetector(k_sigma=4.0, min_power_step=2.0, max_staleness=1e9)
+    quiet.check("quiet", _reading(100.0), now=T)
+    quiet.record("quiet", _reading(100.0), [[1, 1, 0]], now=T)
+    for t in range(1, 60):
+        quiet.check("quiet", _reading(100.0 + rng.normal(0, 0.1), irms=100.0 / 230.0), now=T + t)
+    assert quiet.check("quiet", _reading(108.0, irms=100.0 / 230.0), now=T + 60) == (True, "power_step")
+
+
+def test_change_staleness_and_reset():
+    print("--- Change detector: staleness and per-meter reset ---")
+    detector = ChangeDetector(max_staleness=30)
+    for key in ("meter-1", "meter-2"):
+        detector.check(key, _reading(60.0), now=T)
+        detector.record(key, _reading(60.0), [[1, 0, 0]], now=T)
+    assert detector.check("meter-1", _reading(60.0), now=T + 30) == (False, "unchanged")
+    assert detector.check("meter-1", _reading(60.0), now=T + 31) == (True, "stale")
+
+    # Resetting one meter leaves the others' decisions alone
+    detector.reset("meter-1")
+    assert detector.last_decision("meter-1") is None
+    assert detector.check("meter-1", _reading(60.0), now=T + 32) == (True, "no_decision")
+    assert detector.check("meter-2", _reading(60.0), now=T + 20) == (False, "unchanged")
+    stats = detector.stats()
+    print(stats)
+    assert stats["meters"] == 2 and stats["reasons"]["stale"] == 1
+
+
+def test_change_rejects_non_finite():
+    print("--- Change detector: non-finite readings ---")
+    detector = ChangeDetector(k_sigma=4.0, min_power_step=2.0, max_staleness=1e9)
+    detector.check("meter-1", _reading(100.0), now=T)
+    detector.record("meter-1", _reading(100.0), [[1, 1, 0]], now=T)
+    for t in range(1, 60):
+        detector.check("meter-1", _reading(100.0 + (5.0 if t % 2 else -5.0)), now=T + t)
+
+    assert detector.check("meter-1", _reading(float('nan')), now=T + 60) == (True, "invalid")
+    assert detector.check("meter-1", _reading(100.0, irms=float('inf')), now=T + 61) == (True, "invalid")
+    # The rolling noise survives, so an in-noise move is still unchanged
+    assert detector.check("meter-1", _reading(108.0, irms=100.0 / 230.0), now=T + 62) == (False, "unchanged")
+    assert detector.stats()["reasons"]["invalid"] == 2
+
+
+if __name__ == "__main__":
+    test_change_steps()
+    test_change_noise()
+    test_change_staleness_and_reset()
+    test_change_rejects_non_finite()
@@ -0,0 +1,44 @@
+from services.data_quality import DataQualityGate
+
+NAN = float('nan')
+
+
+def _reading(second, power, vrms, irms, kwh):
+    return {'timestamp': f"2026-02-18_10:48:{second:02d}_000", 'Power': power, 'Vrms': vrms, 'Irms': irms, 'kWh': kwh}
+
+
+def test_data_quality_gate():
+    print("--- Data-quality gate ---")
+    gate = DataQualityGate()
+    window = [
+        _reading(1, 12.0, 230.0, 0.05, 1.00),
+        _reading(2, 12.0, 0.0, 0.05, 1.00),    # Vrms 0 -> imputed
+        _reading(2, 12.0, 230.0, 0.05, 1.00),  # duplicate timestamp -> dropped
+        _reading(3, -0.3, 230.0, -0.01, 1.00), # sensor offset -> clamped
+        _reading(4, NAN, NAN, 0.05, 1.10),     # two bad fields -> rejected
+        _reading(5, 19.0, 231.0, 0.09, 0.90),  # kWh backwards -> imputed
+        _reading(6, 19.0, 231.0, 0.09, 1.20),
+    ]
+    clean, report = gate.validate(window, "meter")
+    print(report.to_dict())
+    assert [r['timestamp'][-6:-4] for r in clean] == ["01", "02", "03", "05", "06"]
+    assert clean[1]['Vrms'] == 230.0 and clean[2]['Power'] == 0.0 and clean[3]['kWh'] == 1.0
+    assert not report.latest_rejected
+    assert report.counts["duplicate_timestamp"] == 1 and report.counts["rejected_multiple_fields"] == 1
+
+    # Overlapping next window with a garbage latest reading short-circuits,
+    # and readings already seen are not counted again
+    clean, report = gate.validate(window[1:] + [_reading(7, 3000.0, 0.0, NAN, 1.3)], "meter")
+    assert report.latest_rejected
+    assert "duplicate_timestamp" not in report.counts
+    assert gate.stats()["short_circuited"] == 1
+
+    # Meters that key readings without milliseconds pass the timestamp checks
+    window = [dict(_reading(s, 12.0, 230.0, 0.05, 1.0), timestamp=f"2026-02-18_10:49:{s:02d}") for s in range(3)]
+    clean, report = gate.validate(window, "seconds-only")
+    assert not report.latest_rejected and len(clean) == 3
+    assert "bad_timestamp" not in report.counts
+
+
+if __name__ == "__main__":
+    test_data_quality_gate()
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+from services.energy_service import EnergyAggregator, OTHER_DEVICE, PERIODS
+
+
+def _reading(when: datetime, kwh: float, power: float):
+    return {'timestamp': when.strftime("%Y-%m-%d_%H:%M:%S_000"), 'kWh': kwh, 'Power': power,
+            'Irms': power / 230.0, 'Vrms': 230.0}
+
+
+def test_energy_attribution():
+    print("--- Energy rollups: per-device attribution ---")
+    energy = EnergyAggregator()
+    t = datetime(2026, 2, 18, 10, 0, 0)
+    # 12W + 7W bulbs on, 20 W measured: 19 W go to the bulbs, the rest to Other
+    kwh = 1.0
+    for i in range(180):
+        energy.observe("meter-1", _reading(t + timedelta(seconds=20 * i), kwh, 20.0), [[1, 0, 1]])
+        kwh += 20.0 * 20 / 3600 / 1000
+    (hour,) = energy.get_range("meter-1", "hour")
+    assert hour["bucket"] == "2026-02-18T10"
+    total = 179 * 20.0 * 20 / 3600 / 1000
+    assert abs(hour["total_kwh"] - total) < 1e-9
+    assert abs(hour["devices"]["12W Bulb"] - total * 12 / 20) < 1e-9
+    assert abs(hour["devices"]["7W Bulb"] - total * 7 / 20) < 1e-9
+    assert abs(hour["devices"][OTHER_DEVICE] - total / 20) < 1e-9
+    assert energy.get_range("meter-1", "day", device="12W Bulb")[0]["kwh"] == hour["devices"]["12W Bulb"]
+
+    # A counter reset falls back to Power x dt instead of a negative delta
+    energy.observe("meter-1", _reading(t + timedelta(hours=1), 0.0, 20.0), [[1, 0, 1]])
+    assert energy.get_range("meter-1", "hour", start="2026-02-18T11")[0]["total_kwh"] > 0
+
+
+def test_energy_eviction_by_key():
+    print("--- Energy rollups: bucket eviction ---")
+    energy = EnergyAggregator()
+    keep = PERIODS["month"][1]
+    t = datetime(2026, 2, 1)
+    kwh = 1.0
+    # A late reading opens an old month after newer ones exist
+    months = [datetime(2024, m, 15) for m in range(1, 13)] + [datetime(2025, m, 15) for m in range(1, 13)]
+    months += [datetime(2026, 1, 15), datetime(2023, 6, 15)]
+    months += [datetime(2026, m, 15) for m in range(2, 13)] + [datetime(2027, m, 15) for m in range(1, 3)]
+    for when in months:
+        energy.observe("meter-1", _reading(when, kwh, 10.0))
+        kwh += 0.5
+        energy.observe("meter-1", _reading(when + timedelta(minutes=1), kwh, 10.0))
+    buckets = [row["bucket"] for row in energy.get_range("meter-1", "month")]
+    assert len(buckets) == keep
+    # The oldest months went, not the latest bucket created
+    assert buckets[0] == "2024-03" and buckets[-1] == "2027-02" and "2023-06" not in buckets
+    assert t.strftime("%Y-%m") in buckets
+
+
+def test_energy_skips_non_finite_kwh():
+    print("--- Energy rollups: non-finite kWh ---")
+    energy = EnergyAggregator()
+    t = datetime(2026, 2, 18, 10, 0, 0)
+    energy.observe("meter-1", _reading(t, 1.0, 20.0))
+    # The NaN interval is estimated from Power, and the counter picks up again afterwards
+    energy.observe("meter-1", _reading(t + timedelta(minutes=1), float('nan'), 20.0))
+    energy.observe("meter-1", _reading(t + timedelta(minutes=2), 1.5, 20.0))
+    (hour,) = energy.get_range("meter-1", "hour")
+    assert abs(hour["total_kwh"] - (20.0 * 60 / 3.6e6 + 0.5)) < 1e-9
+
+
+if __name__ == "__main__":
+    test_energy_attribution()
+    test_energy_eviction_by_key()
+    test_energy_skips_non_finite_kwh()
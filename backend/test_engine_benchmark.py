@@ -0,0 +1,102 @@
+import time
+import numpy as np
+from fastapi.testclient import TestClient
+from services.ml_service import EngineSelector, IdentificationEngine, STATE_LABEL_BITS
+import main
+
+
+class _FixedEngine(IdentificationEngine):
+    """
+    Engine that answers `bits`, except `wrong_every`-th windows, taking `delay` seconds.
+    """
+    def __init__(self, name: str, delay: float, wrong_every: int = 0):
+        super().__init__()
+        self.name = name
+        self.delay = delay
+        self.wrong_every = wrong_every
+        self.seen = 0
+
+    def is_ready(self) -> bool:
+        return True
+
+    def _predict(self, readings):
+        time.sleep(self.delay)
+        self.seen += 1
+        wrong = self.wrong_every and self.seen % self.wrong_every == 0
+        return np.array([[0, 1, 0] if wrong else [1, 0, 0]])
+
+
+def _engines():
+    # "reference" is slow and wrong on every 4th window; "good" is exact; "fast" is cheap but worse
+    return {"reference": _FixedEngine("reference", 0.004, wrong_every=4),
+            "good": _FixedEngine("good", 0.002),
+            "fast": _FixedEngine("fast", 0.0, wrong_every=2)}
+
+
+def test_benchmark_without_labels():
+    print("--- Engine benchmark without labels ---")
+    selector = EngineSelector(_engines(), reference="reference", mode="auto")
+    result = selector.benchmark([[{}]] * 20)
+    print(result)
+    # Latency only: agreement with the reference would always crown the reference
+    assert not result["labelled"]
+    assert all(r["accuracy"] is None and r["latency_ms_mean"] >= 0 for r in result["engines"].values())
+    assert result["engines"]["reference"]["latency_ms_mean"] > result["engines"]["fast"]["latency_ms_mean"]
+    assert selector.accurate == "reference" and selector.cheap == "reference"
+
+
+def test_benchmark_with_labels():
+    print("--- Engine benchmark with labels ---")
+    engines = _engines()
+    selector = EngineSelector(engines, reference="reference", mode="auto", min_accuracy=0.7)
+    result = selector.benchmark([[{}]] * 20, labels=[[1, 0, 0]] * 20)
+    print(result)
+    assert result["engines"]["reference"]["accuracy"] == 0.75
+    assert result["engines"]["good"]["accuracy"] == 1.0 and result["engines"]["fast"]["accuracy"] == 0.5
+    # "fast" is below min_accuracy, so the cheap engine is the faster of the acceptable ones
+    assert selector.accurate == "good" and selector.cheap == "good"
+
+    # Benchmark calls stay out of the live latency stats
+    assert all(e.calls == 0 and not e.latencies for e in engines.values())
+    try:
+        selector.benchmark([[{}]] * 20, labels=[[1, 0, 0]] * 19)
+        raise AssertionError("mismatched labels accepted")
+    except ValueError:
+        pass
+
+
+def test_benchmark_endpoint():
+    print("--- POST /identify/engines/benchmark ---")
+    readings = [{'Irms': 0.03, 'Power': 6.5, 'Vrms': 230.0, 'kWh': 1.0, 'timestamp': "2026-01-01 18:00:00"}] * 12
+    original, previous_token = main.get_recent_readings, main.ADMIN_TOKEN
+    main.get_recent_readings = lambda user_id, limit: readings
+    main.ADMIN_TOKEN = "secret"
+    try:
+        assert TestClient(main.app).post("/identify/engines/benchmark", params={"user_id": "meter-1"}).status_code == 403
+        client = TestClient(main.app, headers={"X-Admin-Token": "secret"})
+        selector = main.ml_service_instance.engine_selector
+        calls = {n: e.calls for n, e in selector.engines.items()}
+        previous = (selector.accurate, selector.cheap, selector.results)
+
+        result = client.post("/identify/engines/benchmark", params={"user_id": "meter-1"}).json()
+        assert not result["labelled"] and result["windows"] == 12
+        assert all(r["accuracy"] is None for r in result["engines"].values())
+        assert (selector.accurate, selector.cheap) == previous[:2]
+
+        labels = [STATE_LABEL_BITS["Only_Bulb1"]] * 12
+        result = client.post("/identify/engines/benchmark", params={"user_id": "meter-1"},
+                             json={"labels": labels}).json()
+        assert result["labelled"] and all(r["accuracy"] is not None for r in result["engines"].values())
+        response = client.post("/identify/engines/benchmark", params={"user_id": "meter-1"},
+                               json={"labels": labels[:5]})
+        assert response.status_code == 400
+        assert {n: e.calls for n, e in selector.engines.items()} == calls
+        selector.accurate, selector.cheap, selector.results = previous
+    finally:
+        main.get_recent_readings, main.ADMIN_TOKEN = original, previous_token
+
+
+if __name__ == "__main__":
+    test_benchmark_without_labels()
+    test_benchmark_with_labels()
+    test_benchmark_endpoint()
@@ -0,0 +1,88 @@
+import os
+import time
+import tempfile
+import numpy as np
+from datetime import datetime
+from services.timestamps import timestamp_key
+from services.ml_service import ml_service_instance
+from services.data_quality import DataQualityGate
+from services.forecast_service import ForecastScheduler, forecast_features
+
+USERS = [f"meter-{i}" for i in range(500)]
+
+
+def _latest_readings(user_ids, limit=1):
+    # Latest reading of each meter, as fetch_recent_readings_many returns them
+    out = {}
+    for user_id in user_ids:
+        i = int(user_id.split("-")[1])
+        power = 6.0 + (i % 8)
+        vrms = 225.0 + (i % 5)
+        out[user_id] = [{'Irms': power / vrms / 0.95, 'Power': power, 'Vrms': vrms, 'kWh': 1.0 + i / 1000.0,
+                         'timestamp': timestamp_key(datetime(2026, 1, 1, i % 24, 30, 0))}]
+    return out
+
+
+def test_forecast_materialization():
+    print("--- Scheduled forecast materialization ---")
+    path = os.path.join(tempfile.mkdtemp(), "forecasts.npz")
+    scheduler = ForecastScheduler(ml_service_instance, fetch=_latest_readings, active_users=lambda: USERS,
+                                  path=path, interval_seconds=3600, max_age_seconds=60)
+
+    run = scheduler.materialize()
+    scheduler.save()
+    print(f"Materialized {run['users']} users in {run['total_ms']:.0f} ms (model {run['model_ms']:.0f} ms)")
+    assert run["users"] == len(USERS)
+
+    # next_hour is what POST /predict/energy computes live for the same reading
+    t0 = time.perf_counter()
+    for user_id in USERS[:20]:
+        reading = _latest_readings([user_id])[user_id][-1]
+        live = ml_service_instance.predict_energy(forecast_features(reading))
+        assert abs(scheduler.get(user_id)["next_hour"] - live) < 1e-4
+    live_ms = (time.perf_counter() - t0) * 1000.0 / 20
+    t0 = time.perf_counter()
+    for user_id in USERS:
+        entry = scheduler.get(user_id)
+    served_ms = (time.perf_counter() - t0) * 1000.0 / len(USERS)
+    print(f"Live inference {live_ms:.2f} ms/request, materialized {served_ms:.4f} ms/request, "
+          f"batched {run['model_ms'] / len(USERS):.2f} ms/user for 24 hours")
+    assert len(entry["hourly"]) == 24 and abs(sum(entry["hourly"]) - entry["next_day"]) < 1e-6
+
+    # Expired forecasts are not served; forecast() recomputes them live
+    scheduler.table["meter-1"]["computed_at"] -= 120
+    assert scheduler.get("meter-1") is None
+    fresh = scheduler.forecast("meter-1")
+    assert fresh["materialized"] is False and fresh["age_seconds"] < 5
+    assert scheduler.forecast("meter-1")["materialized"] is True
+
+    # The on-disk table survives a restart
+    restarted = ForecastScheduler(ml_service_instance, fetch=_latest_readings, path=path, max_age_seconds=60)
+    assert restarted.load() == len(USERS)
+    assert np.allclose(restarted.get("meter-7")["hourly"], scheduler.get("meter-7")["hourly"])
+    print(scheduler.stats())
+
+
+def test_forecast_skips_invalid_readings():
+    print("--- Forecast materialization with broken readings ---")
+    def fetch(user_ids, limit=1):
+        out = _latest_readings(user_ids, limit)
+        broken = {"meter-3": {'Power': float('nan')}, "meter-4": {'Vrms': "nan"}, "meter-5": None}
+        for user_id, fields in broken.items():
+            if user_id in out:
+                out[user_id] = [{**out[user_id][-1], **fields}] if fields else []
+        return out
+
+    scheduler = ForecastScheduler(ml_service_instance, quality_gate=DataQualityGate(), fetch=fetch,
+                                  active_users=lambda: USERS[:10], path=None)
+    run = scheduler.materialize()
+    # One bad reading no longer fails the batch of everyone else
+    assert run["users"] == 7 and scheduler.counters["errors"] == 0
+    assert scheduler.counters["invalid"] == 2 and scheduler.counters["no_readings"] == 1
+    assert all(np.isfinite(scheduler.get(u)["hourly"]).all() for u in USERS[:3] + USERS[6:10])
+    assert scheduler.forecast("meter-3") is None
+
+
+if __name__ == "__main__":
+    test_forecast_materialization()
+    test_forecast_skips_invalid_readings()
@@ -0,0 +1,111 @@
+import time
+import numpy as np
+from fastapi.testclient import TestClient
+from services.ingest_codec import encode_readings, decode_readings, CONTENT_TYPE
+from services.ml_service import ml_service_instance, identification_features, identification_feature_matrix
+from services.sinks import MemorySink
+from main import app
+
+
+def _payload(meters: int, per_meter: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    n = meters * per_meter
+    meter = np.repeat(np.arange(meters), per_meter)
+    timestamp = time.time() - per_meter + np.tile(np.arange(per_meter), meters) + rng.uniform(0, 0.5, n)
+    power = rng.choice([0.2, 7.0, 12.0, 19.0, 22.0, 34.0], n) + rng.normal(0, 0.2, n)
+    vrms = rng.normal(229.0, 1.5, n)
+    irms = np.abs(power) / vrms / 0.95
+    kwh = 1.0 + np.cumsum(np.abs(power)) / 1.8e6
+    shuffle = rng.permutation(n)  # gateways need not send rows in order
+    ids = [f"meter-{m}" for m in range(meters)]
+    return ids, meter[shuffle], timestamp[shuffle], irms[shuffle], power[shuffle], vrms[shuffle], kwh[shuffle]
+
+
+def test_codec_roundtrip():
+    ids, meter, ts, irms, power, vrms, kwh = _payload(3, 10)
+    payload = encode_readings(ids, meter, ts, irms, power, vrms, kwh)
+    batch = decode_readings(payload)
+    assert batch.meter_ids == ids and len(batch) == 30
+    assert np.array_equal(batch.meter, meter) and np.array_equal(batch.timestamp, ts)
+    assert np.allclose(batch.Power, power, atol=1e-4)
+    assert batch.Power.base is not None  # a view into the payload, not a copy
+    for broken in (payload[:10], b"XXXX" + payload[4:], payload[:-8]):
+        try:
+            decode_readings(broken)
+            raise AssertionError("malformed payload accepted")
+        except ValueError:
+            pass
+
+
+def test_feature_matrix_matches_scalar_features():
+    readings = [{'Irms': 0.05, 'Power': 11.8, 'Vrms': 230.0, 'kWh': 1.2},
+                {'Irms': 0.09, 'Power': 19.2, 'Vrms': 229.0, 'kWh': 1.3}]
+    scalar = identification_features(readings)
+    matrix = identification_feature_matrix(*(np.array([readings[1][k]]) for k in ('Irms', 'Power', 'Vrms', 'kWh')),
+                                           np.array([readings[0]['Power']]))
+    assert np.allclose(matrix[0], scalar)
+
+
+def test_ingest_endpoint():
+    sink = MemorySink()
+    previous_sink, previous_alert_sink = ml_service_instance.sink, ml_service_instance.alerts.sink
+    ml_service_instance.sink = ml_service_instance.alerts.sink = sink
+    try:
+        payload = encode_readings(*_payload(meters=100, per_meter=50))
+        client = TestClient(app)
+        response = client.post("/ingest/readings", content=payload, headers={"Content-Type": CONTENT_TYPE})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        assert body["readings"] == 5000 and body["meters"] == 100
+        print(f"Ingested 5000 readings: {body['timings_ms']}")
+
+        assert client.post("/ingest/readings", content=b"junk",
+                           headers={"Content-Type": CONTENT_TYPE}).status_code == 400
+        assert client.post("/ingest/readings", json={}).status_code == 415
+    finally:
+        ml_service_instance.sink, ml_service_instance.alerts.sink = previous_sink, previous_alert_sink
+
+
+def test_batch_statuses_follow_newest_reading():
+    sink = MemorySink()
+    previous_sink = ml_service_instance.sink
+    ml_service_instance.sink = sink
+    try:
+        # meter-0 reports the newest reading (everything off); meter-1 is busier but older
+        now = time.time()
+        meter = np.array([0, 0, 1, 1])
+        timestamp = np.array([now - 4, now - 1, now - 5, now - 3])
+        power = np.array([0.2, 0.2, 34.0, 34.0])
+        vrms = np.full(4, 229.0)
+        irms = power / vrms / 0.95
+        kwh = np.full(4, 1.0)
+        batch = decode_readings(encode_readings(["meter-0", "meter-1"], meter, timestamp, irms, power, vrms, kwh))
+        ml_service_instance.identify_batch(batch)
+        assert sink.writes == 2 * 3  # one RTDB and one Firestore write per device, once per batch
+        assert all(status["status"] == "OFF" for status in sink.devices.values())
+        assert set(sink.firestore_devices.values()) == {"offline"}
+    finally:
+        ml_service_instance.sink = previous_sink
+
+
+def test_ingest_drops_bad_timestamps_and_kwh():
+    sink = MemorySink()
+    previous_sink = ml_service_instance.sink
+    ml_service_instance.sink = sink
+    try:
+        ids, meter, timestamp, irms, power, vrms, kwh = _payload(meters=2, per_meter=10, seed=3)
+        timestamp[0], timestamp[1], kwh[2] = np.nan, 1e20, np.inf
+        payload = encode_readings(ids, meter, timestamp, irms, power, vrms, kwh)
+        response = TestClient(app).post("/ingest/readings", content=payload, headers={"Content-Type": CONTENT_TYPE})
+        assert response.status_code == 200, response.text
+        assert response.json()["rejected"] == 3 and response.json()["readings"] == 17
+    finally:
+        ml_service_instance.sink = previous_sink
+
+
+if __name__ == "__main__":
+    test_codec_roundtrip()
+    test_feature_matrix_matches_scalar_features()
+    test_ingest_endpoint()
+    test_batch_statuses_follow_newest_reading()
+    test_ingest_drops_bad_timestamps_and_kwh()
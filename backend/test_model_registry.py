@@ -0,0 +1,84 @@
+import os
+import time
+import tempfile
+import threading
+import joblib
+from services.model_registry import ModelRegistry
+
+
+def _write(path, tag):
+    joblib.dump({"tag": tag}, path)
+    return ModelRegistry.fingerprint(path)
+
+
+def _slow_load(path):
+    time.sleep(0.2)
+    return joblib.load(path)
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_model_registry():
+    print("--- Model registry: hot swap, rollback pin and watcher ---")
+    path = os.path.join(tempfile.mkdtemp(), "model.pkl")
+    registry = ModelRegistry(cache_size=3)
+    registry.register("m", path, _slow_load)
+    v1 = _write(path, "v1")
+    registry.load("m")
+    assert registry.version("m") == v1
+
+    # Hot swap: the old version keeps serving until the new one is loaded
+    v2 = _write(path, "v2")
+    seen = []
+    stop = threading.Event()
+
+    def _serve():
+        while not stop.is_set():
+            seen.append(registry.get("m")["tag"])
+
+    reader = threading.Thread(target=_serve)
+    reader.start()
+    assert registry.reload("m") is True
+    assert registry.reload("m") is False  # one reload at a time
+    _wait(lambda: registry.version("m") == v2)
+    _wait(lambda: seen[-1] == "v2")
+    stop.set()
+    reader.join()
+    assert set(seen) == {"v1", "v2"} and seen.index("v2") > seen.index("v1")
+    assert "v1" not in seen[seen.index("v2"):]
+
+    # Rollback swaps to the cached version without loading, and pins it
+    t0 = time.perf_counter()
+    assert registry.rollback("m").version == v1
+    assert time.perf_counter() - t0 < 0.2
+    assert registry.get("m")["tag"] == "v1" and registry.pinned("m") == v2
+
+    # The watcher leaves the rollback in place while the file is unchanged...
+    registry.start_watching(interval=0.05)
+    try:
+        time.sleep(0.5)
+        assert registry.version("m") == v1
+
+        # ...and picks up the next artifact
+        v3 = _write(path, "v3")
+        _wait(lambda: registry.version("m") == v3)
+        assert registry.pinned("m") is None
+        versions = {v["version"]: v["active"] for v in registry.versions("m")}
+        assert versions == {v1: False, v2: False, v3: True}
+    finally:
+        registry.stop_watching()
+
+    # An explicit reload clears a pin
+    registry.rollback("m", v2)
+    assert registry.pinned("m") == v3
+    registry.reload("m", background=False)
+    assert registry.version("m") == v3 and registry.pinned("m") is None
+
+
+if __name__ == "__main__":
+    test_model_registry()
@@ -0,0 +1,125 @@
+import os
+import time
+import tempfile
+from services.outbox import OutboxSink
+from services.sinks import MemorySink
+
+
+class _FlakySink(MemorySink):
+    """
+    MemorySink that is slow and fails its first `failures` batch writes.
+    """
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        super().__init__()
+        self.failures = failures
+        self.delay = delay
+        self.batches = 0
+
+    def update_device_statuses(self, statuses):
+        time.sleep(self.delay)
+        self.batches += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("Firebase unavailable")
+        super().update_device_statuses(statuses)
+
+
+class _SlowAlertSink(MemorySink):
+    """
+    MemorySink whose alert batches take `delay` seconds.
+    """
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.started = False
+
+    def add_alerts(self, alerts):
+        self.started = True
+        time.sleep(self.delay)
+        super().add_alerts(alerts)
+
+
+def _wait(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_outbox():
+    print("--- Write-behind outbox ---")
+    log_path = os.path.join(tempfile.mkdtemp(), "outbox.log")
+
+    # Enqueueing does not wait for a slow Firebase; superseded writes are coalesced
+    target = _FlakySink(failures=2, delay=0.2)
+    outbox = OutboxSink(target, log_path=log_path, flush_seconds=0.05, retry_base=0.05)
+    t0 = time.perf_counter()
+    for i in range(100):
+        outbox.update_device_status(str(i % 4), {"status": "ON" if i % 2 else "OFF", "n": i})
+        outbox.update_firestore_device_status(f"Bulb {i % 4}", "online")
+    outbox.add_alerts({"-key1": {"title": "Energy Anomaly Detected"}})
+    assert time.perf_counter() - t0 < 0.1
+
+    # Two failed batches are retried with backoff, then only the latest state is written
+    assert _wait(lambda: outbox.stats()["depth"] == 0)
+    stats = outbox.stats()
+    print(stats)
+    assert stats["failed_batches"] == 2 and stats["coalesced"] >= 190
+    assert target.devices["3"] == {"status": "ON", "n": 99}
+    assert target.firestore_devices == {f"Bulb {i}": "online" for i in range(4)}
+    assert len(target.alerts) == 1
+    outbox.close()
+
+    # Writes still queued at shutdown are replayed from the log by the next process
+    down = _FlakySink(failures=1000)
+    outbox = OutboxSink(down, log_path=log_path, flush_seconds=0.05, retry_base=0.05)
+    outbox.update_device_status("0", {"status": "OFF"})
+    outbox.update_device_status("0", {"is_active": False})
+    outbox.close(timeout=0.2)
+    assert down.devices == {}
+
+    target = MemorySink()
+    outbox = OutboxSink(target, log_path=log_path, flush_seconds=0.05)
+    outbox.open()
+    assert outbox.counters["replayed"] == 1
+    assert _wait(lambda: outbox.stats()["depth"] == 0)
+    assert target.devices == {"0": {"status": "OFF", "is_active": False}}
+    outbox.close()
+    reopened = OutboxSink(MemorySink(), log_path=log_path)
+    reopened.open()
+    assert reopened.counters["replayed"] == 0
+    reopened.close()
+
+    # Constructing the sink touches no files; the first write opens the log
+    lazy_path = os.path.join(tempfile.mkdtemp(), "outbox.log")
+    lazy = OutboxSink(MemorySink(), log_path=lazy_path, flush_seconds=0.05)
+    assert not os.path.exists(lazy_path)
+    lazy.update_device_status("0", {"status": "ON"})
+    assert os.path.exists(lazy_path)
+    lazy.close()
+
+
+def test_outbox_close_keeps_acks():
+    print("--- Outbox shutdown during a flush ---")
+    log_path = os.path.join(tempfile.mkdtemp(), "outbox.log")
+
+    # close() lands while the flusher's batch is still being written
+    target = _SlowAlertSink(delay=0.3)
+    outbox = OutboxSink(target, log_path=log_path, flush_seconds=0.01)
+    outbox.add_alerts({f"-key{i}": {"title": "Energy Anomaly Detected", "n": i} for i in range(20)})
+    assert _wait(lambda: target.started)
+    outbox.close()
+    assert len(target.alerts) == 20
+
+    # Every alert was acknowledged, so the next process sends none of them again
+    target = MemorySink()
+    outbox = OutboxSink(target, log_path=log_path, flush_seconds=0.01)
+    outbox.open()
+    assert outbox.counters["replayed"] == 0
+    outbox.close()
+    assert target.alerts == []
+
+
+if __name__ == "__main__":
+    test_outbox()
+    test_outbox_close_keeps_acks()
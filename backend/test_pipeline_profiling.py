@@ -0,0 +1,74 @@
+import threading
+from fastapi.testclient import TestClient
+import main
+from services.profiler import SamplingProfiler, pipeline_tracer_instance
+from services.data_sources import ReplayDataSource
+from replay_harness import synthetic_stream, run_replay
+
+
+def _hot_loop(stop):
+    total = 0
+    while not stop.is_set():
+        total += sum(i * i for i in range(1000))
+    return total
+
+
+def test_pipeline_profiling():
+    print("--- Sampling profiler + pipeline timings ---")
+    profiler = SamplingProfiler()
+    result = {}
+    stop = threading.Event()
+    hot = threading.Thread(target=_hot_loop, args=(stop,), name="hot-worker")
+    hot.start()
+    thread = threading.Thread(target=lambda: result.setdefault("folded", profiler.profile(1.0, 0.002)))
+    thread.start()
+    source = ReplayDataSource({"sim-0": synthetic_stream(300), "sim-1": synthetic_stream(300, seed=1)}, speed=0)
+    run_replay(source)
+    thread.join()
+    stop.set()
+    hot.join()
+
+    stacks = {}
+    for line in result["folded"].strip().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        stacks[stack] = int(count)
+    assert len(stacks) == profiler.last_run["stacks"]
+    samples = profiler.last_run["samples"]
+    assert samples > 100
+
+    # Root first: the thread name, then module:function:line frames down to the leaf
+    hot_stacks = {stack: count for stack, count in stacks.items() if stack.startswith("hot-worker;")}
+    assert hot_stacks
+    for stack in hot_stacks:
+        frames = stack.split(";")
+        assert frames[1].startswith("threading:_bootstrap:")
+        assert any(frame.startswith(f"{__name__}:_hot_loop:") for frame in frames[2:])
+    # The busy thread is on-CPU for the whole run, so it shows up in every sample
+    assert sum(hot_stacks.values()) == samples
+    top = max(hot_stacks, key=hot_stacks.get)
+    print(f"Profile: {profiler.last_run}, hottest stack: {top[-120:]}")
+
+    summary = pipeline_tracer_instance.summary()
+    assert "fetch" in summary and "xgboost" in summary
+    events = pipeline_tracer_instance.recent(5)
+    assert events and events[0]["kind"] == "realtime"
+    print(f"Stage summary: {summary}")
+
+
+def test_admin_endpoints_fail_closed():
+    client = TestClient(main.app)
+    previous = main.ADMIN_TOKEN
+    try:
+        main.ADMIN_TOKEN = None
+        assert client.get("/admin/pipeline-timings").status_code == 403
+        assert client.post("/admin/profile?seconds=0.1").status_code == 403
+        main.ADMIN_TOKEN = "secret"
+        assert client.get("/admin/pipeline-timings", headers={"X-Admin-Token": "wrong"}).status_code == 403
+        assert client.get("/admin/pipeline-timings", headers={"X-Admin-Token": "secret"}).status_code == 200
+    finally:
+        main.ADMIN_TOKEN = previous
+
+
+if __name__ == "__main__":
+    test_pipeline_profiling()
+    test_admin_endpoints_fail_closed()
@@ -0,0 +1,86 @@
+import os
+import time
+import tempfile
+from services.snapshot_service import SnapshotService
+from services.change_detector import ChangeDetector
+from services.rate_controller import RateController
+from services.data_quality import DataQualityGate
+from services.baseline_service import BaselineProfiler
+from services.alert_service import AlertPipeline
+from services.energy_service import EnergyAggregator
+from services.sinks import MemorySink
+
+METERS = 5000
+
+
+def _reading(meter, second, power):
+    return {'timestamp': f"2026-02-18_10:{second // 60:02d}:{second % 60:02d}_000",
+            'Power': power + meter % 7, 'Vrms': 230.0, 'Irms': (power + meter % 7) / 230.0, 'kWh': 1.0 + second / 3600}
+
+
+def _components():
+    return {
+        "change_detector": ChangeDetector(),
+        "rate_control": RateController(),
+        "data_quality": DataQualityGate(),
+        "baselines": BaselineProfiler(min_samples=3),
+        "alerts": AlertPipeline(MemorySink()),
+        "energy": EnergyAggregator(),
+    }
+
+
+def _service(path, components):
+    service = SnapshotService(path)
+    for name, component in components.items():
+        service.register(name, component)
+    return service
+
+
+def test_pipeline_snapshots():
+    print("--- Warm-start snapshots ---")
+    path = os.path.join(tempfile.mkdtemp(), "pipeline_state.npz")
+    warm = _components()
+    for meter in range(METERS):
+        key = f"meter-{meter}"
+        for second in range(3):
+            reading = _reading(meter, second, 60.0)
+            change = warm["change_detector"].check(key, reading)
+            warm["rate_control"].admit(key, reading, change)
+            warm["baselines"].observe(key, reading)
+            warm["energy"].observe(key, reading, [[1, 0, 0]])
+        warm["change_detector"].record(key, reading, [[1, 0, 0]])
+        warm["data_quality"].validate([reading], key)
+    warm["alerts"].submit({"title": "Fluctuation"}, user_id="meter-1", device="Bulb 1", alert_type="fluctuation")
+    warm["alerts"].flush()  # the suppression window starts once the alert is written
+
+    saved = _service(path, warm).save()
+    print(f"Saved {METERS} meters: {saved['bytes'] / 1e6:.1f} MB in {saved['ms']:.0f} ms")
+
+    cold = _components()
+    service = _service(path, cold)
+    t0 = time.perf_counter()
+    restored = service.restore()
+    elapsed = time.perf_counter() - t0
+    print(f"Restored {restored} in {elapsed * 1000:.0f} ms")
+    assert sorted(restored) == sorted(cold)
+    assert elapsed < 10.0
+
+    # The restarted pipeline behaves like the one that stopped
+    reading = _reading(42, 4, 60.0)
+    assert cold["change_detector"].check("meter-42", reading) == (False, "unchanged")
+    assert cold["change_detector"].last_decision("meter-42") == [[1, 0, 0]]
+    assert cold["rate_control"].export_state()["tiers"].shape == (METERS,)
+    assert cold["alerts"].is_suppressed("meter-1", "Bulb 1", "fluctuation")
+    assert cold["energy"].get_range("meter-42", "hour") == warm["energy"].get_range("meter-42", "hour")
+    assert cold["baselines"].band("meter-42", 2, 10)["count"] == 3
+    # The data-quality gate can impute from the last good reading right away
+    clean, report = cold["data_quality"].validate([{**_reading(42, 5, 60.0), 'Vrms': 0.0}], "meter-42")
+    assert not report.latest_rejected and clean[0]['Vrms'] == 230.0
+
+    # Stale snapshots are ignored
+    service.max_age_seconds = -1
+    assert service.restore() == []
+
+
+if __name__ == "__main__":
+    test_pipeline_snapshots()
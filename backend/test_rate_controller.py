@@ -0,0 +1,118 @@
+import time
+from services.change_detector import ChangeDetector
+from services.rate_controller import RateController
+
+
+def _reading(power):
+    return {'Power': power, 'Irms': power / 230.0, 'Vrms': 230.0}
+
+
+class _Meter:
+    """
+    One meter's readings through a ChangeDetector and the RateController, the
+    way the realtime processor feeds them; evaluated readings record a decision.
+    """
+    def __init__(self, controller, key="meter-1"):
+        self.detector = ChangeDetector(max_staleness=1e9)
+        self.controller = controller
+        self.key = key
+
+    def send(self, power, now):
+        reading = _reading(power)
+        change = self.detector.check(self.key, reading, now=now)
+        evaluate, tier, reason = self.controller.admit(self.key, reading, change, now=now)
+        if evaluate and change[0]:
+            self.detector.record(self.key, reading, [[1, 0, 0]], now=now)
+        return evaluate, tier, reason
+
+
+def test_rate_tiers():
+    print("--- Rate controller tiers ---")
+    controller = RateController(stable_after=3, intervals={"active": 0.0, "stable": 5.0, "idle": 30.0},
+                                budgets={"active": 0, "stable": 0, "idle": 0}, cpu_target=10.0)
+    meter = _Meter(controller)
+    t = 0.0  # an explicit now=0 is a real clock value
+    assert meter.send(60.0, t) == (True, "active", "new")
+
+    # Readings without a load change: active for a while, then stable and rate limited
+    tiers = [meter.send(60.0, t + i) for i in range(1, 6)]
+    assert [tier for _, tier, _ in tiers] == ["active", "active", "stable", "stable", "stable"]
+    assert [evaluate for evaluate, _, _ in tiers] == [True, True, False, False, False]
+    assert meter.send(60.0, t + 7) == (True, "stable", "due")
+
+    # The change detector's step promotes the meter and is evaluated right away
+    assert meter.send(75.0, t + 7.5) == (True, "active", "step")
+
+    # Below the idle power the meter is idle and evaluated every 30 s at most
+    assert meter.send(0.2, t + 8) == (True, "active", "step")
+    assert meter.send(0.2, t + 9)[1:] == ("idle", "interval")
+    assert meter.send(0.2, t + 38.5) == (True, "idle", "due")
+
+    # The tiers survive a snapshot round trip
+    restored = RateController(stable_after=3)
+    restored.import_state(controller.export_state())
+    assert restored.export_state()["tiers"].tolist() == controller.export_state()["tiers"].tolist()
+    stats = controller.stats()
+    print(stats)
+    assert stats["meters"]["idle"] == 1 and stats["reasons"]["step"] == 2
+
+
+def test_rate_budget():
+    print("--- Rate controller budgets ---")
+    # 2 stable evaluations/s across all meters
+    controller = RateController(stable_after=1, intervals={"active": 0.0, "stable": 0.0, "idle": 0.0},
+                                budgets={"active": 0, "stable": 2, "idle": 0}, cpu_target=10.0)
+    meters = [_Meter(controller, f"meter-{i}") for i in range(5)]
+    now = time.time()
+    for meter in meters:
+        meter.send(60.0, now)
+    admitted = [meter.send(60.0, now + 0.01)[0] for meter in meters]
+    assert sum(admitted) == 2 and controller.reasons["budget"] == 3
+
+
+def test_rate_cpu_throttle():
+    print("--- Rate controller CPU throttling ---")
+    # Any CPU use is over a zero target, so the stable interval is stretched
+    controller = RateController(stable_after=1, intervals={"active": 0.0, "stable": 5.0, "idle": 30.0},
+                                budgets={"active": 0, "stable": 0, "idle": 0}, cpu_target=0.0, max_throttle=8)
+    meter = _Meter(controller)
+    t = 1000.0
+    meter.send(60.0, t)
+    deadline = time.perf_counter() + 1.1
+    while time.perf_counter() < deadline:
+        pass
+    assert meter.send(60.0, t + 1) == (False, "stable", "interval")
+    assert controller.throttle == 1.5 and controller.cpu_usage > 0
+    # 6 s would be due at 5 s, but not at 5 x 1.5 s
+    assert meter.send(60.0, t + 6)[2] == "interval"
+    assert meter.send(60.0, t + 8)[2] == "due"
+
+    # Back under the target, the throttle decays towards 1
+    controller.cpu_target = 10.0
+    time.sleep(1.05)
+    meter.send(60.0, t + 9)
+    assert controller.throttle == 1.5 / 1.25
+
+
+def test_invalid_readings_skip_detector_and_controller():
+    from realtime_processor import RealtimeProcessor
+    from services.data_sources import DataEvent, ReplayDataSource
+    from services.ml_service import ml_service_instance
+
+    controller = RateController()
+    processor = RealtimeProcessor("dq-meter", data_source=ReplayDataSource({}), rate_controller=controller)
+    detector = ml_service_instance.change_detector
+    evaluated = detector.stats()["evaluated"]
+    for raw in ({"Power": "nan", "Irms": "0.05", "Vrms": "230", "kWh": "1.0"},
+                {"Power": "12.0", "Irms": "0.05", "Vrms": "0", "kWh": "1.0"}):
+        processor._on_data_change(DataEvent("put", "/2026-02-18_10:48:30_286", raw))
+    assert detector.stats()["evaluated"] == evaluated
+    assert detector.last_decision("dq-meter") is None
+    assert controller.evaluated == controller.skipped == 0
+
+
+if __name__ == "__main__":
+    test_rate_tiers()
+    test_rate_budget()
+    test_rate_cpu_throttle()
+    test_invalid_readings_skip_detector_and_controller()
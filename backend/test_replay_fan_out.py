@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+from services.data_sources import ReplayDataSource, fan_out
+from services.timestamps import timestamp_key, timestamp_seconds
+
+
+def _recording(n=40, interval=2.0):
+    t = datetime(2026, 1, 1, 18, 0, 0)
+    return [{'Irms': 0.03, 'Power': float(i), 'Vrms': 230.0, 'kWh': 1.0,
+             'timestamp': timestamp_key(t + timedelta(seconds=interval * i))} for i in range(n)]
+
+
+def test_replay_fan_out():
+    print("--- Simulated users from one recording stay in time order ---")
+    base = _recording()
+    streams = fan_out(base, 10)
+    assert list(streams) == [f"sim-{u}" for u in range(10)]
+    for user_id, readings in streams.items():
+        stamps = [timestamp_seconds(r['timestamp']) for r in readings]
+        assert len(readings) == len(base)
+        assert all(b - a == 2.0 for a, b in zip(stamps, stamps[1:])), user_id
+    # sim-1 starts 7 readings in and plays the first 7 after the end
+    assert [r['Power'] for r in streams["sim-1"]] == [float(i) for i in list(range(7, 40)) + list(range(7))]
+
+    # No event is scheduled before its stream's start, so paced replay has no bogus lag
+    source = ReplayDataSource(streams, speed=100.0)
+    offsets = [offset for offset, _, _ in source._schedule()]
+    assert min(offsets) == 0.0 and max(offsets) == 78.0
+    summary = source.run()
+    print(summary)
+    assert summary["events"] == 400 and summary["max_lag_seconds"] < 0.5
+
+
+if __name__ == "__main__":
+    test_replay_fan_out()
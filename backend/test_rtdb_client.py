@@ -0,0 +1,61 @@
+import time
+from local_rtdb_server import start_local_rtdb
+from services.rtdb_client import RTDBRestClient, PreconditionFailed
+
+
+def _seed(users: int, readings: int):
+    data = {}
+    for u in range(users):
+        data[f"user-{u}"] = {"data": {
+            f"2026-02-18_10:48:{s:02d}_000": {"Irms": "0.1", "Power": str(20 + s), "Vrms": "230", "kWh": "1.5"}
+            for s in range(readings)
+        }}
+    return {"SmartMeter": {"users": data}}
+
+
+def test_rtdb_client():
+    print("--- RTDB REST client (local stand-in) ---")
+    server, url = start_local_rtdb(data=_seed(users=50, readings=12))
+    client = RTDBRestClient(url, use_credentials=False)
+    try:
+        # Plain reads and writes
+        assert client.run(client.put("config/threshold", 20)) is not None
+        assert client.run(client.get("config/threshold")) == 20
+        client.run(client.patch("config", {"mode": "auto"}))
+        assert client.run(client.get("config")) == {"threshold": 20, "mode": "auto"}
+        key = client.run(client.post("alerts", {"message": "test"}))
+        assert client.run(client.get(f"alerts/{key}")) == {"message": "test"}
+        client.run(client.delete(f"alerts/{key}"))
+        assert client.run(client.get(f"alerts/{key}")) is None
+
+        # Conditional reads reuse the cached value while the ETag is unchanged
+        value, changed = client.run(client.get_conditional("config"))
+        assert changed
+        value, changed = client.run(client.get_conditional("config"))
+        assert not changed and value["mode"] == "auto"
+
+        # Conditional writes
+        _, etag = client.run(client.get_with_etag("config/threshold"))
+        client.run(client.put("config/threshold", 25, if_match=etag))
+        try:
+            client.run(client.put("config/threshold", 30, if_match=etag))
+            raise AssertionError("stale ETag was accepted")
+        except PreconditionFailed as e:
+            assert e.value == 25
+
+        # Fleet fan-out over the shared pool
+        users = [f"user-{u}" for u in range(50)]
+        t0 = time.perf_counter()
+        snapshots = client.run(client.recent_readings_many(users, limit=7))
+        elapsed = time.perf_counter() - t0
+        assert len(snapshots) == 50
+        assert all(len(s) == 7 for s in snapshots.values())
+        assert max(snapshots["user-0"]) == "2026-02-18_10:48:11_000"
+        print(f"Fetched 50 users in {elapsed * 1000:.1f} ms, stats: {client.stats()}")
+    finally:
+        client.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_rtdb_client()
@@ -0,0 +1,186 @@
+import time
+import asyncio
+import multiprocessing as mp
+from local_rtdb_server import start_local_rtdb
+from services.rtdb_client import RTDBRestClient
+from services.shard_service import HashRing, ShardCoordinator
+
+USERS = [f"user-{u}" for u in range(60)]
+
+
+def _node(node_id, url, events, stop):
+    # One backend node: reports which users it starts and stops processing
+    from services.rtdb_client import RTDBRestClient
+    from services.shard_service import ShardCoordinator
+    client = RTDBRestClient(url, use_credentials=False)
+    coordinator = ShardCoordinator(
+        node_id, USERS, store=client, lease_seconds=3.0, heartbeat_seconds=0.2, lease_margin_seconds=0.6,
+        on_acquire=lambda u: events.put((node_id, u, "start", time.time())),
+        on_release=lambda u: events.put((node_id, u, "stop", time.time())))
+    coordinator.start()
+    stop.wait()
+    coordinator.stop()
+    client.close()
+
+
+class _Cluster:
+    def __init__(self, url):
+        self.ctx = mp.get_context("spawn")
+        self.url = url
+        self.events = self.ctx.Queue()
+        self.nodes = {}
+        self.log = []
+        self.owners = {u: set() for u in USERS}
+
+    def join(self, node_id):
+        stop = self.ctx.Event()
+        process = self.ctx.Process(target=_node, args=(node_id, self.url, self.events, stop), daemon=True)
+        process.start()
+        self.nodes[node_id] = (process, stop)
+
+    def leave(self, node_id):
+        process, stop = self.nodes.pop(node_id)
+        stop.set()
+        process.join(10)
+
+    def kill(self, node_id):
+        process, _ = self.nodes.pop(node_id)
+        process.kill()
+        process.join(10)
+        now = time.time()
+        for user, owners in self.owners.items():
+            if node_id in owners:
+                owners.discard(node_id)
+                self.log.append((node_id, user, "stop", now))
+
+    def settle(self, expected, timeout=20.0):
+        """
+        Apply events until every user is processed by exactly its expected node.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            while not self.events.empty():
+                node_id, user, kind, at = self.events.get()
+                self.log.append((node_id, user, kind, at))
+                (self.owners[user].add if kind == "start" else self.owners[user].discard)(node_id)
+            if all(self.owners[u] == {expected[u]} for u in USERS):
+                return dict(expected)
+            time.sleep(0.1)
+        raise AssertionError(f"Cluster did not settle: {[(u, o) for u, o in self.owners.items() if o != {expected[u]}]}")
+
+    def assert_exclusive(self):
+        # No user was ever processed by two nodes at the same time
+        for user in USERS:
+            intervals, open_at = [], {}
+            for node_id, u, kind, at in sorted(self.log, key=lambda e: e[3]):
+                if u != user:
+                    continue
+                if kind == "start":
+                    open_at[node_id] = at
+                else:
+                    intervals.append((open_at.pop(node_id), at))
+            intervals += [(at, float("inf")) for at in open_at.values()]
+            intervals.sort()
+            for (_, end), (start, _) in zip(intervals, intervals[1:]):
+                assert start >= end, f"{user} was processed by two nodes at once"
+
+
+def test_shard_service():
+    print("--- Consistent-hash sharding (local stand-in, one process per node) ---")
+    # Moving one node in or out only moves about 1/N of the users
+    ring3, ring4 = HashRing(["a", "b", "c"]), HashRing(["a", "b", "c", "d"])
+    keys = [f"meter-{i}" for i in range(10000)]
+    moved = [k for k in keys if ring3.owner(k) != ring4.owner(k)]
+    assert all(ring4.owner(k) == "d" for k in moved)
+    assert 0.15 < len(moved) / len(keys) < 0.35
+
+    server, url = start_local_rtdb()
+    cluster = _Cluster(url)
+    try:
+        for node_id in ("a", "b", "c"):
+            cluster.join(node_id)
+        before = cluster.settle(HashRing(["a", "b", "c"]).assign(USERS))
+
+        cluster.join("d")
+        after = cluster.settle(HashRing(["a", "b", "c", "d"]).assign(USERS))
+        moved = [u for u in USERS if before[u] != after[u]]
+        print(f"Join: {len(moved)}/{len(USERS)} users moved")
+        assert moved and all(after[u] == "d" for u in moved)
+
+        # Graceful leave hands over right away; a crashed node's users move once its leases expire
+        cluster.leave("b")
+        after_leave = cluster.settle(HashRing(["a", "c", "d"]).assign(USERS))
+        assert all(after_leave[u] == after[u] for u in USERS if after[u] != "b")
+        cluster.kill("c")
+        cluster.settle(HashRing(["a", "d"]).assign(USERS))
+        cluster.assert_exclusive()
+    finally:
+        for node_id in list(cluster.nodes):
+            cluster.leave(node_id)
+        server.shutdown()
+
+
+class _FlakyStore(RTDBRestClient):
+    # Writes hang or fail once `mode` is set, as during a network partition
+    mode = None
+
+    async def put(self, path, value, if_match=None):
+        if self.mode == "hang":
+            await asyncio.sleep(5)
+        elif self.mode == "fail":
+            raise ConnectionError("store unreachable")
+        return await super().put(path, value, if_match=if_match)
+
+
+def _wait(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_shard_lease_renewal_failure():
+    print("--- Hanging and failing lease renewals stop processing before the lease expires ---")
+    server, url = start_local_rtdb()
+    observer = RTDBRestClient(url, use_credentials=False)
+    users = USERS[:10]
+    try:
+        for mode in ("hang", "fail"):
+            path = f"shards-{mode}"
+            store = _FlakyStore(url, use_credentials=False)
+            events = []
+            nodes = {
+                node_id: ShardCoordinator(
+                    node_id, users, store=client, path=path, lease_seconds=2.0, heartbeat_seconds=0.2,
+                    lease_margin_seconds=0.5,
+                    on_acquire=lambda u, n=node_id: events.append((n, u, "start", time.time())),
+                    on_release=lambda u, n=node_id: events.append((n, u, "stop", time.time())))
+                for node_id, client in (("a", store), ("b", observer))}
+            a, b = nodes["a"], nodes["b"]
+            a.start()
+            _wait(lambda: len(a.owned) == len(users))
+
+            store.mode = mode
+            _wait(lambda: not a.owned)
+            leases = observer.run(observer.get(f"{path}/leases"))
+            stopped = {u: at for n, u, kind, at in events if n == "a" and kind == "stop"}
+            print(f"{mode}: stopped {min(leases[u]['expires'] - stopped[u] for u in users):.2f} s before lease expiry")
+            assert set(stopped) == set(users) and a.counters["expired"] == len(users)
+            assert all(stopped[u] < leases[u]["expires"] for u in users)
+
+            # Another node takes the users over only after the first one stopped
+            b.start()
+            _wait(lambda: len(b.owned) == len(users))
+            started = {u: at for n, u, kind, at in events if n == "b" and kind == "start"}
+            assert all(started[u] > stopped[u] for u in users)
+            b.stop()
+            a.stop()
+            store.close()
+    finally:
+        observer.close()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    test_shard_service()
+    test_shard_lease_renewal_failure()
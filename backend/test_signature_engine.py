@@ -0,0 +1,56 @@
+import numpy as np
+from benchmark_signature_engine import state_stream, run_benchmark
+from services.ml_service import ml_service_instance, identification_feature_matrix
+
+
+def test_signature_engine():
+    print("--- Signature NILM engine vs XGBoost ---")
+    engine = ml_service_instance.signature_engine
+    assert engine.is_ready() and engine.source == "kmeans_behavior_results"
+    assert len(engine.signatures()) == 8
+
+    readings = state_stream(1200, seed=1)
+    report = run_benchmark(readings)
+    print(report)
+    sig = report["per_reading"]["signature"]
+    # Ambiguous readings go to XGBoost, so the decisions mostly agree
+    assert sig["accuracy"] >= 0.9
+    assert report["batched"]["agreement"] >= 0.9
+    assert sig["fallback_rate"] < 1.0
+
+    # Learned signatures replace the CSV ones and survive a snapshot round trip
+    learned = run_benchmark(readings, learn=True)
+    print(learned)
+    assert engine.source == "labeled" and learned["learned"]
+    state = engine.export_state()
+    engine.load_csv()
+    engine.import_state(state)
+    assert engine.source == "labeled"
+    assert np.allclose(engine.centroids, state["centroids"], equal_nan=True)
+
+    # The batched path gives the same bits as the per-reading path
+    power = np.array([r['Power'] for r in readings])
+    features = identification_feature_matrix(
+        np.array([r['Irms'] for r in readings]), power, np.array([r['Vrms'] for r in readings]),
+        np.array([r['kWh'] for r in readings]), np.concatenate([power[:1], power[:-1]]))
+    batched = engine.predict_matrix(features)
+    single = np.vstack([engine.predict(readings[max(0, i - 6):i + 1]) for i in range(len(readings))])
+    assert np.array_equal(batched, single)
+    engine.load_csv()
+
+
+def test_learn_signatures_requires_admin():
+    from fastapi.testclient import TestClient
+    import main
+    previous = main.ADMIN_TOKEN
+    try:
+        main.ADMIN_TOKEN = "secret"
+        response = TestClient(main.app).post("/identify/engines/signatures/learn", params={"user_id": "meter-1"})
+        assert response.status_code == 403
+    finally:
+        main.ADMIN_TOKEN = previous
+
+
+if __name__ == "__main__":
+    test_signature_engine()
+    test_learn_signatures_requires_admin()
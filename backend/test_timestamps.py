@@ -0,0 +1,33 @@
+import math
+from datetime import datetime
+from services.timestamps import timestamp_key, parse_timestamp, timestamp_seconds, reading_time
+
+
+def test_timestamps():
+    print("--- Reading timestamp keys ---")
+    dt = datetime(2026, 2, 18, 10, 48, 30, 286000)
+    key = timestamp_key(dt)
+    assert key == "2026-02-18_10:48:30_286"
+    assert parse_timestamp(key) == dt
+    assert timestamp_seconds(key) == dt.timestamp()
+
+    # Keys without milliseconds are valid too
+    assert parse_timestamp("2026-02-18_10:48:30") == dt.replace(microsecond=0)
+    assert reading_time({'timestamp': "2026-02-18_10:48:30"}).hour == 10
+
+    # Epoch seconds are accepted as well
+    assert parse_timestamp(dt.timestamp()) == dt
+    assert parse_timestamp(str(dt.timestamp())) == dt
+
+    for bad in ("", None, "2026-02-18_25:00:00_000", "garbage", float("nan")):
+        assert parse_timestamp(bad) is None
+        assert math.isnan(timestamp_seconds(bad))
+
+    assert reading_time({'timestamp': key}) == dt
+    before = datetime.now()
+    assert reading_time({'timestamp': "garbage"}) >= before
+    assert reading_time({}) >= before
+
+
+if __name__ == "__main__":
+    test_timestamps()
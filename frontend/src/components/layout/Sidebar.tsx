@@ -33,15 +33,10 @@ export default function Sidebar({ activeTab, setActiveTab, darkMode, setDarkMode
   const [unreadCount, setUnreadCount] = useState(0);
 
   useEffect(() => {
-    const alertsRef = ref(database, 'alerts');
-    const unsubscribe = onValue(alertsRef, (snapshot) => {
-      const data = snapshot.val();
-      if (data) {
-        const count = Object.values(data).filter((alert: any) => !alert.is_read).length;
-        setUnreadCount(count);
-      } else {
-        setUnreadCount(0);
-      }
+    // Counter maintained by the backend, so the badge does not download every alert
+    const unreadRef = ref(database, 'alerts_meta/unread_count');
+    const unsubscribe = onValue(unreadRef, (snapshot) => {
+      setUnreadCount(Number(snapshot.val()) || 0);
     });
 
     return () => unsubscribe();
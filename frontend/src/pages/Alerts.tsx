@@ -18,14 +18,28 @@ interface AlertItem {
   acknowledged: boolean;
 }
 
-import { endpoints } from '@/services/api';
+import { endpoints, AlertPage } from '@/services/api';
 
-// Mocks removed, will fetch from API
-const mockAlerts: AlertItem[] = [];
+// Unread alerts per page; older ones are loaded on demand with the page cursor
+const ACTIVE_PAGE_SIZE = 20;
+
+const toAlertItems = (page: AlertPage): AlertItem[] =>
+  Object.entries(page.alerts).map(([key, value]: [string, any]) => ({
+    id: key,
+    type: value.severity === 'high' ? 'critical' : value.severity === 'medium' ? 'warning' : 'info',
+    title: value.message ? value.message.substring(0, 20) + '...' : 'Alert', // Simple title generation
+    message: value.message,
+    timestamp: value.timestamp,
+    acknowledged: value.is_read
+  }));
 
 
 export default function Alerts() {
-  const [alerts, setAlerts] = useState<AlertItem[]>([]);
+  const [activeAlerts, setActiveAlerts] = useState<AlertItem[]>([]);
+  const [olderAlerts, setOlderAlerts] = useState<AlertItem[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [history, setHistory] = useState<AlertItem[]>([]);
+  const [unreadCount, setUnreadCount] = useState(0);
   const [thresholds, setThresholds] = useState({
     maxCurrent: 12,
     minVoltage: 200,
@@ -41,18 +55,18 @@ export default function Alerts() {
   useEffect(() => {
     const fetchAlerts = async () => {
       try {
-        const response = await endpoints.getAlerts();
-        if (response.data && response.data.alerts) {
-          const fetchedAlerts = Object.entries(response.data.alerts).map(([key, value]: [string, any]) => ({
-            id: key,
-            type: value.severity === 'high' ? 'critical' : value.severity === 'medium' ? 'warning' : 'info',
-            title: value.message ? value.message.substring(0, 20) + '...' : 'Alert', // Simple title generation
-            message: value.message,
-            timestamp: value.timestamp,
-            acknowledged: value.is_read
-          }));
-          setAlerts(fetchedAlerts as AlertItem[]);
+        // Pages and the unread counter are polled with If-None-Match; unchanged ones come back as null
+        const [active, acknowledged, count] = await Promise.all([
+          endpoints.getAlerts({ unread: true, limit: ACTIVE_PAGE_SIZE }),
+          endpoints.getAlerts({ unread: false, limit: 5 }),
+          endpoints.getUnreadAlertCount()
+        ]);
+        if (active) {
+          setActiveAlerts(toAlertItems(active));
+          setNextCursor(prev => prev ?? active.next_cursor);
         }
+        if (acknowledged) setHistory(toAlertItems(acknowledged));
+        if (count) setUnreadCount(count.unread);
       } catch (error) {
         console.error("Failed to fetch alerts:", error);
       }
@@ -64,18 +78,37 @@ export default function Alerts() {
     return () => clearInterval(interval);
   }, []);
 
+  const loadOlderAlerts = async () => {
+    if (!nextCursor) return;
+    try {
+      const page = await endpoints.getAlerts({ unread: true, limit: ACTIVE_PAGE_SIZE, before: nextCursor });
+      if (page) {
+        setOlderAlerts(prev => [...prev, ...toAlertItems(page)]);
+        setNextCursor(page.next_cursor);
+      }
+    } catch (error) {
+      console.error("Failed to fetch older alerts:", error);
+    }
+  };
 
   const acknowledgeAlert = async (id: string) => {
     try {
       await endpoints.acknowledgeAlert(id);
-      setAlerts(prev => prev.map(alert =>
-        alert.id === id ? { ...alert, acknowledged: true } : alert
-      ));
+      const acknowledged = [...activeAlerts, ...olderAlerts].find(alert => alert.id === id);
+      setActiveAlerts(prev => prev.filter(alert => alert.id !== id));
+      setOlderAlerts(prev => prev.filter(alert => alert.id !== id));
+      setUnreadCount(prev => Math.max(prev - 1, 0));
+      if (acknowledged) {
+        setHistory(prev => [{ ...acknowledged, acknowledged: true }, ...prev].slice(0, 5));
+      }
     } catch (error) {
       console.error("Failed to acknowledge alert:", error);
     }
   };
 
+  const activeIds = new Set(activeAlerts.map(alert => alert.id));
+  const unreadAlerts = [...activeAlerts, ...olderAlerts.filter(alert => !activeIds.has(alert.id))];
+
   const getAlertIcon = (type: string) => {
     switch (type) {
       case 'critical':
@@ -107,7 +140,7 @@ export default function Alerts() {
           <p className="text-muted-foreground">Monitor and manage your energy system alerts</p>
         </div>
         <Badge variant="destructive" className="text-sm self-start sm:self-auto">
-          {alerts.filter(alert => !alert.acknowledged).length} Active
+          {unreadCount} Active
         </Badge>
       </div>
 
@@ -121,13 +154,13 @@ export default function Alerts() {
           <CardDescription>Recent alerts requiring your attention</CardDescription>
         </CardHeader>
         <CardContent className="space-y-4">
-          {alerts.filter(alert => !alert.acknowledged).length === 0 ? (
+          {unreadAlerts.length === 0 ? (
             <div className="text-center py-8 text-muted-foreground">
               <CheckCircle className="h-12 w-12 mx-auto mb-4 text-green-600" />
               <p>No active alerts. Your system is running normally.</p>
             </div>
           ) : (
-            alerts.filter(alert => !alert.acknowledged).map((alert) => (
+            unreadAlerts.map((alert) => (
               <Alert key={alert.id} className="border-l-4 border-l-red-500">
                 <div className="flex items-start justify-between">
                   <div className="flex items-start space-x-3">
@@ -158,6 +191,11 @@ export default function Alerts() {
               </Alert>
             ))
           )}
+          {nextCursor && (
+            <Button variant="outline" className="w-full" onClick={loadOlderAlerts}>
+              Load older alerts
+            </Button>
+          )}
         </CardContent>
       </Card>
 
@@ -169,25 +207,21 @@ export default function Alerts() {
         </CardHeader>
         <CardContent>
           <div className="space-y-3">
-            {alerts
-              .filter(alert => alert.acknowledged)
-              .sort((a, b) => new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime())
-              .slice(0, 5)
-              .map((alert) => (
-                <div key={alert.id} className="flex items-center space-x-3 p-3 bg-muted/50 rounded-lg">
-                  {getAlertIcon(alert.type)}
-                  <div className="flex-1">
-                    <div className="flex items-center space-x-2">
-                      <span className="font-medium text-sm">{alert.title}</span>
-                      <Badge variant="secondary" className="text-xs">Acknowledged</Badge>
-                    </div>
-                    <p className="text-xs text-muted-foreground">{alert.message}</p>
-                    <p className="text-xs text-muted-foreground">
-                      {new Date(alert.timestamp).toLocaleString()}
-                    </p>
+            {history.map((alert) => (
+              <div key={alert.id} className="flex items-center space-x-3 p-3 bg-muted/50 rounded-lg">
+                {getAlertIcon(alert.type)}
+                <div className="flex-1">
+                  <div className="flex items-center space-x-2">
+                    <span className="font-medium text-sm">{alert.title}</span>
+                    <Badge variant="secondary" className="text-xs">Acknowledged</Badge>
                   </div>
+                  <p className="text-xs text-muted-foreground">{alert.message}</p>
+                  <p className="text-xs text-muted-foreground">
+                    {new Date(alert.timestamp).toLocaleString()}
+                  </p>
                 </div>
-              ))}
+              </div>
+            ))}
           </div>
         </CardContent>
       </Card>
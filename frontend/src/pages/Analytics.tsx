@@ -13,34 +13,52 @@ import { endpoints } from '@/services/api';
 import { useAuth } from '@/contexts/AuthContext';
 
 type MeterSample = { irms: number; vrms: number; power: number; energy: number; ts: Date };
+type EnergyBucket = { bucket: string; devices: Record<string, number>; total_kwh: number };
+
+const DEVICE_COLORS: Record<string, string> = {
+  '12W Bulb': '#8884d8', '15W Bulb': '#82ca9d', '7W Bulb': '#ffc658', Other: '#ff7300'
+};
+
+// Bucket keys of the backend rollups are local 'YYYY-MM-DD'
+const toDayKey = (d: Date) =>
+  `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+
+const rangeStart = (timeRange: string, dateRange?: DateRange): Date => {
+  const now = new Date();
+  if (timeRange === 'custom' && dateRange?.from) return dateRange.from;
+  if (timeRange === 'today') return now;
+  if (timeRange === 'month') return new Date(now.getFullYear(), now.getMonth(), 1);
+  return new Date(now.getFullYear(), now.getMonth(), now.getDate() - 6);
+};
 
 export default function Analytics() {
   const { currentUser } = useAuth();
   const [timeRange, setTimeRange] = useState('week');
   const [dateRange, setDateRange] = useState<DateRange | undefined>();
-  const [samples, setSamples] = useState<MeterSample[]>([]);
+  const [latest, setLatest] = useState<MeterSample | null>(null);
+  const [dailyBuckets, setDailyBuckets] = useState<EnergyBucket[]>([]);
+  const [hourlyBuckets, setHourlyBuckets] = useState<EnergyBucket[]>([]);
   const [predictedValue, setPredictedValue] = useState<number | null>(null);
   const [predictionLoading, setPredictionLoading] = useState(false);
 
   const fetchPrediction = async () => {
-    if (samples.length === 0) return;
+    if (!latest) return;
     setPredictionLoading(true);
     try {
-      const lastSample = samples[samples.length - 1];
-      const hour = lastSample.ts.getHours();
+      const hour = latest.ts.getHours();
       const isDaytime = hour >= 6 && hour < 18 ? 1 : 0;
       // Features: ['Power', 'Vrms', 'Irms', 'PF', 'hour', 'is_daytime']
-      const pf = lastSample.power / (lastSample.vrms * lastSample.irms) || 1.0;
+      const pf = latest.power / (latest.vrms * latest.irms) || 1.0;
       const features = [
-        lastSample.power,
-        lastSample.vrms,
-        lastSample.irms,
+        latest.power,
+        latest.vrms,
+        latest.irms,
         pf,
         hour,
         isDaytime
       ];
 
-      const response = await endpoints.predictEnergy(features);
+      const response = await endpoints.predictEnergy(features, currentUser?.uid);
       if (response.data && response.data.predicted_energy !== undefined) {
         setPredictedValue(response.data.predicted_energy);
       }
@@ -51,94 +69,92 @@ export default function Analytics() {
     }
   };
 
+  // Only the latest reading is streamed (forecast features); usage comes from the server rollups
   useEffect(() => {
     if (!currentUser?.uid) return;
 
     const dataRef = ref(database, `SmartMeter/users/${currentUser.uid}/data`);
-    const q = query(dataRef, orderByKey(), limitToLast(1000));
+    const q = query(dataRef, orderByKey(), limitToLast(1));
     const unsub = onValue(q, (snapshot) => {
       const val = snapshot.val() as Record<string, any> | null;
-      if (!val) return setSamples([]);
-      const list = Object.entries(val).map(([timestamp, v]) => {
-        const irms = parseFloat(v?.Irms ?? '0');
-        const vrms = parseFloat(v?.Vrms ?? '0');
-        const power = parseFloat(v?.Power ?? '0');
-        const energy = parseFloat(v?.kWh ?? '0');
-
-        // Parse timestamp format: 2025-10-11_12-45-10
-        let ts: Date;
-        try {
-          // Convert 2026-01-31_13:01:36_443 to 2026-01-31T13:01:36.443
-          const parts = timestamp.split('_');
-          if (parts.length >= 2) {
-            const datePart = parts[0];
-            const timePart = parts[1];
-            const msPart = parts[2] || '000';
-            const isoString = `${datePart}T${timePart}.${msPart}`;
-            ts = new Date(isoString);
-          } else {
-            ts = new Date();
-          }
-
-          // If invalid date, use current time
-          if (isNaN(ts.getTime())) {
-            ts = new Date();
-          }
-        } catch {
-          ts = new Date();
-        }
-
-        return {
-          irms: Number.isFinite(irms) ? irms : 0,
-          vrms: Number.isFinite(vrms) ? vrms : 0,
-          power: Number.isFinite(power) ? power : 0,
-          energy: Number.isFinite(energy) ? energy : 0,
-          ts,
-        } as MeterSample;
-      }).sort((a, b) => a.ts.getTime() - b.ts.getTime());
-      setSamples(list);
+      if (!val) return setLatest(null);
+      const [timestamp, v] = Object.entries(val)[0];
+      const irms = parseFloat(v?.Irms ?? '0');
+      const vrms = parseFloat(v?.Vrms ?? '0');
+      const power = parseFloat(v?.Power ?? '0');
+      const energy = parseFloat(v?.kWh ?? '0');
+
+      // Convert 2026-01-31_13:01:36_443 to 2026-01-31T13:01:36.443
+      const parts = timestamp.split('_');
+      let ts = parts.length >= 2 ? new Date(`${parts[0]}T${parts[1]}.${parts[2] || '000'}`) : new Date();
+      if (isNaN(ts.getTime())) ts = new Date();
+
+      setLatest({
+        irms: Number.isFinite(irms) ? irms : 0,
+        vrms: Number.isFinite(vrms) ? vrms : 0,
+        power: Number.isFinite(power) ? power : 0,
+        energy: Number.isFinite(energy) ? energy : 0,
+        ts,
+      });
     });
     return () => unsub();
   }, [currentUser?.uid]);
 
-  const dailyData = useMemo(() => {
-    const byDay = new Map<string, { min: number; max: number }>();
-    for (const s of samples) {
-      const key = s.ts.toISOString().slice(0, 10);
-      const current = byDay.get(key);
-      if (!current) {
-        byDay.set(key, { min: s.energy, max: s.energy });
-      } else {
-        byDay.set(key, { min: Math.min(current.min, s.energy), max: Math.max(current.max, s.energy) });
+  useEffect(() => {
+    if (!currentUser?.uid) return;
+    const start = toDayKey(rangeStart(timeRange, dateRange));
+    const end = timeRange === 'custom' && dateRange?.to ? toDayKey(dateRange.to) : undefined;
+
+    const fetchUsage = async () => {
+      try {
+        const [daily, hourly] = await Promise.all([
+          endpoints.getEnergyUsage(currentUser.uid, { period: 'day', start, end }),
+          endpoints.getEnergyUsage(currentUser.uid, { period: 'hour', start, end }),
+        ]);
+        setDailyBuckets(daily.data.buckets);
+        setHourlyBuckets(hourly.data.buckets);
+      } catch (error) {
+        console.error("Failed to fetch energy usage:", error);
       }
-    }
-    return Array.from(byDay.entries()).map(([date, { min, max }]) => {
-      const energy = max - min;
-      return { date, energy, cost: energy * 8 };
-    });
-  }, [samples]);
+    };
+
+    fetchUsage();
+    const interval = setInterval(fetchUsage, 60000);
+    return () => clearInterval(interval);
+  }, [currentUser?.uid, timeRange, dateRange]);
+
+  const dailyData = useMemo(
+    () => dailyBuckets.map((b) => ({ date: b.bucket, energy: b.total_kwh, cost: b.total_kwh * 8 })),
+    [dailyBuckets]
+  );
+
+  const totalEnergy = useMemo(() => dailyData.reduce((a, b) => a + b.energy, 0), [dailyData]);
 
+  // Mean kWh per hour of day over the range (kWh in one hour = average kW)
   const hourlyPattern = useMemo(() => {
-    const byHour = new Map<string, number>();
-    for (const s of samples) {
-      const hh = s.ts.toTimeString().slice(0, 5);
-      byHour.set(hh, (byHour.get(hh) ?? 0) + s.power / 1000);
+    const byHour = new Map<string, { sum: number; count: number }>();
+    for (const b of hourlyBuckets) {
+      const hh = `${b.bucket.slice(11, 13)}:00`;
+      const current = byHour.get(hh) ?? { sum: 0, count: 0 };
+      byHour.set(hh, { sum: current.sum + b.total_kwh, count: current.count + 1 });
     }
-    return Array.from(byHour.entries()).map(([hour, usage]) => ({ hour, usage }));
-  }, [samples]);
+    return Array.from(byHour.entries())
+      .sort(([a], [b]) => a.localeCompare(b))
+      .map(([hour, { sum, count }]) => ({ hour, usage: sum / count }));
+  }, [hourlyBuckets]);
 
   const usageBreakdown = useMemo(() => {
-    const totals = { Lighting: 0, HVAC: 0, Appliances: 0, Electronics: 0, Others: 0 } as Record<string, number>;
-    for (const s of samples) {
-      const p = s.power;
-      if (p < 500) totals.Lighting += p; else if (p < 1500) totals.Electronics += p; else if (p < 2500) totals.Appliances += p; else totals.HVAC += p;
+    const totals: Record<string, number> = {};
+    for (const b of dailyBuckets) {
+      for (const [device, kwh] of Object.entries(b.devices)) {
+        totals[device] = (totals[device] ?? 0) + kwh;
+      }
     }
     const total = Object.values(totals).reduce((a, b) => a + b, 0) || 1;
-    const colors = { Lighting: '#8884d8', HVAC: '#82ca9d', Appliances: '#ffc658', Electronics: '#ff7300', Others: '#00ff00' } as Record<string, string>;
     return Object.entries(totals)
-      .map(([name, value]) => ({ name, value: Math.round((value / total) * 100), color: colors[name] }))
+      .map(([name, value]) => ({ name, value: Math.round((value / total) * 100), color: DEVICE_COLORS[name] ?? '#00ff00' }))
       .filter((item) => item.value > 0);
-  }, [samples]);
+  }, [dailyBuckets]);
 
   const handleExport = (format: 'csv' | 'pdf') => {
     // Simulate export functionality
@@ -189,9 +205,7 @@ export default function Analytics() {
           </CardHeader>
           <CardContent>
             <div className="text-2xl font-bold">
-              {samples.length > 0
-                ? (samples[samples.length - 1].energy - samples[0].energy).toFixed(3)
-                : "0.000"} kWh
+              {totalEnergy.toFixed(3)} kWh
             </div>
             <p className="text-xs text-muted-foreground">
               <span className="text-green-600">+12.5%</span> from last week
@@ -206,8 +220,8 @@ export default function Analytics() {
           </CardHeader>
           <CardContent>
             <div className="text-2xl font-bold">
-              {dailyData.length && samples.length > 0
-                ? ((samples[samples.length - 1].energy - samples[0].energy) / dailyData.length).toFixed(3)
+              {dailyData.length > 0
+                ? (totalEnergy / dailyData.length).toFixed(3)
                 : "0.000"} kWh
             </div>
             <p className="text-xs text-muted-foreground">
@@ -281,7 +295,7 @@ export default function Analytics() {
         <Card>
           <CardHeader>
             <CardTitle>Usage Breakdown</CardTitle>
-            <CardDescription>Energy consumption by category</CardDescription>
+            <CardDescription>Energy consumption by device</CardDescription>
           </CardHeader>
           <CardContent>
             <ResponsiveContainer width="100%" height={300}>
@@ -338,11 +352,11 @@ export default function Analytics() {
               <span className="text-3xl font-bold">
                 {predictionLoading ? "Calculating..." :
                   predictedValue !== null ? predictedValue.toFixed(3) :
-                    samples.length > 0 ? (samples[samples.length - 1].energy * 1.05).toFixed(3) : "Loading..."}
+                    latest ? (latest.energy * 1.05).toFixed(3) : "Loading..."}
               </span>
               <span className="text-sm text-muted-foreground">kWh predicted for tomorrow</span>
             </div>
-            {predictedValue === null && !predictionLoading && samples.length > 0 && (
+            {predictedValue === null && !predictionLoading && latest && (
               <Button
                 variant="outline"
                 size="sm"
@@ -9,6 +9,23 @@ const api = axios.create({
     },
 });
 
+// Last ETag per GET url + params, sent back as If-None-Match
+const etags = new Map<string, string>();
+
+// Conditional GET: resolves to null while the server reports the resource unchanged (304)
+const getIfChanged = async <T = any>(url: string, params?: object): Promise<T | null> => {
+    const key = `${url}?${JSON.stringify(params ?? {})}`;
+    const etag = etags.get(key);
+    const response = await api.get<T>(url, {
+        params,
+        headers: etag ? { 'If-None-Match': etag } : undefined,
+        validateStatus: (status) => status === 200 || status === 304,
+    });
+    if (response.status === 304) return null;
+    if (response.headers.etag) etags.set(key, response.headers.etag);
+    return response.data;
+};
+
 export interface Alert {
     id: string;
     message: string;
@@ -18,6 +35,11 @@ export interface Alert {
     title?: string; // For frontend compatibility if needed, or map it
 }
 
+export interface AlertPage {
+    alerts: Record<string, Omit<Alert, 'id'>>;
+    next_cursor: string | null;
+}
+
 export interface Device {
     id: string;
     name: string;
@@ -31,14 +53,19 @@ export interface Device {
 }
 
 export const endpoints = {
-    predictEnergy: (features: number[]) => api.post('/predict/energy', { features }),
+    predictEnergy: (features: number[], userId?: string) => api.post('/predict/energy', { features, user_id: userId }),
     identifyDevice: (powerReadings: number[]) => api.post('/identify/device', { power_readings: powerReadings }),
-    getAlerts: () => api.get('/alerts'),
+    // Both resolve to null when nothing changed since the last call with the same params
+    getAlerts: (params?: { limit?: number; before?: string; unread?: boolean; severity?: Alert['severity'] }) =>
+        getIfChanged<AlertPage>('/alerts', params),
+    getUnreadAlertCount: () => getIfChanged<{ unread: number }>('/alerts/unread-count'),
     createAlert: (alert: Omit<Alert, 'id'>) => api.post('/alerts', alert),
     acknowledgeAlert: (alertId: string) => api.put(`/alerts/${alertId}/acknowledge`),
-    getDevices: () => api.get('/devices'),
+    getDevices: (params?: { limit?: number; after?: string }) => api.get('/devices', { params }),
     triggerIdentification: (userId?: string) => api.post('/trigger-identification', null, { params: { user_id: userId } }),
     detectAnomaly: (userId?: string) => api.post('/detect-anomaly', null, { params: { user_id: userId } }),
+    getEnergyUsage: (userId: string, params?: { period?: 'hour' | 'day' | 'month'; start?: string; end?: string; device?: string }) =>
+        api.get(`/energy/${userId}`, { params }),
 };
 
 export default api;